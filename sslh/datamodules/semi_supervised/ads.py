@@ -1,13 +1,16 @@
 
+import functools
 import os.path as osp
 
 from pytorch_lightning import LightningDataModule
 from torch.utils.data.dataloader import DataLoader
-from typing import Callable, Optional, Tuple
+from torch.utils.data.sampler import BatchSampler, Sampler, SequentialSampler
+from typing import Any, Callable, Optional, Tuple
 
 from mlu.datasets.samplers import SubsetCycleSampler
 from mlu.datasets.wrappers import TransformDataset, NoLabelDataset
-from sslh.datasets.ads import SingleBalancedSampler, class_balance_split, SingleAudioset
+from sslh.datamodules.utils import FeatureCache, apply_batch_transform, get_dataset_fingerprint, load_or_compute_split
+from sslh.datasets.ads import BatchTransformDataset, SingleBalancedSampler, class_balance_split, SingleAudioset
 
 
 N_CLASSES = 527
@@ -35,6 +38,13 @@ class ADSDataModuleSSL(LightningDataModule):
 		train_subset: str = 'unbalanced',
 		sampler_s_balanced: bool = True,
 		pre_computed_specs: bool = False,
+		fetch_batches: bool = False,
+		backend: str = 'hdf',
+		split_seed: Optional[int] = None,
+		split_cache_dir: Optional[str] = None,
+		batch_transform: Optional[Callable] = None,
+		feature_cache: str = 'none',
+		feature_cache_dir: Optional[str] = None,
 	):
 		"""
 			LightningDataModule of AudioSet (ADS) for semi-supervised trainings.
@@ -63,6 +73,24 @@ class ADSDataModuleSSL(LightningDataModule):
 				(default: 'unbalanced')
 			:param sampler_s_balanced: If True, use a sampler that balance classes for labeled data.
 				Otherwise use a standard SubsetRandomSampler.
+			:param pre_computed_specs: If True, read the pre-computed spectrograms instead of the raw waveforms.
+				(default: False)
+			:param fetch_batches: If True, each dataloader worker call reads a complete batch with one HDF read per file
+				instead of one read per sample.
+				(default: False)
+			:param backend: The storage read by the datasets.
+				Can be 'hdf' (HDF files) or 'memmap' (flat arrays built by sslh.datasets.ads_memmap.convert_hdf_to_memmap).
+				(default: 'hdf')
+			:param split_seed: The seed used to compute the supervised and unsupervised split.
+				If None, the split depends on the current random states and is not cached. (default: None)
+			:param split_cache_dir: The directory where the splits are saved and reused across runs.
+				If None, the split is computed at each setup. (default: None)
+			:param batch_transform: The optional transform applied to the batches on the training device, e.g. the
+				spectrograms computation when the data transforms only pad the waveforms. (default: None)
+			:param feature_cache: The storage of the validation and test items when their transform is deterministic,
+				'none', 'memory' or 'memmap'. (default: 'none')
+			:param feature_cache_dir: The directory of the memmap files of the cache.
+				If None, use the temporary directory. (default: None)
 		"""
 		if train_subset not in ('balanced', 'unbalanced'):
 			raise ValueError(f'Train subsets available are {("balanced", "unbalanced")}.')
@@ -74,6 +102,8 @@ class ADSDataModuleSSL(LightningDataModule):
 		self.transform_val = transform_val
 		self.transform_test = transform_val
 		self.target_transform = target_transform
+		self.batch_transform = batch_transform
+		self.feature_cache = FeatureCache(feature_cache, feature_cache_dir)
 		self.bsize_train_s = bsize_train_s
 		self.bsize_train_u = bsize_train_u
 		self.bsize_val = bsize_train_s + bsize_train_u
@@ -84,11 +114,15 @@ class ADSDataModuleSSL(LightningDataModule):
 		self.pin_memory = pin_memory
 		self.ratio_s = ratio_s
 		self.ratio_u = ratio_u
+		self.split_seed = split_seed
+		self.split_cache_dir = split_cache_dir
 		self.duplicate_loader_s = duplicate_loader_s
 
 		self.n_train_steps = n_train_steps
 		self.train_subset = train_subset
 		self.sampler_s_balanced = sampler_s_balanced
+		self.fetch_batches = fetch_batches
+		self.backend = backend
 
 		self.train_dataset_raw = None
 		self.val_dataset_raw = None
@@ -99,6 +133,8 @@ class ADSDataModuleSSL(LightningDataModule):
 		self.example_input_array = None
 
 		self.rdcc_nbytes = 512 * 1024 ** 2
+		# Total HDF chunk cache budget shared by the workers of a dataloader
+		self.rdcc_total_nbytes = 2 * 1024 ** 3
 		if pre_computed_specs:
 			self.data_shape = (64, 500)
 			self.data_key = 'data'
@@ -117,6 +153,8 @@ class ADSDataModuleSSL(LightningDataModule):
 				root=self.root,
 				transform=None,
 				rdcc_nbytes=self.rdcc_nbytes,
+				rdcc_total_nbytes=self.rdcc_total_nbytes,
+				backend=self.backend,
 				data_shape=self.data_shape,
 				data_key=self.data_key,
 			)
@@ -124,7 +162,23 @@ class ADSDataModuleSSL(LightningDataModule):
 			self.val_dataset_raw = SingleAudioset(version='eval', **dataset_params)
 
 			# Setup split
-			indexes_s, indexes_u = class_balance_split(self.train_dataset_raw, self.ratio_s, self.ratio_u, verbose=False)
+			split_fn = functools.partial(
+				class_balance_split,
+				self.train_dataset_raw,
+				self.ratio_s,
+				self.ratio_u,
+				verbose=False,
+				seed=self.split_seed,
+			)
+			indexes_s, indexes_u = load_or_compute_split(
+				split_fn=split_fn,
+				cache_dir=self.split_cache_dir,
+				fingerprint=get_dataset_fingerprint(self.train_dataset_raw, self.root),
+				subset=self.train_subset,
+				ratio_s=self.ratio_s,
+				ratio_u=self.ratio_u,
+				seed=self.split_seed,
+			)
 
 			if self.n_train_steps is None:
 				n_train_samples_s = len(indexes_s)
@@ -142,6 +196,8 @@ class ADSDataModuleSSL(LightningDataModule):
 
 			dataloader = self.val_dataloader()
 			xs, ys = next(iter(dataloader))
+			if self.batch_transform is not None:
+				xs = self.batch_transform(xs)
 			self.example_input_array = xs
 			self.dims = tuple(xs.shape)
 
@@ -149,6 +205,17 @@ class ADSDataModuleSSL(LightningDataModule):
 			self.test_dataset_raw = None
 
 	def train_dataloader(self) -> Tuple[DataLoader, ...]:
+		if self.fetch_batches:
+			loader_s = self._batch_dataloader(
+				self.transform_train_s, True, self.sampler_s, self.bsize_train_s, self.n_workers_s, self.drop_last)
+			loader_u = self._batch_dataloader(
+				self.transform_train_u, False, self.sampler_u, self.bsize_train_u, self.n_workers_u, self.drop_last)
+
+			if not self.duplicate_loader_s:
+				return loader_s, loader_u
+			else:
+				return loader_s, loader_s, loader_u
+
 		# Wrap the datasets for apply transform on data and targets
 		train_dataset_s = TransformDataset(self.train_dataset_raw, self.transform_train_s, index=0)
 		train_dataset_s = TransformDataset(train_dataset_s, self.target_transform, index=1)
@@ -185,14 +252,19 @@ class ADSDataModuleSSL(LightningDataModule):
 		if val_dataset is None:
 			return None
 
-		val_dataset = TransformDataset(val_dataset, self.transform_val, index=0)
-		val_dataset = TransformDataset(val_dataset, self.target_transform, index=1)
+		if self.fetch_batches and not self.feature_cache.can_cache(self.transform_val):
+			return self._batch_dataloader(
+				self.transform_val, True, SequentialSampler(val_dataset), self.bsize_val,
+				self.n_workers_s + self.n_workers_u, False, val_dataset,
+			)
 
-		loader = DataLoader(
-			dataset=val_dataset,
+		loader = self.feature_cache.get_dataloader(
+			name='val',
+			dataset_raw=val_dataset,
+			transform=self.transform_val,
+			target_transform=self.target_transform,
 			batch_size=self.bsize_val,
 			num_workers=self.n_workers_s + self.n_workers_u,
-			drop_last=False,
 		)
 		return loader
 
@@ -201,13 +273,47 @@ class ADSDataModuleSSL(LightningDataModule):
 		if test_dataset is None:
 			return None
 
-		test_dataset = TransformDataset(test_dataset, self.transform_test, index=0)
-		test_dataset = TransformDataset(test_dataset, self.target_transform, index=1)
+		if self.fetch_batches and not self.feature_cache.can_cache(self.transform_test):
+			return self._batch_dataloader(
+				self.transform_test, True, SequentialSampler(test_dataset), self.bsize_test,
+				self.n_workers_s + self.n_workers_u, False, test_dataset,
+			)
 
-		loader = DataLoader(
-			dataset=test_dataset,
+		loader = self.feature_cache.get_dataloader(
+			name='test',
+			dataset_raw=test_dataset,
+			transform=self.transform_test,
+			target_transform=self.target_transform,
 			batch_size=self.bsize_test,
 			num_workers=self.n_workers_s + self.n_workers_u,
-			drop_last=False,
+		)
+		return loader
+
+	def on_after_batch_transfer(self, batch: Any) -> Any:
+		if self.batch_transform is not None:
+			batch = apply_batch_transform(self.batch_transform, batch)
+		return batch
+
+	def _batch_dataloader(
+		self,
+		transform: Optional[Callable],
+		with_target: bool,
+		sampler: Sampler,
+		bsize: int,
+		n_workers: int,
+		drop_last: bool,
+		dataset: Optional[SingleAudioset] = None,
+	) -> DataLoader:
+		if dataset is None:
+			dataset = self.train_dataset_raw
+
+		# The batch sampler is given as sampler, so each worker call receive the indexes of a complete batch
+		dataset = BatchTransformDataset(dataset, transform, self.target_transform, with_target)
+		loader = DataLoader(
+			dataset=dataset,
+			batch_size=None,
+			num_workers=n_workers,
+			sampler=BatchSampler(sampler, bsize, drop_last),
+			pin_memory=self.pin_memory,
 		)
 		return loader
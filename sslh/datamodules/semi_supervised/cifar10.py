@@ -1,12 +1,15 @@
 
+import functools
+
 from pytorch_lightning import LightningDataModule
 from torch.utils.data.dataloader import DataLoader
 from torch.utils.data.sampler import SubsetRandomSampler
 from torchvision.datasets import CIFAR10
 from typing import Callable, Optional, Tuple
 
-from mlu.datasets.split.monolabel import balanced_split
 from mlu.datasets.wrappers import TransformDataset, NoLabelDataset
+from sslh.datamodules.utils import get_dataset_fingerprint, load_or_compute_split
+from sslh.datasets.utils import balanced_split_from_targets
 
 
 N_CLASSES = 10
@@ -30,6 +33,8 @@ class CIFAR10DataModuleSSL(LightningDataModule):
 		ratio_u: float = 0.9,
 		duplicate_loader_s: bool = False,
 		download_dataset: bool = True,
+		split_seed: Optional[int] = None,
+		split_cache_dir: Optional[str] = None,
 	):
 		"""
 			LightningDataModule of CIFAR-10 for semi-supervised trainings.
@@ -51,6 +56,10 @@ class CIFAR10DataModuleSSL(LightningDataModule):
 			:param ratio_u: The ratio of the unsupervised subset len in [0, 1]. (default: 0.9)
 			:param duplicate_loader_s: If True, duplicate the supervised dataloader for DCT training. (default: False)
 			:param download_dataset: If True, automatically download the dataset in the root directory. (default: True)
+			:param split_seed: The seed used to compute the supervised and unsupervised split.
+				If None, the split depends on the current random states and is not cached. (default: None)
+			:param split_cache_dir: The directory where the splits are saved and reused across runs.
+				If None, the split is computed at each setup. (default: None)
 		"""
 		super().__init__()
 		self.root = root
@@ -69,6 +78,8 @@ class CIFAR10DataModuleSSL(LightningDataModule):
 		self.pin_memory = pin_memory
 		self.ratio_s = ratio_s
 		self.ratio_u = ratio_u
+		self.split_seed = split_seed
+		self.split_cache_dir = split_cache_dir
 		self.duplicate_loader_s = duplicate_loader_s
 
 		self.download_dataset = download_dataset
@@ -93,11 +104,20 @@ class CIFAR10DataModuleSSL(LightningDataModule):
 
 			# Setup split
 			ratios = [self.ratio_s, self.ratio_u]
-			indexes_s, indexes_u = balanced_split(
-				dataset=self.train_dataset_raw,
+			split_fn = functools.partial(
+				balanced_split_from_targets,
+				targets=self.train_dataset_raw.targets,
 				n_classes=N_CLASSES,
 				ratios=ratios,
-				target_one_hot=False,
+			)
+			indexes_s, indexes_u = load_or_compute_split(
+				split_fn=split_fn,
+				cache_dir=self.split_cache_dir,
+				fingerprint=get_dataset_fingerprint(self.train_dataset_raw, self.root),
+				subset='train',
+				ratio_s=self.ratio_s,
+				ratio_u=self.ratio_u,
+				seed=self.split_seed,
 			)
 			self.sampler_s = SubsetRandomSampler(indexes_s)
 			self.sampler_u = SubsetRandomSampler(indexes_u)
@@ -1,13 +1,15 @@
 
+import functools
+
 from pytorch_lightning import LightningDataModule
 from torch.utils.data.dataloader import DataLoader
 from torch.utils.data.sampler import SubsetRandomSampler
-from typing import Callable, List, Optional, Tuple
+from typing import Any, Callable, List, Optional, Tuple
 
-from mlu.datasets.split.monolabel import balanced_split
 from mlu.datasets.wrappers import TransformDataset, NoLabelDataset
-from sslh.datamodules.utils import guess_folds
+from sslh.datamodules.utils import FeatureCache, apply_batch_transform, get_dataset_fingerprint, get_train_dataloader, guess_folds, load_or_compute_split
 from sslh.datasets.esc10 import ESC10
+from sslh.datasets.utils import balanced_split_from_targets
 
 
 N_CLASSES = 10
@@ -34,6 +36,13 @@ class ESC10DataModuleSSL(LightningDataModule):
 		download_dataset: bool = True,
 		folds_train: Optional[List[int]] = None,
 		folds_val: Optional[List[int]] = None,
+		split_seed: Optional[int] = None,
+		split_cache_dir: Optional[str] = None,
+		prefetch_depth: int = 0,
+		prefetch_max_nbytes: int = 256 * 1024 ** 2,
+		batch_transform: Optional[Callable] = None,
+		feature_cache: str = 'none',
+		feature_cache_dir: Optional[str] = None,
 	):
 		"""
 			LightningDataModule of ESC-10 for semi-supervised trainings.
@@ -65,6 +74,19 @@ class ESC10DataModuleSSL(LightningDataModule):
 				If both folds_train and folds_val are None, then the default folds are used:
 					[1, 2, 3, 4] for folds_train and [5] for folds_val.
 				(default: None)
+			:param split_seed: The seed used to compute the supervised and unsupervised split.
+				If None, the split depends on the current random states and is not cached. (default: None)
+			:param split_cache_dir: The directory where the splits are saved and reused across runs.
+				If None, the split is computed at each setup. (default: None)
+			:param prefetch_depth: The number of train items loaded in advance by a thread pool in each worker.
+				If 0, the items are loaded without prefetch. (default: 0)
+			:param prefetch_max_nbytes: The maximal size of the train items prefetched by each worker. (default: 256 MiB)
+			:param batch_transform: The optional transform applied to the batches on the training device, e.g. the
+				spectrograms computation when the data transforms only pad the waveforms. (default: None)
+			:param feature_cache: The storage of the validation and test items when their transform is deterministic,
+				'none', 'memory' or 'memmap'. (default: 'none')
+			:param feature_cache_dir: The directory of the memmap files of the cache.
+				If None, use the temporary directory. (default: None)
 		"""
 		super().__init__()
 		self.root = root
@@ -73,6 +95,8 @@ class ESC10DataModuleSSL(LightningDataModule):
 		self.transform_val = transform_val
 		self.transform_test = transform_val
 		self.target_transform = target_transform
+		self.batch_transform = batch_transform
+		self.feature_cache = FeatureCache(feature_cache, feature_cache_dir)
 		self.bsize_train_s = bsize_train_s
 		self.bsize_train_u = bsize_train_u
 		self.bsize_val = bsize_train_s + bsize_train_u
@@ -81,8 +105,12 @@ class ESC10DataModuleSSL(LightningDataModule):
 		self.n_workers_u = n_workers_u
 		self.drop_last = drop_last
 		self.pin_memory = pin_memory
+		self.prefetch_depth = prefetch_depth
+		self.prefetch_max_nbytes = prefetch_max_nbytes
 		self.ratio_s = ratio_s
 		self.ratio_u = ratio_u
+		self.split_seed = split_seed
+		self.split_cache_dir = split_cache_dir
 		self.duplicate_loader_s = duplicate_loader_s
 
 		self.download_dataset = download_dataset
@@ -107,17 +135,28 @@ class ESC10DataModuleSSL(LightningDataModule):
 
 			# Setup split
 			ratios = [self.ratio_s, self.ratio_u]
-			indexes_s, indexes_u = balanced_split(
-				dataset=self.train_dataset_raw,
+			split_fn = functools.partial(
+				balanced_split_from_targets,
+				targets=self.train_dataset_raw.targets,
 				n_classes=N_CLASSES,
 				ratios=ratios,
-				target_one_hot=False,
+			)
+			indexes_s, indexes_u = load_or_compute_split(
+				split_fn=split_fn,
+				cache_dir=self.split_cache_dir,
+				fingerprint=get_dataset_fingerprint(self.train_dataset_raw, self.root),
+				subset='folds_' + '_'.join(map(str, self.folds_train)),
+				ratio_s=self.ratio_s,
+				ratio_u=self.ratio_u,
+				seed=self.split_seed,
 			)
 			self.sampler_s = SubsetRandomSampler(indexes_s)
 			self.sampler_u = SubsetRandomSampler(indexes_u)
 
 			dataloader = self.val_dataloader()
 			xs, ys = next(iter(dataloader))
+			if self.batch_transform is not None:
+				xs = self.batch_transform(xs)
 			self.example_input_array = xs
 			self.dims = tuple(xs.shape)
 
@@ -131,21 +170,25 @@ class ESC10DataModuleSSL(LightningDataModule):
 		train_dataset_u = TransformDataset(self.train_dataset_raw, self.transform_train_u, index=0)
 		train_dataset_u = NoLabelDataset(train_dataset_u)
 
-		loader_s = DataLoader(
+		loader_s = get_train_dataloader(
 			dataset=train_dataset_s,
 			batch_size=self.bsize_train_s,
 			num_workers=self.n_workers_s,
 			sampler=self.sampler_s,
 			drop_last=self.drop_last,
 			pin_memory=self.pin_memory,
+			prefetch_depth=self.prefetch_depth,
+			prefetch_max_nbytes=self.prefetch_max_nbytes,
 		)
-		loader_u = DataLoader(
+		loader_u = get_train_dataloader(
 			dataset=train_dataset_u,
 			batch_size=self.bsize_train_u,
 			num_workers=self.n_workers_u,
 			sampler=self.sampler_u,
 			drop_last=self.drop_last,
 			pin_memory=self.pin_memory,
+			prefetch_depth=self.prefetch_depth,
+			prefetch_max_nbytes=self.prefetch_max_nbytes,
 		)
 
 		if not self.duplicate_loader_s:
@@ -160,14 +203,13 @@ class ESC10DataModuleSSL(LightningDataModule):
 		if val_dataset is None:
 			return None
 
-		val_dataset = TransformDataset(val_dataset, self.transform_val, index=0)
-		val_dataset = TransformDataset(val_dataset, self.target_transform, index=1)
-
-		loader = DataLoader(
-			dataset=val_dataset,
+		loader = self.feature_cache.get_dataloader(
+			name='val',
+			dataset_raw=val_dataset,
+			transform=self.transform_val,
+			target_transform=self.target_transform,
 			batch_size=self.bsize_val,
 			num_workers=self.n_workers_s + self.n_workers_u,
-			drop_last=False,
 		)
 		return loader
 
@@ -176,13 +218,17 @@ class ESC10DataModuleSSL(LightningDataModule):
 		if test_dataset is None:
 			return None
 
-		test_dataset = TransformDataset(test_dataset, self.transform_test, index=0)
-		test_dataset = TransformDataset(test_dataset, self.target_transform, index=1)
-
-		loader = DataLoader(
-			dataset=test_dataset,
+		loader = self.feature_cache.get_dataloader(
+			name='test',
+			dataset_raw=test_dataset,
+			transform=self.transform_test,
+			target_transform=self.target_transform,
 			batch_size=self.bsize_test,
 			num_workers=self.n_workers_s + self.n_workers_u,
-			drop_last=False,
 		)
 		return loader
+
+	def on_after_batch_transfer(self, batch: Any) -> Any:
+		if self.batch_transform is not None:
+			batch = apply_batch_transform(self.batch_transform, batch)
+		return batch
@@ -1,12 +1,17 @@
 
+import functools
+
 from pytorch_lightning import LightningDataModule
 from torch.utils.data.dataloader import DataLoader
-from typing import Callable, Optional, Tuple
+from torch.utils.data.dataset import Dataset
+from typing import Any, Callable, Optional, Tuple
 
 from mlu.datasets.fsd50k import FSD50K, FSD50KSubset
 from mlu.datasets.samplers import SubsetCycleSampler, BalancedSampler
 from mlu.datasets.split.multilabel import balanced_split, get_indexes_per_class
 from mlu.datasets.wrappers import TransformDataset, NoLabelDataset
+from sslh.datamodules.utils import FeatureCache, apply_batch_transform, get_dataset_fingerprint, load_or_compute_split
+from sslh.datasets.fsd50k import FSD50KWindowed, SAMPLE_RATE
 
 
 N_CLASSES = 200
@@ -32,6 +37,14 @@ class FSD50KDataModuleSSL(LightningDataModule):
 		download_dataset: bool = False,
 		n_train_steps: Optional[int] = 1000,
 		sampler_s_balanced: bool = True,
+		split_seed: Optional[int] = None,
+		split_cache_dir: Optional[str] = None,
+		windowed: bool = False,
+		window_length: float = 30.0,
+		align_train: str = 'random',
+		batch_transform: Optional[Callable] = None,
+		feature_cache: str = 'none',
+		feature_cache_dir: Optional[str] = None,
 	):
 		"""
 			LightningDataModule of FSD50K (FSD50K) for semi-supervised trainings.
@@ -55,6 +68,21 @@ class FSD50KDataModuleSSL(LightningDataModule):
 			:param download_dataset: TODO
 			:param n_train_steps: TODO
 			:param sampler_s_balanced: TODO
+			:param split_seed: The seed used to compute the supervised and unsupervised split.
+				If None, the split depends on the current random states and is not cached. (default: None)
+			:param split_cache_dir: The directory where the splits are saved and reused across runs.
+				If None, the split is computed at each setup. (default: None)
+			:param windowed: If True, read the audio files with FSD50KWindowed which decode only the window analysed by the
+				transforms instead of the entire clips. (default: False)
+			:param window_length: The duration of the window read in seconds when windowed is True. (default: 30.0)
+			:param align_train: The position of the train windows in the clips, 'left', 'center' or 'random'.
+				The validation and test windows are always aligned on the left. (default: 'random')
+			:param batch_transform: The optional transform applied to the batches on the training device, e.g. the
+				spectrograms computation when the data transforms only pad the waveforms. (default: None)
+			:param feature_cache: The storage of the validation and test items when their transform is deterministic,
+				'none', 'memory' or 'memmap'. (default: 'none')
+			:param feature_cache_dir: The directory of the memmap files of the cache.
+				If None, use the temporary directory. (default: None)
 		"""
 		super().__init__()
 		self.root = root
@@ -63,6 +91,8 @@ class FSD50KDataModuleSSL(LightningDataModule):
 		self.transform_val = transform_val
 		self.transform_test = transform_val
 		self.target_transform = target_transform
+		self.batch_transform = batch_transform
+		self.feature_cache = FeatureCache(feature_cache, feature_cache_dir)
 		self.bsize_train_s = bsize_train_s
 		self.bsize_train_u = bsize_train_u
 		self.bsize_val = bsize_train_s + bsize_train_u
@@ -73,11 +103,16 @@ class FSD50KDataModuleSSL(LightningDataModule):
 		self.pin_memory = pin_memory
 		self.ratio_s = ratio_s
 		self.ratio_u = ratio_u
+		self.split_seed = split_seed
+		self.split_cache_dir = split_cache_dir
 		self.duplicate_loader_s = duplicate_loader_s
 
 		self.download_dataset = download_dataset
 		self.n_train_steps = n_train_steps
 		self.sampler_s_balanced = sampler_s_balanced
+		self.windowed = windowed
+		self.window_length = window_length
+		self.align_train = align_train
 
 		self.train_dataset_raw = None
 		self.val_dataset_raw = None
@@ -92,21 +127,27 @@ class FSD50KDataModuleSSL(LightningDataModule):
 			_ = FSD50K(root=self.root, subset=FSD50KSubset.DEV, download=True)
 
 	def setup(self, stage: Optional[str] = None):
-		dataset_params = dict(
-			root=self.root,
-			download=False,
-		)
 		if stage == 'fit':
-			self.train_dataset_raw = FSD50K(subset=FSD50KSubset.TRAIN, **dataset_params)
-			self.val_dataset_raw = FSD50K(subset=FSD50KSubset.VAL, **dataset_params)
+			self.train_dataset_raw = self._build_dataset('train', self.align_train)
+			self.val_dataset_raw = self._build_dataset('val')
 
-			indexes_s, indexes_u = balanced_split(
+			split_fn = functools.partial(
+				balanced_split,
 				dataset=self.train_dataset_raw,
 				n_classes=N_CLASSES,
 				target_type='indexes',
 				ratio_s=self.ratio_s,
 				ratio_u=self.ratio_u,
 			)
+			indexes_s, indexes_u = load_or_compute_split(
+				split_fn=split_fn,
+				cache_dir=self.split_cache_dir,
+				fingerprint=get_dataset_fingerprint(self.train_dataset_raw, self.root),
+				subset='train',
+				ratio_s=self.ratio_s,
+				ratio_u=self.ratio_u,
+				seed=self.split_seed,
+			)
 
 			if self.n_train_steps is None:
 				n_train_samples_s = len(indexes_s)
@@ -130,11 +171,13 @@ class FSD50KDataModuleSSL(LightningDataModule):
 
 			dataloader = self.val_dataloader()
 			xs, ys = next(iter(dataloader))
+			if self.batch_transform is not None:
+				xs = self.batch_transform(xs)
 			self.example_input_array = xs
 			self.dims = tuple(xs.shape)
 
 		elif stage == 'test':
-			self.test_dataset_raw = FSD50K(subset=FSD50KSubset.EVAL, **dataset_params)
+			self.test_dataset_raw = self._build_dataset('eval')
 
 	def train_dataloader(self) -> Tuple[DataLoader, ...]:
 		# Wrap the datasets for apply transform on data and targets
@@ -173,14 +216,13 @@ class FSD50KDataModuleSSL(LightningDataModule):
 		if val_dataset is None:
 			return None
 
-		val_dataset = TransformDataset(val_dataset, self.transform_val, index=0)
-		val_dataset = TransformDataset(val_dataset, self.target_transform, index=1)
-
-		loader = DataLoader(
-			dataset=val_dataset,
+		loader = self.feature_cache.get_dataloader(
+			name='val',
+			dataset_raw=val_dataset,
+			transform=self.transform_val,
+			target_transform=self.target_transform,
 			batch_size=self.bsize_val,
 			num_workers=self.n_workers_s + self.n_workers_u,
-			drop_last=False,
 		)
 		return loader
 
@@ -189,13 +231,25 @@ class FSD50KDataModuleSSL(LightningDataModule):
 		if test_dataset is None:
 			return None
 
-		test_dataset = TransformDataset(test_dataset, self.transform_test, index=0)
-		test_dataset = TransformDataset(test_dataset, self.target_transform, index=1)
-
-		loader = DataLoader(
-			dataset=test_dataset,
+		loader = self.feature_cache.get_dataloader(
+			name='test',
+			dataset_raw=test_dataset,
+			transform=self.transform_test,
+			target_transform=self.target_transform,
 			batch_size=self.bsize_test,
 			num_workers=self.n_workers_s + self.n_workers_u,
-			drop_last=False,
 		)
 		return loader
+
+	def on_after_batch_transfer(self, batch: Any) -> Any:
+		if self.batch_transform is not None:
+			batch = apply_batch_transform(self.batch_transform, batch)
+		return batch
+
+	def _build_dataset(self, subset: str, align: str = 'left') -> Dataset:
+		if self.windowed:
+			window_length = int(SAMPLE_RATE * self.window_length)
+			return FSD50KWindowed(root=self.root, subset=subset, window_length=window_length, align=align)
+		else:
+			subset = {'train': FSD50KSubset.TRAIN, 'val': FSD50KSubset.VAL, 'eval': FSD50KSubset.EVAL}[subset]
+			return FSD50K(root=self.root, subset=subset, download=False)
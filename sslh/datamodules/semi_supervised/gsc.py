@@ -1,12 +1,15 @@
 
+import functools
+
 from pytorch_lightning import LightningDataModule
 from torch.utils.data.dataloader import DataLoader
 from torch.utils.data.sampler import SubsetRandomSampler
-from typing import Callable, Optional, Tuple
+from typing import Any, Callable, Optional, Tuple
 
-from mlu.datasets.split.monolabel import balanced_split
 from mlu.datasets.wrappers import TransformDataset, NoLabelDataset
+from sslh.datamodules.utils import FeatureCache, apply_batch_transform, get_dataset_fingerprint, get_train_dataloader, load_or_compute_split
 from sslh.datasets.gsc import SpeechCommands
+from sslh.datasets.utils import balanced_split_from_targets
 
 
 N_CLASSES = 35
@@ -30,6 +33,13 @@ class GSCDataModuleSSL(LightningDataModule):
 		ratio_u: float = 0.9,
 		duplicate_loader_s: bool = False,
 		download_dataset: bool = True,
+		split_seed: Optional[int] = None,
+		split_cache_dir: Optional[str] = None,
+		prefetch_depth: int = 0,
+		prefetch_max_nbytes: int = 256 * 1024 ** 2,
+		batch_transform: Optional[Callable] = None,
+		feature_cache: str = 'none',
+		feature_cache_dir: Optional[str] = None,
 	):
 		"""
 			LightningDataModule of GoogleSpeechCommands (GSC) for semi-supervised trainings.
@@ -51,6 +61,19 @@ class GSCDataModuleSSL(LightningDataModule):
 			:param ratio_u: The ratio of the unsupervised subset len in [0, 1]. (default: 0.9)
 			:param duplicate_loader_s: If True, duplicate the supervised dataloader for DCT training. (default: False)
 			:param download_dataset: If True, automatically download the dataset in the root directory. (default: True)
+			:param split_seed: The seed used to compute the supervised and unsupervised split.
+				If None, the split depends on the current random states and is not cached. (default: None)
+			:param split_cache_dir: The directory where the splits are saved and reused across runs.
+				If None, the split is computed at each setup. (default: None)
+			:param prefetch_depth: The number of train items loaded in advance by a thread pool in each worker.
+				If 0, the items are loaded without prefetch. (default: 0)
+			:param prefetch_max_nbytes: The maximal size of the train items prefetched by each worker. (default: 256 MiB)
+			:param batch_transform: The optional transform applied to the batches on the training device, e.g. the
+				spectrograms computation when the data transforms only pad the waveforms. (default: None)
+			:param feature_cache: The storage of the validation and test items when their transform is deterministic,
+				'none', 'memory' or 'memmap'. (default: 'none')
+			:param feature_cache_dir: The directory of the memmap files of the cache.
+				If None, use the temporary directory. (default: None)
 		"""
 		super().__init__()
 		self.root = root
@@ -59,6 +82,8 @@ class GSCDataModuleSSL(LightningDataModule):
 		self.transform_val = transform_val
 		self.transform_test = transform_val
 		self.target_transform = target_transform
+		self.batch_transform = batch_transform
+		self.feature_cache = FeatureCache(feature_cache, feature_cache_dir)
 		self.bsize_train_s = bsize_train_s
 		self.bsize_train_u = bsize_train_u
 		self.bsize_val = bsize_train_s + bsize_train_u
@@ -67,8 +92,12 @@ class GSCDataModuleSSL(LightningDataModule):
 		self.n_workers_u = n_workers_u
 		self.drop_last = drop_last
 		self.pin_memory = pin_memory
+		self.prefetch_depth = prefetch_depth
+		self.prefetch_max_nbytes = prefetch_max_nbytes
 		self.ratio_s = ratio_s
 		self.ratio_u = ratio_u
+		self.split_seed = split_seed
+		self.split_cache_dir = split_cache_dir
 		self.duplicate_loader_s = duplicate_loader_s
 
 		self.download_dataset = download_dataset
@@ -94,17 +123,28 @@ class GSCDataModuleSSL(LightningDataModule):
 
 			# Setup split
 			ratios = [self.ratio_s, self.ratio_u]
-			indexes_s, indexes_u = balanced_split(
-				dataset=self.train_dataset_raw,
+			split_fn = functools.partial(
+				balanced_split_from_targets,
+				targets=self.train_dataset_raw.targets,
 				n_classes=N_CLASSES,
 				ratios=ratios,
-				target_one_hot=False,
+			)
+			indexes_s, indexes_u = load_or_compute_split(
+				split_fn=split_fn,
+				cache_dir=self.split_cache_dir,
+				fingerprint=get_dataset_fingerprint(self.train_dataset_raw, self.root),
+				subset='train',
+				ratio_s=self.ratio_s,
+				ratio_u=self.ratio_u,
+				seed=self.split_seed,
 			)
 			self.sampler_s = SubsetRandomSampler(indexes_s)
 			self.sampler_u = SubsetRandomSampler(indexes_u)
 
 			dataloader = self.val_dataloader()
 			xs, ys = next(iter(dataloader))
+			if self.batch_transform is not None:
+				xs = self.batch_transform(xs)
 			self.example_input_array = xs
 			self.dims = tuple(xs.shape)
 
@@ -118,21 +158,25 @@ class GSCDataModuleSSL(LightningDataModule):
 		train_dataset_u = TransformDataset(self.train_dataset_raw, self.transform_train_u, index=0)
 		train_dataset_u = NoLabelDataset(train_dataset_u)
 
-		loader_s = DataLoader(
+		loader_s = get_train_dataloader(
 			dataset=train_dataset_s,
 			batch_size=self.bsize_train_s,
 			num_workers=self.n_workers_s,
 			sampler=self.sampler_s,
 			drop_last=self.drop_last,
 			pin_memory=self.pin_memory,
+			prefetch_depth=self.prefetch_depth,
+			prefetch_max_nbytes=self.prefetch_max_nbytes,
 		)
-		loader_u = DataLoader(
+		loader_u = get_train_dataloader(
 			dataset=train_dataset_u,
 			batch_size=self.bsize_train_u,
 			num_workers=self.n_workers_u,
 			sampler=self.sampler_u,
 			drop_last=self.drop_last,
 			pin_memory=self.pin_memory,
+			prefetch_depth=self.prefetch_depth,
+			prefetch_max_nbytes=self.prefetch_max_nbytes,
 		)
 
 		if not self.duplicate_loader_s:
@@ -147,14 +191,13 @@ class GSCDataModuleSSL(LightningDataModule):
 		if val_dataset is None:
 			return None
 
-		val_dataset = TransformDataset(val_dataset, self.transform_val, index=0)
-		val_dataset = TransformDataset(val_dataset, self.target_transform, index=1)
-
-		loader = DataLoader(
-			dataset=val_dataset,
+		loader = self.feature_cache.get_dataloader(
+			name='val',
+			dataset_raw=val_dataset,
+			transform=self.transform_val,
+			target_transform=self.target_transform,
 			batch_size=self.bsize_val,
 			num_workers=self.n_workers_s + self.n_workers_u,
-			drop_last=False,
 		)
 		return loader
 
@@ -163,13 +206,17 @@ class GSCDataModuleSSL(LightningDataModule):
 		if test_dataset is None:
 			return None
 
-		test_dataset = TransformDataset(test_dataset, self.transform_test, index=0)
-		test_dataset = TransformDataset(test_dataset, self.target_transform, index=1)
-
-		loader = DataLoader(
-			dataset=test_dataset,
+		loader = self.feature_cache.get_dataloader(
+			name='test',
+			dataset_raw=test_dataset,
+			transform=self.transform_test,
+			target_transform=self.target_transform,
 			batch_size=self.bsize_test,
 			num_workers=self.n_workers_s + self.n_workers_u,
-			drop_last=False,
 		)
 		return loader
+
+	def on_after_batch_transfer(self, batch: Any) -> Any:
+		if self.batch_transform is not None:
+			batch = apply_batch_transform(self.batch_transform, batch)
+		return batch
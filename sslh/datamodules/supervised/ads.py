@@ -3,11 +3,13 @@ import os.path as osp
 
 from pytorch_lightning import LightningDataModule
 from torch.utils.data.dataloader import DataLoader
-from typing import Callable, Optional
+from torch.utils.data.sampler import BatchSampler, Sampler, SequentialSampler
+from typing import Any, Callable, Optional
 
 from mlu.datasets.samplers import SubsetCycleSampler
 from mlu.datasets.wrappers import TransformDataset
-from sslh.datasets.ads import SingleBalancedSampler, class_balance_split, SingleAudioset
+from sslh.datamodules.utils import FeatureCache, apply_batch_transform
+from sslh.datasets.ads import BatchTransformDataset, SingleBalancedSampler, class_balance_split, SingleAudioset
 
 
 N_CLASSES = 527
@@ -30,6 +32,11 @@ class ADSDataModuleSup(LightningDataModule):
 		train_subset: str = 'unbalanced',
 		sampler_s_balanced: bool = True,
 		pre_computed_specs: bool = False,
+		fetch_batches: bool = False,
+		backend: str = 'hdf',
+		batch_transform: Optional[Callable] = None,
+		feature_cache: str = 'none',
+		feature_cache_dir: Optional[str] = None,
 	):
 		"""
 			LightningDataModule of AudioSet (ADS) for partial supervised trainings.
@@ -51,6 +58,22 @@ class ADSDataModuleSup(LightningDataModule):
 			:param train_subset: The AudioSet train subset to use.
 				Can be 'balanced' (~20K samples) or 'unbalanced' (~2M samples).
 				(default: 'unbalanced')
+			:param sampler_s_balanced: If True, use a sampler that balance classes for training data.
+				Otherwise use a standard SubsetCycleSampler.
+			:param pre_computed_specs: If True, read the pre-computed spectrograms instead of the raw waveforms.
+				(default: False)
+			:param fetch_batches: If True, each dataloader worker call reads a complete batch with one HDF read per file
+				instead of one read per sample.
+				(default: False)
+			:param backend: The storage read by the datasets.
+				Can be 'hdf' (HDF files) or 'memmap' (flat arrays built by sslh.datasets.ads_memmap.convert_hdf_to_memmap).
+				(default: 'hdf')
+			:param batch_transform: The optional transform applied to the batches on the training device, e.g. the
+				spectrograms computation when the data transforms only pad the waveforms. (default: None)
+			:param feature_cache: The storage of the validation and test items when their transform is deterministic,
+				'none', 'memory' or 'memmap'. (default: 'none')
+			:param feature_cache_dir: The directory of the memmap files of the cache.
+				If None, use the temporary directory. (default: None)
 		"""
 		if train_subset not in ('balanced', 'unbalanced'):
 			raise ValueError(f'Train subsets available are {("balanced", "unbalanced")}.')
@@ -61,6 +84,8 @@ class ADSDataModuleSup(LightningDataModule):
 		self.transform_val = transform_val
 		self.transform_test = transform_val
 		self.target_transform = target_transform
+		self.batch_transform = batch_transform
+		self.feature_cache = FeatureCache(feature_cache, feature_cache_dir)
 		self.bsize_train = bsize
 		self.bsize_val = bsize
 		self.bsize_test = bsize
@@ -72,6 +97,8 @@ class ADSDataModuleSup(LightningDataModule):
 		self.n_train_steps = n_train_steps
 		self.train_subset = train_subset
 		self.sampler_s_balanced = sampler_s_balanced
+		self.fetch_batches = fetch_batches
+		self.backend = backend
 
 		self.train_dataset_raw = None
 		self.val_dataset_raw = None
@@ -81,6 +108,8 @@ class ADSDataModuleSup(LightningDataModule):
 		self.example_input_array = None
 
 		self.rdcc_nbytes = 512 * 1024 ** 2
+		# Total HDF chunk cache budget shared by the workers of a dataloader
+		self.rdcc_total_nbytes = 2 * 1024 ** 3
 		if pre_computed_specs:
 			self.data_shape = (64, 500)
 			self.data_key = 'data'
@@ -99,6 +128,8 @@ class ADSDataModuleSup(LightningDataModule):
 				root=self.root,
 				transform=None,
 				rdcc_nbytes=self.rdcc_nbytes,
+				rdcc_total_nbytes=self.rdcc_total_nbytes,
+				backend=self.backend,
 				data_shape=self.data_shape,
 				data_key=self.data_key,
 			)
@@ -123,6 +154,8 @@ class ADSDataModuleSup(LightningDataModule):
 
 			dataloader = self.val_dataloader()
 			xs, ys = next(iter(dataloader))
+			if self.batch_transform is not None:
+				xs = self.batch_transform(xs)
 			self.example_input_array = xs
 			self.dims = tuple(xs.shape)
 
@@ -131,6 +164,9 @@ class ADSDataModuleSup(LightningDataModule):
 
 	def train_dataloader(self) -> DataLoader:
 		train_dataset = self.train_dataset_raw
+		if self.fetch_batches:
+			return self._batch_dataloader(train_dataset, self.transform_train, self.sampler_s, self.bsize_train, self.drop_last)
+
 		train_dataset = TransformDataset(train_dataset, self.transform_train, index=0)
 		train_dataset = TransformDataset(train_dataset, self.target_transform, index=1)
 
@@ -149,14 +185,16 @@ class ADSDataModuleSup(LightningDataModule):
 		if val_dataset is None:
 			return None
 
-		val_dataset = TransformDataset(val_dataset, self.transform_val, index=0)
-		val_dataset = TransformDataset(val_dataset, self.target_transform, index=1)
+		if self.fetch_batches and not self.feature_cache.can_cache(self.transform_val):
+			return self._batch_dataloader(val_dataset, self.transform_val, SequentialSampler(val_dataset), self.bsize_val, False)
 
-		loader = DataLoader(
-			dataset=val_dataset,
+		loader = self.feature_cache.get_dataloader(
+			name='val',
+			dataset_raw=val_dataset,
+			transform=self.transform_val,
+			target_transform=self.target_transform,
 			batch_size=self.bsize_val,
 			num_workers=self.n_workers,
-			drop_last=False,
 		)
 		return loader
 
@@ -165,13 +203,39 @@ class ADSDataModuleSup(LightningDataModule):
 		if test_dataset is None:
 			return None
 
-		test_dataset = TransformDataset(test_dataset, self.transform_test, index=0)
-		test_dataset = TransformDataset(test_dataset, self.target_transform, index=1)
+		if self.fetch_batches and not self.feature_cache.can_cache(self.transform_test):
+			return self._batch_dataloader(test_dataset, self.transform_test, SequentialSampler(test_dataset), self.bsize_test, False)
 
-		loader = DataLoader(
-			dataset=test_dataset,
+		loader = self.feature_cache.get_dataloader(
+			name='test',
+			dataset_raw=test_dataset,
+			transform=self.transform_test,
+			target_transform=self.target_transform,
 			batch_size=self.bsize_test,
 			num_workers=self.n_workers,
-			drop_last=False,
+		)
+		return loader
+
+	def on_after_batch_transfer(self, batch: Any) -> Any:
+		if self.batch_transform is not None:
+			batch = apply_batch_transform(self.batch_transform, batch)
+		return batch
+
+	def _batch_dataloader(
+		self,
+		dataset: SingleAudioset,
+		transform: Optional[Callable],
+		sampler: Sampler,
+		bsize: int,
+		drop_last: bool,
+	) -> DataLoader:
+		# The batch sampler is given as sampler, so each worker call receive the indexes of a complete batch
+		dataset = BatchTransformDataset(dataset, transform, self.target_transform)
+		loader = DataLoader(
+			dataset=dataset,
+			batch_size=None,
+			num_workers=self.n_workers,
+			sampler=BatchSampler(sampler, bsize, drop_last),
+			pin_memory=self.pin_memory,
 		)
 		return loader
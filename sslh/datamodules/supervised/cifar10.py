@@ -5,8 +5,8 @@ from torch.utils.data.sampler import SubsetRandomSampler
 from torchvision.datasets import CIFAR10
 from typing import Callable, Optional
 
-from mlu.datasets.split.monolabel import balanced_split
 from mlu.datasets.wrappers import TransformDataset
+from sslh.datasets.utils import balanced_split_from_targets
 
 
 N_CLASSES = 10
@@ -80,11 +80,10 @@ class CIFAR10DataModuleSup(LightningDataModule):
 			else:
 				# Setup split
 				ratios = [self.ratio]
-				indexes = balanced_split(
-					dataset=self.train_dataset_raw,
+				indexes = balanced_split_from_targets(
+					targets=self.train_dataset_raw.targets,
 					n_classes=N_CLASSES,
 					ratios=ratios,
-					target_one_hot=False,
 				)[0]
 
 			self.sampler_s = SubsetRandomSampler(indexes)
@@ -3,6 +3,8 @@ from hydra.utils import DictConfig
 from pytorch_lightning import LightningDataModule
 from typing import Callable, Optional
 
+from sslh.transforms.get_from_name import get_batch_transform
+
 from .ads import ADSDataModuleSup
 from .cifar10 import CIFAR10DataModuleSup
 from .esc10 import ESC10DataModuleSup
@@ -39,14 +41,30 @@ def get_datamodule_sup_from_cfg(
 		pin_memory=False,
 		ratio=cfg.ratio,
 	)
+	# Spectrograms computed on the training device, only for the audio datasets
+	batch_transform = get_batch_transform(cfg.data.acronym, **cfg.data.transform)
+	# Thread pool prefetch of the train items, only available for the audio datasets read file by file
+	prefetch_params = dict(
+		prefetch_depth=cfg.prefetch_depth,
+		prefetch_max_nbytes=cfg.prefetch_max_nbytes,
+	)
+	# Cache of the validation and test items when their transform is deterministic
+	feature_cache_params = dict(
+		feature_cache=cfg.feature_cache,
+		feature_cache_dir=cfg.feature_cache_dir,
+	)
 
 	if cfg.data.acronym == 'ADS':
 		datamodule = ADSDataModuleSup(
 			**datamodule_params,
+			batch_transform=batch_transform,
+			**feature_cache_params,
 			train_subset=cfg.data.train_subset,
 			n_train_steps=cfg.data.n_train_steps,
 			sampler_s_balanced=cfg.data.sampler_s_balanced,
 			pre_computed_specs=cfg.data.pre_computed_specs,
+			fetch_batches=cfg.data.fetch_batches,
+			backend=cfg.data.backend,
 		)
 	elif cfg.data.acronym == 'CIFAR10':
 		datamodule = CIFAR10DataModuleSup(
@@ -56,6 +74,9 @@ def get_datamodule_sup_from_cfg(
 	elif cfg.data.acronym == 'ESC10':
 		datamodule = ESC10DataModuleSup(
 			**datamodule_params,
+			batch_transform=batch_transform,
+			**feature_cache_params,
+			**prefetch_params,
 			download_dataset=cfg.data.download,
 			folds_train=cfg.data.folds_train,
 			folds_val=cfg.data.folds_val
@@ -63,25 +84,40 @@ def get_datamodule_sup_from_cfg(
 	elif cfg.data.acronym == 'FSD50K':
 		datamodule = FSD50KDataModuleSup(
 			**datamodule_params,
+			batch_transform=batch_transform,
+			**feature_cache_params,
 			download_dataset=cfg.data.download,
 			n_train_steps=cfg.data.n_train_steps,
 			sampler_s_balanced=cfg.data.sampler_s_balanced,
+			windowed=cfg.data.windowed,
+			window_length=cfg.data.transform.waveform_length,
+			align_train=cfg.data.align_train,
 		)
 	elif cfg.data.acronym == 'GSC':
 		datamodule = GSCDataModuleSup(
 			**datamodule_params,
+			batch_transform=batch_transform,
+			**feature_cache_params,
+			**prefetch_params,
 			download_dataset=cfg.data.download,
 		)
 	elif cfg.data.acronym == 'PVC':
 		datamodule = PVCDataModuleSup(
 			**datamodule_params,
+			batch_transform=batch_transform,
+			**feature_cache_params,
+			**prefetch_params,
 			n_train_steps=cfg.data.n_train_steps,
 		)
 	elif cfg.data.acronym == 'UBS8K':
 		datamodule = UBS8KDataModuleSup(
 			**datamodule_params,
+			batch_transform=batch_transform,
+			**feature_cache_params,
+			**prefetch_params,
 			folds_train=cfg.data.folds_train,
 			folds_val=cfg.data.folds_val,
+			arena=cfg.data.arena,
 		)
 	else:
 		raise RuntimeError(
@@ -1,10 +1,11 @@
 
 from pytorch_lightning import LightningDataModule
 from torch.utils.data.dataloader import DataLoader
-from typing import Callable, Optional
+from typing import Any, Callable, Optional
 
 from mlu.datasets.wrappers import TransformDataset
 from sslh.datasets.pvc import ComParE2021PRS, IterationBalancedSampler, class_balance_split
+from sslh.datamodules.utils import FeatureCache, apply_batch_transform, get_train_dataloader
 
 
 N_CLASSES = 5
@@ -23,6 +24,11 @@ class PVCDataModuleSup(LightningDataModule):
 		pin_memory: bool = False,
 		ratio: float = 1.0,
 		n_train_steps: Optional[int] = 50000,
+		prefetch_depth: int = 0,
+		prefetch_max_nbytes: int = 256 * 1024 ** 2,
+		batch_transform: Optional[Callable] = None,
+		feature_cache: str = 'none',
+		feature_cache_dir: Optional[str] = None,
 	):
 		"""
 			LightningDataModule of Primate Vocalization Corpus (PVC) for partial supervised trainings.
@@ -41,6 +47,15 @@ class PVCDataModuleSup(LightningDataModule):
 			:param n_train_steps: The number of train steps for PVC.
 				If None, the number will be set to the number of train labeled data.
 				(default: 50000)
+			:param prefetch_depth: The number of train items loaded in advance by a thread pool in each worker.
+				If 0, the items are loaded without prefetch. (default: 0)
+			:param prefetch_max_nbytes: The maximal size of the train items prefetched by each worker. (default: 256 MiB)
+			:param batch_transform: The optional transform applied to the batches on the training device, e.g. the
+				spectrograms computation when the data transforms only pad the waveforms. (default: None)
+			:param feature_cache: The storage of the validation and test items when their transform is deterministic,
+				'none', 'memory' or 'memmap'. (default: 'none')
+			:param feature_cache_dir: The directory of the memmap files of the cache.
+				If None, use the temporary directory. (default: None)
 		"""
 		super().__init__()
 		self.root = root
@@ -48,12 +63,16 @@ class PVCDataModuleSup(LightningDataModule):
 		self.transform_val = transform_val
 		self.transform_test = transform_val
 		self.target_transform = target_transform
+		self.batch_transform = batch_transform
+		self.feature_cache = FeatureCache(feature_cache, feature_cache_dir)
 		self.bsize_train = bsize
 		self.bsize_val = bsize
 		self.bsize_test = bsize
 		self.n_workers = n_workers
 		self.drop_last = drop_last
 		self.pin_memory = pin_memory
+		self.prefetch_depth = prefetch_depth
+		self.prefetch_max_nbytes = prefetch_max_nbytes
 		self.ratio = ratio
 
 		self.n_train_steps = n_train_steps
@@ -87,6 +106,8 @@ class PVCDataModuleSup(LightningDataModule):
 
 			dataloader = self.val_dataloader()
 			xs, ys = next(iter(dataloader))
+			if self.batch_transform is not None:
+				xs = self.batch_transform(xs)
 			self.example_input_array = xs
 			self.dims = tuple(xs.shape)
 
@@ -99,13 +120,15 @@ class PVCDataModuleSup(LightningDataModule):
 		train_dataset = TransformDataset(train_dataset, self.transform_train, index=0)
 		train_dataset = TransformDataset(train_dataset, self.target_transform, index=1)
 
-		loader = DataLoader(
+		loader = get_train_dataloader(
 			dataset=train_dataset,
 			batch_size=self.bsize_train,
 			num_workers=self.n_workers,
 			drop_last=self.drop_last,
 			pin_memory=self.pin_memory,
 			sampler=self.sampler_s,
+			prefetch_depth=self.prefetch_depth,
+			prefetch_max_nbytes=self.prefetch_max_nbytes,
 		)
 		return loader
 
@@ -114,14 +137,13 @@ class PVCDataModuleSup(LightningDataModule):
 		if val_dataset is None:
 			return None
 
-		val_dataset = TransformDataset(val_dataset, self.transform_val, index=0)
-		val_dataset = TransformDataset(val_dataset, self.target_transform, index=1)
-
-		loader = DataLoader(
-			dataset=val_dataset,
+		loader = self.feature_cache.get_dataloader(
+			name='val',
+			dataset_raw=val_dataset,
+			transform=self.transform_val,
+			target_transform=self.target_transform,
 			batch_size=self.bsize_val,
 			num_workers=self.n_workers,
-			drop_last=False,
 		)
 		return loader
 
@@ -130,13 +152,17 @@ class PVCDataModuleSup(LightningDataModule):
 		if test_dataset is None:
 			return None
 
-		test_dataset = TransformDataset(test_dataset, self.transform_test, index=0)
-		test_dataset = TransformDataset(test_dataset, self.target_transform, index=1)
-
-		loader = DataLoader(
-			dataset=test_dataset,
+		loader = self.feature_cache.get_dataloader(
+			name='test',
+			dataset_raw=test_dataset,
+			transform=self.transform_test,
+			target_transform=self.target_transform,
 			batch_size=self.bsize_test,
 			num_workers=self.n_workers,
-			drop_last=False,
 		)
 		return loader
+
+	def on_after_batch_transfer(self, batch: Any) -> Any:
+		if self.batch_transform is not None:
+			batch = apply_batch_transform(self.batch_transform, batch)
+		return batch
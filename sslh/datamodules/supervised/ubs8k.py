@@ -4,12 +4,12 @@ import os.path as osp
 from pytorch_lightning import LightningDataModule
 from torch.utils.data.dataloader import DataLoader
 from torch.utils.data.sampler import SubsetRandomSampler
-from typing import Callable, List, Optional
+from typing import Any, Callable, List, Optional
 
-from mlu.datasets.split.monolabel import balanced_split
 from mlu.datasets.wrappers import TransformDataset
-from sslh.datamodules.utils import guess_folds
-from sslh.datasets.ubs8k import UBS8KDataset
+from sslh.datamodules.utils import FeatureCache, apply_batch_transform, get_train_dataloader, guess_folds
+from sslh.datasets.ubs8k import UBS8KDataset, prepare_arenas
+from sslh.datasets.utils import balanced_split_from_targets
 
 
 N_CLASSES = 10
@@ -30,6 +30,12 @@ class UBS8KDataModuleSup(LightningDataModule):
 		ratio: float = 1.0,
 		folds_train: Optional[List[int]] = None,
 		folds_val: Optional[List[int]] = None,
+		prefetch_depth: int = 0,
+		prefetch_max_nbytes: int = 256 * 1024 ** 2,
+		batch_transform: Optional[Callable] = None,
+		feature_cache: str = 'none',
+		feature_cache_dir: Optional[str] = None,
+		arena: bool = False,
 	):
 		"""
 			LightningDataModule of UrbanSound8K (UBS8K) for partial supervised trainings.
@@ -55,6 +61,17 @@ class UBS8KDataModuleSup(LightningDataModule):
 				If both folds_train and folds_val are None, then the default folds are used:
 					[1, 2, 3, 4, 5, 6, 7, 8, 9] for folds_train and [10] for folds_val.
 				(default: None)
+			:param prefetch_depth: The number of train items loaded in advance by a thread pool in each worker.
+				If 0, the items are loaded without prefetch. (default: 0)
+			:param prefetch_max_nbytes: The maximal size of the train items prefetched by each worker. (default: 256 MiB)
+			:param batch_transform: The optional transform applied to the batches on the training device, e.g. the
+				spectrograms computation when the data transforms only pad the waveforms. (default: None)
+			:param feature_cache: The storage of the validation and test items when their transform is deterministic,
+				'none', 'memory' or 'memmap'. (default: 'none')
+			:param feature_cache_dir: The directory of the memmap files of the cache.
+				If None, use the temporary directory. (default: None)
+			:param arena: If True, read the resampled waveforms from the fold arenas, which are built or rebuilt in
+				prepare_data when they are missing or do not match the files of the dataset. (default: False)
 		"""
 		if not osp.isdir(root):
 			raise RuntimeError(f'Unknown dataset root dirpath "{root}" for UBS8K.')
@@ -65,12 +82,17 @@ class UBS8KDataModuleSup(LightningDataModule):
 		self.transform_val = transform_val
 		self.transform_test = transform_val
 		self.target_transform = target_transform
+		self.batch_transform = batch_transform
+		self.feature_cache = FeatureCache(feature_cache, feature_cache_dir)
+		self.arena = arena
 		self.bsize_train = bsize
 		self.bsize_val = bsize
 		self.bsize_test = bsize
 		self.n_workers = n_workers
 		self.drop_last = drop_last
 		self.pin_memory = pin_memory
+		self.prefetch_depth = prefetch_depth
+		self.prefetch_max_nbytes = prefetch_max_nbytes
 		self.ratio = ratio
 
 		self.folds_train, self.folds_val = guess_folds(folds_train, folds_val, FOLDS)
@@ -83,29 +105,31 @@ class UBS8KDataModuleSup(LightningDataModule):
 		self.example_input_array = None
 
 	def prepare_data(self, *args, **kwargs):
-		pass
+		if self.arena:
+			prepare_arenas(osp.dirname(self.root), list(self.folds_train) + list(self.folds_val))
 
 	def setup(self, stage: Optional[str] = None):
 		if stage == 'fit':
-			self.train_dataset_raw = UBS8KDataset(self.root, folds=self.folds_train)
-			self.val_dataset_raw = UBS8KDataset(self.root, folds=self.folds_val)
+			self.train_dataset_raw = UBS8KDataset(self.root, folds=self.folds_train, arena=self.arena)
+			self.val_dataset_raw = UBS8KDataset(self.root, folds=self.folds_val, arena=self.arena)
 
 			if self.ratio >= 1.0:
 				indexes = list(range(len(self.train_dataset_raw)))
 			else:
 				# Setup split
 				ratios = [self.ratio]
-				indexes = balanced_split(
-					dataset=self.train_dataset_raw,
+				indexes = balanced_split_from_targets(
+					targets=self.train_dataset_raw.targets,
 					n_classes=N_CLASSES,
 					ratios=ratios,
-					target_one_hot=False,
 				)[0]
 
 			self.sampler_s = SubsetRandomSampler(indexes)
 
 			dataloader = self.val_dataloader()
 			xs, ys = next(iter(dataloader))
+			if self.batch_transform is not None:
+				xs = self.batch_transform(xs)
 			self.example_input_array = xs
 			self.dims = tuple(xs.shape)
 
@@ -117,13 +141,15 @@ class UBS8KDataModuleSup(LightningDataModule):
 		train_dataset = TransformDataset(train_dataset, self.transform_train, index=0)
 		train_dataset = TransformDataset(train_dataset, self.target_transform, index=1)
 
-		loader = DataLoader(
+		loader = get_train_dataloader(
 			dataset=train_dataset,
 			batch_size=self.bsize_train,
 			num_workers=self.n_workers,
 			drop_last=self.drop_last,
 			pin_memory=self.pin_memory,
 			sampler=self.sampler_s,
+			prefetch_depth=self.prefetch_depth,
+			prefetch_max_nbytes=self.prefetch_max_nbytes,
 		)
 		return loader
 
@@ -132,14 +158,13 @@ class UBS8KDataModuleSup(LightningDataModule):
 		if val_dataset is None:
 			return None
 
-		val_dataset = TransformDataset(val_dataset, self.transform_val, index=0)
-		val_dataset = TransformDataset(val_dataset, self.target_transform, index=1)
-
-		loader = DataLoader(
-			dataset=val_dataset,
+		loader = self.feature_cache.get_dataloader(
+			name='val',
+			dataset_raw=val_dataset,
+			transform=self.transform_val,
+			target_transform=self.target_transform,
 			batch_size=self.bsize_val,
 			num_workers=self.n_workers,
-			drop_last=False,
 		)
 		return loader
 
@@ -148,13 +173,17 @@ class UBS8KDataModuleSup(LightningDataModule):
 		if test_dataset is None:
 			return None
 
-		test_dataset = TransformDataset(test_dataset, self.transform_test, index=0)
-		test_dataset = TransformDataset(test_dataset, self.target_transform, index=1)
-
-		loader = DataLoader(
-			dataset=test_dataset,
+		loader = self.feature_cache.get_dataloader(
+			name='test',
+			dataset_raw=test_dataset,
+			transform=self.transform_test,
+			target_transform=self.target_transform,
 			batch_size=self.bsize_test,
 			num_workers=self.n_workers,
-			drop_last=False,
 		)
 		return loader
+
+	def on_after_batch_transfer(self, batch: Any) -> Any:
+		if self.batch_transform is not None:
+			batch = apply_batch_transform(self.batch_transform, batch)
+		return batch
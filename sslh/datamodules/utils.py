@@ -1,5 +1,28 @@
 
-from typing import List, Tuple, Union
+import hashlib
+import logging
+import numpy as np
+import os
+import os.path as osp
+import random
+import tempfile
+import torch
+import weakref
+
+from torch import Tensor
+from torch.utils.data.dataloader import DataLoader
+from torch.utils.data.dataset import Dataset
+from torch.utils.data.sampler import Sampler
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from mlu.datasets.wrappers import TransformDataset
+from sslh.datasets.wrappers import CachedBatchDataset, PrefetchDataset
+from sslh.transforms.utils import is_deterministic_transform
+
+
+# Increment to invalidate the split files of the previous split algorithms
+SPLIT_CACHE_VERSION = 2
+FEATURE_CACHE_MODES = ('none', 'memory', 'memmap')
 
 
 def guess_folds(
@@ -32,3 +55,253 @@ def guess_folds(
 		folds_val = list(folds.difference(folds_train))
 
 	return folds_train, folds_val
+
+
+def get_dataset_fingerprint(dataset: Dataset, root: str) -> str:
+	"""
+		Returns a short identifier of a dataset built from its class name, its length and its root path.
+
+		:param dataset: The dataset to identify.
+		:param root: The root path of the dataset.
+		:return: The fingerprint as string.
+	"""
+	root_hash = hashlib.sha1(osp.realpath(root).encode()).hexdigest()[:8]
+	return f'{type(dataset).__name__}_{len(dataset)}_{root_hash}'
+
+
+def get_train_dataloader(
+	dataset: Dataset,
+	batch_size: int,
+	num_workers: int,
+	sampler: Optional[Sampler],
+	drop_last: bool,
+	pin_memory: bool,
+	prefetch_depth: int = 0,
+	prefetch_max_nbytes: int = 256 * 1024 ** 2,
+) -> DataLoader:
+	"""
+		Returns the train DataLoader of a dataset, optionally wrapped in a PrefetchDataset.
+
+		:param dataset: The train dataset.
+		:param batch_size: The batch size.
+		:param num_workers: The number of workers of the DataLoader.
+		:param sampler: The sampler of the train indexes.
+		:param drop_last: If True, drop the last incomplete batch.
+		:param pin_memory: If True, pin the memory of dataloader.
+		:param prefetch_depth: The number of items loaded in advance by a thread pool in each worker.
+			If 0, the items are loaded by the DataLoader without prefetch. (default: 0)
+		:param prefetch_max_nbytes: The maximal size of the items prefetched by each worker. (default: 256 MiB)
+		:return: The train DataLoader.
+	"""
+	if prefetch_depth > 0:
+		if sampler is None:
+			sampler = range(len(dataset))
+		dataset = PrefetchDataset(dataset, sampler, batch_size, prefetch_depth, prefetch_max_nbytes)
+		sampler = None
+
+	return DataLoader(
+		dataset=dataset,
+		batch_size=batch_size,
+		num_workers=num_workers,
+		sampler=sampler,
+		drop_last=drop_last,
+		pin_memory=pin_memory,
+	)
+
+
+def apply_batch_transform(batch_transform: Callable, batch: Any) -> Any:
+	"""
+		Apply a batch transform to the data of a batch, the targets are returned unchanged.
+
+		The batch is either a batch (xs, ys) of a supervised loader, or a training batch of the semi-supervised
+		datamodules, i.e. a tuple of the batches of the loaders where the last one contains the unlabeled data (a tensor
+		or a tuple of views) and the others are supervised batches (xs, ys).
+
+		:param batch_transform: The transform of the data, e.g. the spectrograms computation on the training device.
+		:param batch: The batch to transform.
+		:return: The batch with the transformed data.
+	"""
+	if isinstance(batch[0], Tensor):
+		xs, ys = batch
+		return type(batch)((batch_transform(xs), ys))
+	else:
+		*batches_s, batch_u = batch
+		batches_s = [apply_batch_transform(batch_transform, batch_s) for batch_s in batches_s]
+		return type(batch)((*batches_s, batch_transform(batch_u)))
+
+
+class FeatureCache:
+	def __init__(self, mode: str = 'none', cache_dir: Optional[str] = None):
+		"""
+			Cache of the transformed validation and test items of a datamodule.
+
+			When the data transform is deterministic (see is_deterministic_transform), the items are transformed once by
+			the first dataloader and stored in contiguous arrays. The next dataloaders stream batches from the arrays
+			instead of reading and transforming the files again. The target transform is assumed deterministic.
+
+			:param mode: 'none' to disable the cache, 'memory' to store the items in RAM, 'memmap' to store them in
+				anonymous files of cache_dir mapped in memory. (default: 'none')
+			:param cache_dir: The directory of the memmap files. If None, use the temporary directory. (default: None)
+		"""
+		if mode not in FEATURE_CACHE_MODES:
+			raise ValueError(f'Invalid feature cache mode "{mode}". Must be one of {FEATURE_CACHE_MODES}.')
+
+		self.mode = mode
+		self.cache_dir = cache_dir
+		self._stores: Dict[str, Tuple[weakref.ref, List[np.ndarray]]] = {}
+
+	def can_cache(self, transform: Optional[Callable]) -> bool:
+		"""
+			:param transform: The data transform of the items.
+			:return: True if the items transformed by transform are cached by get_dataloader.
+		"""
+		return self.mode != 'none' and is_deterministic_transform(transform)
+
+	def get_dataloader(
+		self,
+		name: str,
+		dataset_raw: Dataset,
+		transform: Optional[Callable],
+		target_transform: Optional[Callable],
+		batch_size: int,
+		num_workers: int,
+	) -> DataLoader:
+		"""
+			Returns the evaluation DataLoader of a dataset, which read the cached items if possible.
+
+			:param name: The name of the cached items, e.g. 'val' or 'test'.
+			:param dataset_raw: The dataset without transforms.
+			:param transform: The data transform.
+			:param target_transform: The target transform.
+			:param batch_size: The batch size.
+			:param num_workers: The number of workers used to read and transform the items.
+			:return: The evaluation DataLoader.
+		"""
+		dataset = TransformDataset(dataset_raw, transform, index=0)
+		dataset = TransformDataset(dataset, target_transform, index=1)
+
+		if self.can_cache(transform):
+			arrays = self._get_arrays(name, dataset_raw, dataset, batch_size, num_workers)
+			if arrays is not None:
+				return DataLoader(dataset=CachedBatchDataset(arrays, batch_size), batch_size=None, num_workers=0)
+
+		return DataLoader(
+			dataset=dataset,
+			batch_size=batch_size,
+			num_workers=num_workers,
+			drop_last=False,
+		)
+
+	def clear(self):
+		self._stores.clear()
+
+	def _get_arrays(
+		self,
+		name: str,
+		dataset_raw: Dataset,
+		dataset: Dataset,
+		batch_size: int,
+		num_workers: int,
+	) -> Optional[List[np.ndarray]]:
+		# The stores are rebuilt when the datamodule setup a new raw dataset. The identity is compared with a weak
+		# reference because the id of a deleted dataset can be reused by the new one.
+		if name in self._stores and self._stores[name][0]() is dataset_raw:
+			return self._stores[name][1]
+
+		loader = DataLoader(dataset=dataset, batch_size=batch_size, num_workers=num_workers, drop_last=False)
+		arrays = None
+		offset = 0
+
+		for batch in loader:
+			if not all(isinstance(tensor, Tensor) for tensor in batch):
+				logging.warning(f'Cannot cache the "{name}" items which are not tensors after the transforms.')
+				return None
+			if arrays is None:
+				arrays = [self._allocate((len(dataset),) + tuple(tensor.shape[1:]), tensor) for tensor in batch]
+			for array, tensor in zip(arrays, batch):
+				array[offset:offset + len(tensor)] = tensor.numpy()
+			offset += len(batch[0])
+
+		if arrays is None:
+			return None
+		self._stores[name] = weakref.ref(dataset_raw), arrays
+		return arrays
+
+	def _allocate(self, shape: Tuple[int, ...], tensor: Tensor) -> np.ndarray:
+		dtype = tensor.numpy().dtype
+		if self.mode == 'memory':
+			return np.empty(shape, dtype=dtype)
+		else:
+			# The file is removed when the memmap is deleted
+			file = tempfile.TemporaryFile(dir=self.cache_dir)
+			return np.memmap(file, dtype=dtype, mode='w+', shape=shape)
+
+
+def load_or_compute_split(
+	split_fn: Callable[[], Sequence[Sequence[int]]],
+	cache_dir: Optional[str],
+	fingerprint: str,
+	subset: str,
+	ratio_s: float,
+	ratio_u: float,
+	seed: Optional[int],
+) -> Tuple[np.ndarray, np.ndarray]:
+	"""
+		Load the supervised and unsupervised indexes of a split from the cache directory or compute them.
+
+		The split is computed with the random generators of random, numpy and torch seeded with seed, and their states
+		are restored afterwards, so the rest of the training does not depend on whether the split was cached.
+		The split file is written atomically, so concurrent runs can share the same cache directory.
+
+		:param split_fn: The function without arguments which returns the supervised and unsupervised indexes.
+		:param cache_dir: The directory of the split files. If None, the split is always computed.
+		:param fingerprint: The identifier of the dataset, see get_dataset_fingerprint.
+		:param subset: The name of the subset split (e.g. 'train' or the training folds).
+		:param ratio_s: The ratio of the supervised subset.
+		:param ratio_u: The ratio of the unsupervised subset.
+		:param seed: The seed used to compute the split. If None, the split is computed with the current random states
+			and is not cached.
+		:return: The tuple of indexes arrays (supervised indexes, unsupervised indexes).
+	"""
+	if cache_dir is None or seed is None:
+		return _compute_split(split_fn, seed)
+
+	key = f'v{SPLIT_CACHE_VERSION}-{fingerprint}-{subset}-{ratio_s}-{ratio_u}-{seed}'
+	fname = f'split_{hashlib.sha1(key.encode()).hexdigest()[:16]}.npz'
+	fpath = osp.join(cache_dir, fname)
+
+	if osp.isfile(fpath):
+		with np.load(fpath) as data:
+			if str(data['key']) == key:
+				return data['indexes_s'], data['indexes_u']
+		logging.warning(f'Split file "{fpath}" has a different key, the split will be recomputed.')
+
+	indexes_s, indexes_u = _compute_split(split_fn, seed)
+
+	os.makedirs(cache_dir, exist_ok=True)
+	tmp_fpath = f'{fpath}.{os.getpid()}.tmp.npz'
+	np.savez(tmp_fpath, key=np.asarray(key), indexes_s=indexes_s, indexes_u=indexes_u)
+	os.replace(tmp_fpath, fpath)
+
+	return indexes_s, indexes_u
+
+
+def _compute_split(
+	split_fn: Callable[[], Sequence[Sequence[int]]],
+	seed: Optional[int],
+) -> Tuple[np.ndarray, np.ndarray]:
+	if seed is None:
+		indexes_s, indexes_u = split_fn()
+	else:
+		states = random.getstate(), np.random.get_state(), torch.get_rng_state()
+		random.seed(seed)
+		np.random.seed(seed)
+		torch.manual_seed(seed)
+		try:
+			indexes_s, indexes_u = split_fn()
+		finally:
+			random.setstate(states[0])
+			np.random.set_state(states[1])
+			torch.set_rng_state(states[2])
+
+	return np.asarray(indexes_s, dtype=np.int64), np.asarray(indexes_u, dtype=np.int64)
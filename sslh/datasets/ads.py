@@ -6,22 +6,275 @@
 		- typing & imports
 """
 
-import functools
 import h5py
-import itertools
 import logging
 import numpy as np
 import os
 import random
 import torch
-import tqdm
 
-from tqdm import trange
+from collections import OrderedDict
 from torch import Tensor
 from torch.nn import Module
+from torch.utils.data import get_worker_info
+from torch.utils.data.dataloader import default_collate
 from torch.utils.data.dataset import Dataset
 from torch.utils.data.sampler import Sampler
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sslh.datasets.utils import (
+	get_indexes_per_class_csr,
+	greedy_multilabel_split_csr,
+	round_robin_per_class,
+	shuffle_per_class,
+)
+
+
+class ChunkLRUCache:
+	"""Least Recently Used cache of HDF chunks bounded by a memory budget.
+
+	Each DataLoader worker owns a copy of the dataset, therefore each worker has its own cache.
+
+	Args:
+		max_nbytes (int): The maximal number of bytes stored in the cache. 0 disable the cache. default 256 MB
+	"""
+
+	def __init__(self, max_nbytes: int = 256 * 1024 ** 2):
+		if max_nbytes < 0:
+			raise ValueError(f'Invalid argument max_nbytes={max_nbytes}. Must be a positive integer or 0.')
+
+		self.max_nbytes = max_nbytes
+		self.nbytes = 0
+		self.n_hits = 0
+		self.n_misses = 0
+		self._chunks = OrderedDict()
+
+	def get(self, key: Tuple[str, int]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+		chunk = self._chunks.get(key)
+		if chunk is None:
+			self.n_misses += 1
+		else:
+			self.n_hits += 1
+			self._chunks.move_to_end(key)
+		return chunk
+
+	def put(self, key: Tuple[str, int], chunk: Tuple[np.ndarray, np.ndarray]):
+		chunk_nbytes = sum(array.nbytes for array in chunk)
+		if chunk_nbytes > self.max_nbytes:
+			return
+
+		if key in self._chunks:
+			self.nbytes -= sum(array.nbytes for array in self._chunks.pop(key))
+
+		# Evict the least recently used chunks until the new one fits in the budget
+		while len(self._chunks) > 0 and self.nbytes + chunk_nbytes > self.max_nbytes:
+			_, evicted = self._chunks.popitem(last=False)
+			self.nbytes -= sum(array.nbytes for array in evicted)
+
+		self._chunks[key] = chunk
+		self.nbytes += chunk_nbytes
+
+	def clear(self):
+		self._chunks.clear()
+		self.nbytes = 0
+		self.n_hits = 0
+		self.n_misses = 0
+
+	def get_stats(self) -> Dict[str, Any]:
+		n_requests = self.n_hits + self.n_misses
+		hit_rate = self.n_hits / n_requests if n_requests > 0 else 0.0
+		return dict(
+			n_hits=self.n_hits,
+			n_misses=self.n_misses,
+			hit_rate=hit_rate,
+			n_chunks=len(self._chunks),
+			nbytes=self.nbytes,
+			max_nbytes=self.max_nbytes,
+		)
+
+	def __contains__(self, key: Tuple[str, int]) -> bool:
+		return key in self._chunks
+
+	def __len__(self) -> int:
+		return len(self._chunks)
+
+
+BACKENDS = ('hdf', 'memmap')
+
+
+def get_memmap_paths(root: str, version: str, data_key: str) -> Tuple[str, str, str]:
+	"""Returns the paths of the flat data array, the targets array and the sidecar index of the memmap backend."""
+	data_path = os.path.join(root, f'{version}_{data_key}.npy')
+	targets_path = os.path.join(root, f'{version}_targets.npy')
+	index_path = os.path.join(root, f'{version}_index.npz')
+	return data_path, targets_path, index_path
+
+
+def get_targets_signature_path(root: str, version: str) -> str:
+	"""Returns the path of the sidecar file with the signature of the HDF files of the targets cache."""
+	return os.path.join(root, f'{version}_targets_signature.npz')
+
+
+TARGETS_MODES = ('csr', 'mmap', 'dense')
+
+
+class CSRTargets:
+	"""Multi-hot targets stored in a CSR layout, densified on read.
+
+	The classes of the sample i are indices[indptr[i]:indptr[i + 1]]. Indexing with an integer returns
+	the dense target of one sample, indexing with a slice or an array of indexes returns the dense targets
+	of the batch.
+
+	Args:
+		indptr (np.ndarray): The pointers of each sample in indices, of shape (N + 1,).
+		indices (np.ndarray): The classes of all the samples.
+		n_classes (int): The number of classes.
+	"""
+
+	def __init__(self, indptr: np.ndarray, indices: np.ndarray, n_classes: int):
+		self.indptr = indptr
+		self.indices = indices
+		self.n_classes = n_classes
+
+	@classmethod
+	def from_dense(cls, targets: np.ndarray, n_rows_per_step: int = 65536) -> 'CSRTargets':
+		"""Build the CSR targets from a dense (or memory-mapped) array, a few rows at a time."""
+		counts, indices = [], []
+		for start in range(0, len(targets), n_rows_per_step):
+			block = np.asarray(targets[start:start + n_rows_per_step])
+			rows, classes = np.nonzero(block)
+			counts.append(np.bincount(rows, minlength=len(block)))
+			indices.append(classes.astype(np.int16))
+
+		indptr = np.concatenate(([0], np.cumsum(np.concatenate(counts)))).astype(np.int64)
+		indices = np.concatenate(indices)
+		return cls(indptr, indices, targets.shape[1])
+
+	@classmethod
+	def load(cls, path: str) -> 'CSRTargets':
+		with np.load(path) as data:
+			return cls(data['indptr'], data['indices'], int(data['n_classes']))
+
+	def save(self, path: str):
+		np.savez(path, indptr=self.indptr, indices=self.indices, n_classes=np.int64(self.n_classes))
+
+	@property
+	def shape(self) -> Tuple[int, int]:
+		return len(self), self.n_classes
+
+	def __len__(self) -> int:
+		return len(self.indptr) - 1
+
+	def __getitem__(self, index) -> np.ndarray:
+		if isinstance(index, (int, np.integer)):
+			index = self._normalize_rows(np.int64(index))
+			target = np.zeros(self.n_classes, dtype=bool)
+			target[self.indices[self.indptr[index]:self.indptr[index + 1]]] = True
+			return target
+
+		if isinstance(index, slice):
+			rows = np.arange(len(self))[index]
+		else:
+			rows = np.asarray(index, dtype=np.int64)
+
+		batch_rows, classes = self.nonzero(rows)
+		targets = np.zeros((len(rows), self.n_classes), dtype=bool)
+		targets[batch_rows, classes] = True
+		return targets
+
+	def nonzero(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+		"""Returns the (position in rows, class) pairs of the positive targets of rows, without densifying them."""
+		rows = self._normalize_rows(np.asarray(rows, dtype=np.int64))
+		starts = self.indptr[rows]
+		counts = self.indptr[rows + 1] - starts
+
+		# Position in indices of each (sample, class) pair of the batch
+		batch_rows = np.repeat(np.arange(len(rows)), counts)
+		positions = np.arange(counts.sum()) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+		return batch_rows, self.indices[positions].astype(np.int64)
+
+	def _normalize_rows(self, rows: np.ndarray) -> np.ndarray:
+		if np.any((rows < -len(self)) | (rows >= len(self))):
+			raise IndexError(f'Index out of range for {len(self)} targets.')
+		return np.where(rows < 0, rows + len(self), rows)
+
+	def to_dense(self) -> np.ndarray:
+		return self[:]
+
+
+class HDFHandlePool:
+	"""Pool of HDF file handles opened lazily by the process which reads them.
+
+	The handles are never shared between processes : when the pool is used in a process other than
+	the one which opened the files (e.g. a forked DataLoader worker), the inherited handles are dropped
+	and the files are opened again. The handles are also dropped when the pool is pickled.
+
+	The total HDF chunk cache budget is divided across the workers of the DataLoader and the files.
+
+	Args:
+		root (str): The directory that contain the HDF files.
+		total_rdcc_nbytes (int): The total HDF 'raw data chunk cache' budget of the pool for all the workers.
+		max_rdcc_nbytes (int): The maximal 'raw data chunk cache' size of one file handle.
+	"""
+
+	def __init__(self, root: str, total_rdcc_nbytes: int, max_rdcc_nbytes: int):
+		self.root = root
+		self.total_rdcc_nbytes = total_rdcc_nbytes
+		self.max_rdcc_nbytes = max_rdcc_nbytes
+		self.names = []
+
+		self._pid = os.getpid()
+		self._handles = dict()
+
+	def add(self, name: str):
+		if name not in self.names:
+			self.names.append(name)
+
+	def get_rdcc_nbytes(self) -> int:
+		"""Returns the chunk cache size of one file handle for the current process."""
+		worker_info = get_worker_info()
+		n_workers = worker_info.num_workers if worker_info is not None else 1
+		n_files = max(len(self.names), 1)
+		return min(self.max_rdcc_nbytes, self.total_rdcc_nbytes // (n_workers * n_files))
+
+	def keys(self) -> List[str]:
+		return list(self.names)
+
+	def close(self):
+		if self._pid == os.getpid():
+			for hdf_file in self._handles.values():
+				hdf_file.close()
+		self._handles = dict()
+		self._pid = os.getpid()
+
+	def __getitem__(self, name: str) -> h5py.File:
+		if self._pid != os.getpid():
+			# Handles inherited from the parent process must not be used or closed by a child process
+			self._handles = dict()
+			self._pid = os.getpid()
+
+		hdf_file = self._handles.get(name)
+		if hdf_file is None:
+			if name not in self.names:
+				raise KeyError(f'Unknown HDF file "{name}" in HDF pool of "{self.root}".')
+
+			path = os.path.join(self.root, name)
+			hdf_file = h5py.File(path, 'r', rdcc_nbytes=self.get_rdcc_nbytes(), swmr=True)
+			self._handles[name] = hdf_file
+
+		return hdf_file
+
+	def __getstate__(self) -> Dict[str, Any]:
+		state = dict(self.__dict__)
+		state['_handles'] = dict()
+		return state
+
+	def __setstate__(self, state: Dict[str, Any]):
+		self.__dict__.update(state)
+		self._pid = os.getpid()
+
+	def __len__(self) -> int:
+		return len(self.names)
 
 
 class Audioset(Dataset):
@@ -36,6 +289,10 @@ class Audioset(Dataset):
 		data_shape: tuple = (320000,),
 		data_key: str = 'waveform',
 		verbose: bool = False,
+		chunk_cache_nbytes: int = 256 * 1024 ** 2,
+		rdcc_total_nbytes: int = 2 * 1024 ** 3,
+		backend: str = 'hdf',
+		targets_mode: str = 'csr',
 	):
 		"""
 		A pytorch dataset of Google Audioset.
@@ -44,7 +301,7 @@ class Audioset(Dataset):
 			root (str): The directory that contain the HDF files.
 			transform: (Module) The transformation to apply on each samples.
 			version: (str) The version of the dataset, '[unbalanced | balanced | eval]'
-			rdcc_nbytes: (int) The HDF 'raw data chunk cache' in bytes. default 512 MB
+			rdcc_nbytes: (int) The maximal HDF 'raw data chunk cache' in bytes of one file. default 512 MB
 
 			data_shape: (tuple) The shape of the data contain in the HDF files
 				(320000, ) for raw audio sampled at 32000 KHz
@@ -53,10 +310,27 @@ class Audioset(Dataset):
 			data_key: (str) The key under which the data is store in the HDF files.
 				'waveform' when using the raw audio
 				'data' when using the pre-compute mel-spectrogram
+
+			chunk_cache_nbytes: (int) The memory budget in bytes of the LRU cache of the chunks read by each worker.
+				0 disable the cache. default 256 MB
+
+			rdcc_total_nbytes: (int) The HDF 'raw data chunk cache' budget shared by all the opened files of all the
+				workers. The HDF files are opened lazily by each worker. default 2 GB
+
+			backend: (str) The storage read, '[hdf | memmap]'. default 'hdf'
+				'hdf' read the HDF files.
+				'memmap' read the flat arrays built by sslh.datasets.ads_memmap.convert_hdf_to_memmap with numpy.memmap,
+				each sample is a zero-copy slice of the array.
+
+			targets_mode: (str) How the targets are held in memory, '[csr | mmap | dense]'. default 'csr'
+				'csr' keep the classes of each sample in a CSR layout (cached in a '_csr.npz' file next to the targets).
+				'mmap' map the targets file with numpy, the pages are shared by all the processes.
+				'dense' load the dense boolean array.
 		"""
 		self.transform = transform
 		self.version = version
 		self.rdcc_nbytes = rdcc_nbytes
+		self.rdcc_total_nbytes = rdcc_total_nbytes
 		self.hdf_root = root
 		self.data_shape = data_shape
 		self.verbose = verbose
@@ -64,21 +338,44 @@ class Audioset(Dataset):
 		if self.version not in ['balanced', 'unbalanced', 'eval']:
 			raise ValueError('version available: "unbalanced", "balanced" and "eval"')
 
+		if backend not in BACKENDS:
+			raise ValueError(f'Invalid backend "{backend}". Must be one of {BACKENDS}.')
+		self.backend = backend
+
+		if targets_mode not in TARGETS_MODES:
+			raise ValueError(f'Invalid targets mode "{targets_mode}". Must be one of {TARGETS_MODES}.')
+		self.targets_mode = targets_mode
+
 		# HDF dataset name change if you use pre-compute feature
 		self.data_key = data_key
 
-		# variable to manage the hdf files
-		self.hdf_mapper = dict()
+		# variable to manage the hdf files (opened lazily in each worker)
+		self.hdf_mapper = HDFHandlePool(root, rdcc_total_nbytes, rdcc_nbytes)
 		self.hdf_n_row = dict()
 		self.hdf_n_chunk = dict()
 		self.hdf_chunk_size = None
 
-		# store all targets and all audio_names for faster loading
+		# global index of the samples, built once by _prepare_hdfs
+		self.hdf_names = []
+		self.hdf_row_offsets = None
+
+		# store all targets for faster loading, the audio_names are loaded on first access
 		self.targets = None
-		self.audio_names = None
+		self._targets_path = None
+		self._audio_names = None
+
+		# keep the last chunks read in memory, neighbour samples are read from the same chunk
+		self.chunk_cache = ChunkLRUCache(chunk_cache_nbytes)
+
+		# flat data array of the memmap backend (opened lazily in each worker)
+		self._memmap_data = None
 
-		self._check_hdf()
-		self._prepare_hdfs()
+		if self.backend == 'hdf':
+			self._check_hdf()
+			self._prepare_hdfs()
+		else:
+			self._check_memmap()
+			self._prepare_memmap()
 		self._errors()
 
 	def _errors(self):
@@ -110,9 +407,83 @@ class Audioset(Dataset):
 	# add verification for HDF files
 	# total number of row
 
+	def _check_memmap(self):
+		for path in get_memmap_paths(self.hdf_root, self.version, self.data_key):
+			if not os.path.isfile(path):
+				raise RuntimeError(
+					f'Memmap backend file doesn\'t exist. Please create it with convert_hdf_to_memmap. (path={path})'
+				)
+
+	def _prepare_memmap(self):
+		"""Read the sidecar index of the memmap backend.
+
+		The index keeps the HDF files names and valid rows of the converted files,
+		so the global indexes are identical with both backends.
+		"""
+		_, targets_path, index_path = get_memmap_paths(self.hdf_root, self.version, self.data_key)
+
+		with np.load(index_path) as index:
+			self.hdf_chunk_size = int(index['chunk_size'])
+			for name, n_row in zip(index['hdf_names'], index['hdf_n_rows']):
+				self.hdf_n_row[str(name)] = int(n_row)
+				self.hdf_n_chunk[str(name)] = int(n_row) // self.hdf_chunk_size
+
+		self._build_index()
+		self.targets = self._load_targets(targets_path)
+
+	def _get_memmap_data(self) -> np.ndarray:
+		if self._memmap_data is None:
+			data_path, _, _ = get_memmap_paths(self.hdf_root, self.version, self.data_key)
+			self._memmap_data = np.load(data_path, mmap_mode='r')
+		return self._memmap_data
+
+	def __getstate__(self) -> Dict[str, Any]:
+		# The memmap is reopened by the process which unpickle the dataset instead of copying the data
+		state = dict(self.__dict__)
+		state['_memmap_data'] = None
+		state['_audio_names'] = None
+		if isinstance(self.targets, np.memmap):
+			state['targets'] = None
+		return state
+
+	def __setstate__(self, state: Dict[str, Any]):
+		self.__dict__.update(state)
+		if self.targets is None and self.targets_mode == 'mmap' and self._targets_path is not None:
+			self.targets = np.load(self._targets_path, mmap_mode='r')
+
+	@property
+	def audio_names(self) -> Optional[np.ndarray]:
+		"""The names of the audio files of 'audio_names.npy', loaded on first access."""
+		if self._audio_names is None:
+			audio_names_path = os.path.join(self.hdf_root, 'audio_names.npy')
+			if os.path.isfile(audio_names_path):
+				self._audio_names = np.load(audio_names_path)
+		return self._audio_names
+
+	def _load_targets(self, dense_path: str):
+		"""Load the dense targets file according to targets_mode."""
+		self._targets_path = dense_path
+
+		if self.targets_mode == 'dense':
+			return np.load(dense_path)
+		elif self.targets_mode == 'mmap':
+			return np.load(dense_path, mmap_mode='r')
+
+		csr_path = f'{os.path.splitext(dense_path)[0]}_csr.npz'
+		if os.path.isfile(csr_path) and os.path.getmtime(csr_path) >= os.path.getmtime(dense_path):
+			return CSRTargets.load(csr_path)
+
+		targets = CSRTargets.from_dense(np.load(dense_path, mmap_mode='r'))
+		try:
+			targets.save(csr_path)
+		except OSError as err:
+			logging.warning(f'Cannot write the CSR targets file "{csr_path}". ({err})')
+		return targets
+
 	def _prepare_hdfs(self):
-		"""Open and get some statistic from the HDF files.
+		"""Get some statistic from the HDF files.
 
+		The files are closed once the statistics are read, each process will reopen them through the pool.
 		The HDF file being divided into chunk of size n, If the last chunk is incomplete
 		it will not be taken into consideration.""
 		"""
@@ -135,33 +506,72 @@ class Audioset(Dataset):
 			print(self.version[:3])
 			print(hdf_names)
 
-		name = None
 		for name in hdf_names:
 			path = os.path.join(self.hdf_root, name)
 
-			hdf_file = h5py.File(path, 'r', rdcc_nbytes=self.rdcc_nbytes, swmr=True)
-			n_row, n_chunk = get_chunk_valid_stat(hdf_file)
+			with h5py.File(path, 'r', swmr=True) as hdf_file:
+				n_row, n_chunk = get_chunk_valid_stat(hdf_file)
+				self.hdf_chunk_size = hdf_file['audio_name'].chunks[0]
 
-			self.hdf_mapper[name] = hdf_file
+			self.hdf_mapper.add(name)
 			self.hdf_n_row[name] = n_row
 			self.hdf_n_chunk[name] = n_chunk
 
-		self.hdf_chunk_size = self.hdf_mapper[name]['audio_name'].chunks[0]
-
-		targets_path = os.path.join(self.hdf_root, 'targets.npy')
-		self.targets = np.load(targets_path)[()]
+		self._build_index()
 
-		audio_names_path = os.path.join(self.hdf_root, 'audio_names.npy')
-		self.audio_names = np.load(audio_names_path)
+		# targets.npy contains the targets of the unbalanced set, the other versions use the cache of get_all_targets
+		if self.version == 'unbalanced':
+			self.targets = self._load_targets(os.path.join(self.hdf_root, 'targets.npy'))
+		else:
+			self.targets = self._load_targets_cache()
 
 	def _close_hdfs(self):
-		for hdf_file in self.hdf_mapper.values():
-			hdf_file.close()
+		self.hdf_mapper.close()
 
-		self.hdf_mapper = dict()
+		self.hdf_mapper = HDFHandlePool(self.hdf_root, self.rdcc_total_nbytes, self.rdcc_nbytes)
 		self.hdf_n_row = dict()
 		self.hdf_n_chunk = dict()
 		self.hdf_chunk_size = None
+		self.hdf_names = []
+		self.hdf_row_offsets = None
+		self.chunk_cache.clear()
+
+	def _build_index(self):
+		"""Build the global index of the dataset.
+
+		hdf_row_offsets[i] is the global index of the first row of the i-th HDF file, and the last value
+		is the total number of rows. The location of any sample is then found with a single searchsorted.
+		"""
+		self.hdf_names = list(self.hdf_n_row.keys())
+		n_rows = [self.hdf_n_row[name] for name in self.hdf_names]
+		self.hdf_row_offsets = np.concatenate(([0], np.cumsum(n_rows))).astype(np.int64)
+
+	def locate(self, indices) -> Tuple[np.ndarray, np.ndarray]:
+		"""Find the HDF files and the local rows of several samples at once.
+
+		Args:
+			indices: (int | list | np.ndarray) The global indexes of the samples.
+
+		Returns:
+			tuple: (hdf_indexes, local_rows), hdf_indexes[i] is the position of the file in self.hdf_names.
+		"""
+		indices = np.asarray(indices, dtype=np.int64)
+		n_total_row = self.hdf_row_offsets[-1]
+
+		invalid = (indices < 0) | (indices >= n_total_row)
+		if np.any(invalid):
+			raise IndexError(
+				f'Invalid sample indexes {indices[invalid][:10].tolist()} for AudioSet.locate() method. '
+				f'(detail: len(dataset)={n_total_row})'
+			)
+
+		hdf_indexes = np.searchsorted(self.hdf_row_offsets, indices, side='right') - 1
+		local_rows = indices - self.hdf_row_offsets[hdf_indexes]
+		return hdf_indexes, local_rows
+
+	def _locate_one(self, sample_idx: int) -> Tuple[str, int]:
+		hdf_indexes, local_rows = self.locate(sample_idx)
+		return self.hdf_names[int(hdf_indexes)], int(local_rows)
 
 	def __getitem__(self, sample_idx: int) -> Tuple[Tensor, Tensor]:
 		"""Recover one filefrom the Audioset dataset.
@@ -173,15 +583,21 @@ class Audioset(Dataset):
 		containing inside this chunk will be drastically faster.
 		Feeding the sample index to the dataset with respect to this optimization is done using the batch sampler bellow
 		"""
+		if self.backend == 'memmap':
+			# Copy to numpy arrays, like the HDF backend, so the transforms receive the same types
+			data = np.array(self._get_memmap_data()[sample_idx])
+			target = np.array(self.targets[sample_idx])
+			return self._apply_transform(data), target
+
 		# 1 - Find in which HDF file and which chunk is the sample
-		hdf_file, chunk_idx, _ = self._get_location(sample_idx)
+		hdf_file, chunk_idx, hdf_name = self._get_location(sample_idx)
 
 		# 2 - Read the complete chunk (will be store in memory)
-		data, targets = self._read_chunk(hdf_file, chunk_idx)
+		data, targets = self._read_chunk_cached(hdf_file, chunk_idx, hdf_name)
 
-		# 3 - Keep only the wanted file
+		# 3 - Keep only the wanted file (copy to not share memory with the cached chunk)
 		sample_chunk_pos = sample_idx % self.hdf_chunk_size
-		data, target = data[sample_chunk_pos], targets[sample_chunk_pos]
+		data, target = data[sample_chunk_pos].copy(), targets[sample_chunk_pos].copy()
 
 		# 4 - Apply Transformation
 		data = self._apply_transform(data)
@@ -189,56 +605,183 @@ class Audioset(Dataset):
 		return data, target
 
 	def _get_location(self, sample_idx: int) -> Tuple[h5py.File, int, str]:
-		hdf_names = list(self.hdf_mapper.keys())
-		cumulative_n_chunk = np.cumsum(list(self.hdf_n_chunk.values()))
-
-		# find the chunk which contain the sample (at the dataset level)
-		global_chunk_idx = sample_idx // self.hdf_chunk_size
-
-		# Find in which HDF file the chunk is
-		for i in range(len(cumulative_n_chunk)):
-			if global_chunk_idx < cumulative_n_chunk[i]:
-				if i == 0:
-					local_chunk_idx = global_chunk_idx
-					hdf_name = hdf_names[i]
-					return self.hdf_mapper[hdf_name], local_chunk_idx, hdf_name
-
-				else:
-					local_chunk_idx = global_chunk_idx - cumulative_n_chunk[i - 1]
-					hdf_name = hdf_names[i]
-					return self.hdf_mapper[hdf_name], local_chunk_idx, hdf_name
-
-		raise RuntimeError(
-			f'Invalid sample_idx={sample_idx} for AudioSet._get_location() method, cannot find the corresponding HDF file.'
-			f'(detail: global_chunk_idx={global_chunk_idx}, len(cumulative_n_chunk)={len(cumulative_n_chunk)}, '
-			f'len(dataset)={len(self)}, len(dataset.targets)={len(self.targets)})'
-		)
+		hdf_name, local_row = self._locate_one(sample_idx)
+		local_chunk_idx = local_row // self.hdf_chunk_size
+		return self.hdf_mapper[hdf_name], local_chunk_idx, hdf_name
 
 	def _read_chunk(self, hdf_file, chunk_idx) -> Tuple[np.ndarray, np.ndarray]:
 		start = chunk_idx * self.hdf_chunk_size
 		end = start + self.hdf_chunk_size
 
 		targets = np.zeros(shape=(self.hdf_chunk_size, 527), dtype=bool)
-		waveforms = np.zeros(shape=(self.hdf_chunk_size, *self.data_shape), dtype=np.int16)
+		# int16 for raw waveforms, float for pre-computed spectrograms
+		waveforms = np.zeros(shape=(self.hdf_chunk_size, *self.data_shape), dtype=hdf_file[self.data_key].dtype)
 
 		hdf_file['target'].read_direct(targets, slice(start, end), None)
 		hdf_file[self.data_key].read_direct(waveforms, slice(start, end), None)
 
 		return waveforms, targets
 
+	def _read_chunk_cached(self, hdf_file, chunk_idx, hdf_name: str) -> Tuple[np.ndarray, np.ndarray]:
+		key = (hdf_name, int(chunk_idx))
+		chunk = self.chunk_cache.get(key)
+
+		if chunk is None:
+			chunk = self._read_chunk(hdf_file, chunk_idx)
+			self.chunk_cache.put(key, chunk)
+
+		return chunk
+
+	def get_chunk_cache_stats(self) -> Dict[str, Any]:
+		"""Returns the hits, misses and memory usage of the chunk cache of the current process."""
+		return self.chunk_cache.get_stats()
+
 	def get_data(self, sample_idx: int):
 		"""To call if need to read only one sample from the hdf file"""
-		hdf_file, chunk_idx, hdf_name = self._get_location(sample_idx)
+		if self.backend == 'memmap':
+			return np.array(self._get_memmap_data()[sample_idx])
 
-		hdf_sample_idx = sample_idx % self.hdf_n_row[hdf_name]
-		return hdf_file[self.data_key][hdf_sample_idx]
+		hdf_name, hdf_sample_idx = self._locate_one(sample_idx)
+		return self.hdf_mapper[hdf_name][self.data_key][hdf_sample_idx]
 
 	def get_target(self, sample_idx: int):
-		"""To call if need to read only the labels of one sample"""
-		hdf_file, chunk_idx, hdf_name = self._get_location(sample_idx)
+		"""To call if need to read only the labels of one sample.
+
+		The HDF file is read only when the targets are not in memory, see get_all_targets.
+		"""
+		if self._targets_in_memory():
+			return self.targets[sample_idx]
+
+		hdf_name, hdf_sample_idx = self._locate_one(sample_idx)
+		return self.hdf_mapper[hdf_name]['target'][hdf_sample_idx]
+
+	def _targets_in_memory(self) -> bool:
+		return self.targets is not None
+
+	def get_all_targets(self) -> np.ndarray:
+		"""Returns the targets of all the samples, in the order of the global indexes.
+
+		When the targets are not already loaded, the 'target' dataset of each HDF file is read
+		with a single read_direct call. The result is cached in the file '{version}_targets.npy'
+		next to the HDF files (the targets file of the memmap backend), so the next runs only map it.
+		"""
+		if self._targets_in_memory():
+			return self.targets
+
+		targets = np.empty((len(self), self.N_CLASSES), dtype=bool)
+		for hdf_idx, name in enumerate(self.hdf_names):
+			start, end = self.hdf_row_offsets[hdf_idx], self.hdf_row_offsets[hdf_idx + 1]
+			# The rows of the incomplete last chunk are not read
+			self.hdf_mapper[name]['target'].read_direct(targets, np.s_[0:end - start], np.s_[start:end])
+
+		if self._save_targets_cache(targets):
+			self.targets = self._load_targets_cache()
+		elif self.targets_mode == 'csr':
+			self.targets = CSRTargets.from_dense(targets)
+		else:
+			self.targets = targets
+		return self.targets
+
+	def _load_targets_cache(self) -> Optional[np.ndarray]:
+		_, targets_path, _ = get_memmap_paths(self.hdf_root, self.version, self.data_key)
+		if not os.path.isfile(targets_path):
+			return None
+
+		shape = np.load(targets_path, mmap_mode='r').shape
+		if shape != (len(self), self.N_CLASSES):
+			logging.warning(f'Ignore the targets file "{targets_path}" of shape {shape}.')
+			return None
 
-		hdf_sample_idx = sample_idx % self.hdf_n_row[hdf_name]
-		return hdf_file['target'][hdf_sample_idx]
+		# The HDF files can be regenerated with the same number of rows
+		signature_path = get_targets_signature_path(self.hdf_root, self.version)
+		if not os.path.isfile(signature_path):
+			logging.info(f'Ignore the targets file "{targets_path}" without signature.')
+			return None
+		with np.load(signature_path) as signature:
+			saved = {key: signature[key] for key in signature.files}
+		current = self._get_hdf_signature()
+		if saved.keys() != current.keys() or not all(np.array_equal(saved[key], current[key]) for key in current):
+			logging.warning(f'Ignore the targets file "{targets_path}" built from different HDF files.')
+			return None
+
+		return self._load_targets(targets_path)
+
+	def _save_targets_cache(self, targets: np.ndarray) -> bool:
+		_, targets_path, _ = get_memmap_paths(self.hdf_root, self.version, self.data_key)
+		signature_path = get_targets_signature_path(self.hdf_root, self.version)
+		tmp_path = f'{targets_path}.{os.getpid()}.tmp.npy'
+		tmp_signature_path = f'{signature_path}.{os.getpid()}.tmp.npz'
+		try:
+			# The signature is removed first, so an interrupted save leaves an invalid cache
+			if os.path.isfile(signature_path):
+				os.remove(signature_path)
+			np.save(tmp_path, targets)
+			os.replace(tmp_path, targets_path)
+			np.savez(tmp_signature_path, **self._get_hdf_signature())
+			os.replace(tmp_signature_path, signature_path)
+			return True
+		except OSError as err:
+			logging.warning(f'Cannot write the targets file "{targets_path}". ({err})')
+			return False
+
+	def _get_hdf_signature(self) -> Dict[str, np.ndarray]:
+		"""Returns the names, sizes and modification times of the HDF files, in the order of the global indexes."""
+		stats = [os.stat(os.path.join(self.hdf_root, name)) for name in self.hdf_names]
+		return {
+			'hdf_names': np.asarray(self.hdf_names, dtype=str),
+			'sizes': np.asarray([stat.st_size for stat in stats], dtype=np.int64),
+			'mtimes': np.asarray([stat.st_mtime_ns for stat in stats], dtype=np.int64),
+		}
+
+	def get_items(self, indices: List[int]) -> List[Tuple[Any, np.ndarray]]:
+		"""Recover a batch of files from the Audioset dataset.
+
+		The indexes are grouped by HDF file and sorted, then the rows of each file are read with a single
+		h5py call (a slice when the rows are contiguous, a fancy-indexed read otherwise).
+		The samples are returned in the same order than indices.
+		"""
+		data, targets = self._read_rows(indices)
+		return [(self._apply_transform(data_i), target_i) for data_i, target_i in zip(data, targets)]
+
+	def __getitems__(self, indices: List[int]) -> List[Tuple[Any, np.ndarray]]:
+		return self.get_items(indices)
+
+	def _read_rows(self, indices: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+		indices = np.asarray(indices, dtype=np.int64)
+		if self.backend == 'memmap':
+			return self._get_memmap_data()[indices], np.asarray(self.targets[indices])
+
+		hdf_indexes, local_rows = self.locate(indices)
+		targets_in_memory = self._targets_in_memory()
+
+		data = None
+		if targets_in_memory:
+			targets = np.asarray(self.targets[indices])
+		else:
+			targets = np.empty((len(indices), self.N_CLASSES), dtype=bool)
+
+		for hdf_idx in np.unique(hdf_indexes):
+			mask = hdf_indexes == hdf_idx
+			hdf_file = self.hdf_mapper[self.hdf_names[hdf_idx]]
+
+			# h5py requires increasing and unique indexes, the duplicates are restored with the inverse mapping
+			rows, inverse = np.unique(local_rows[mask], return_inverse=True)
+
+			hdf_data = self._read_hdf_rows(hdf_file[self.data_key], rows)
+			if data is None:
+				data = np.empty((len(indices), *hdf_data.shape[1:]), dtype=hdf_data.dtype)
+			data[mask] = hdf_data[inverse]
+
+			if not targets_in_memory:
+				targets[mask] = self._read_hdf_rows(hdf_file['target'], rows)[inverse]
+
+		return data, targets
+
+	@staticmethod
+	def _read_hdf_rows(hdf_dataset: h5py.Dataset, rows: np.ndarray) -> np.ndarray:
+		if rows[-1] - rows[0] + 1 == len(rows):
+			return hdf_dataset[rows[0]:rows[-1] + 1]
+		return hdf_dataset[rows]
 
 	def _apply_transform(self, data):
 		if self.transform is None:
@@ -248,20 +791,15 @@ class Audioset(Dataset):
 		data = data.squeeze()
 		return data
 
-	@functools.lru_cache(maxsize=1)
 	def __len__(self) -> int:
-		n_total_row = sum(list(self.hdf_n_row.values()))
-		return n_total_row
+		return int(self.hdf_row_offsets[-1])
 
 
 class SingleAudioset(Audioset):
 	def __getitem__(self, sample_idx: int) -> Tuple[Tensor, Tensor]:
 		"""Recover one file from the Audioset dataset.
 		"""
-		# 1 - Find in which HDF file and which chunk is the sample
-		hdf_file, chunk_idx, _ = self._get_location(sample_idx)
-
-		# 2 - recove only the required file (don't read the chunk)
+		# 1 - recover only the required file (don't read the chunk)
 		data = self.get_data(sample_idx)
 		target = self.get_target(sample_idx)
 
@@ -282,71 +820,62 @@ class SingleBalancedSampler(Sampler):
 	):
 		super().__init__(None)
 		self.dataset = dataset
-		self.index_list = index_list
+		self.index_list = np.asarray(index_list, dtype=np.int64)
 		self.n_max_iterations = n_max_iterations
 		self.shuffle = shuffle
 		self.verbose = verbose
 
-		self.all_targets = self._get_all_targets()
-		self.sorted_sample_indexes = self._sort_per_class()
+		self.class_indptr, self.class_indexes = self._sort_per_class()
 
-	def _get_all_targets(self):
-		""" Pre-fetch all the labels corresponding to the dataset samples.
+	def _get_positive_pairs(self, n_rows_per_step: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+		""" Pre-fetch the (position in self.index_list, class) pairs of the positive labels of the samples.
 		It will be used to balance the dataset.
-		The list returned is in the same order than self.index_list
+		The CSR targets are read directly, the other targets are read a few rows at a time.
 		"""
 		if self.verbose:
 			print('Getting all target')
-		if self.dataset.targets is not None:
-			return self.dataset.targets
-
-		return [self.dataset.get_target(idx) for idx in tqdm.tqdm(self.index_list)]
-
-	def _sort_per_class(self):
-		""" Pre-sort all the sample among the 527 different class.
+		all_targets = self.dataset.get_all_targets()
+		if isinstance(all_targets, CSRTargets):
+			return all_targets.nonzero(self.index_list)
+
+		rows, classes = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+		for start in range(0, len(self.index_list), n_rows_per_step):
+			block = np.asarray(all_targets[self.index_list[start:start + n_rows_per_step]])
+			block_rows, block_classes = np.nonzero(block)
+			rows.append(block_rows + start)
+			classes.append(block_classes)
+		return np.concatenate(rows), np.concatenate(classes)
+
+	def _sort_per_class(self) -> Tuple[np.ndarray, np.ndarray]:
+		""" Pre-sort all the sample among the 527 different class in a CSR layout.
+		The indexes of the class c are class_indexes[class_indptr[c]:class_indptr[c + 1]].
 		It will used to pick the correct file to feed the model
 		"""
 		if self.verbose:
 			print('Sort the classes')
-		class_indexes = [[] for _ in range(527)]
-		class_indexes: List[List[int]]
+		rows, classes = self._get_positive_pairs()
+		class_indptr, class_indexes = get_indexes_per_class_csr(rows, classes, self.index_list, Audioset.N_CLASSES)
 
-		for idx, (sample_idx, target) in enumerate(zip(self.index_list, self.all_targets)):
-			target_idx = np.where(target == 1)[0]
-
-			for t_idx in target_idx:
-				class_indexes[t_idx].append(sample_idx)
-		
 		# Check if a class has no indexes
-		empty_classes = [cls_idx for cls_idx, indexes in enumerate(class_indexes) if len(indexes) == 0]
+		empty_classes = np.where(np.diff(class_indptr) == 0)[0].tolist()
 		if len(empty_classes) > 0:
 			logging.warning(f'Found at least 1 class without any indexes. (classes={str(empty_classes)})')
 
-		return class_indexes
-
-	def _shuffle(self):
-		# Sort the file for each class
-		for indexes in self.sorted_sample_indexes:
-			random.shuffle(indexes)
-
-		# Sort the class order
-		random.shuffle(self.sorted_sample_indexes)
+		return class_indptr, class_indexes
 
 	def __iter__(self) -> Iterable[int]:
 		""" Round Robin algorithm to fetch file one by one from each class.
+		The n_max_iterations indexes of the epoch are generated at once.
 		"""
-		if self.shuffle:
-			self._shuffle()
+		class_order = np.where(np.diff(self.class_indptr) > 0)[0]
 
-		global_index = 0
-		for cls_idx in itertools.cycle(range(527)):
-			selected_class = self.sorted_sample_indexes[cls_idx]
-			if len(selected_class) == 0:
-				continue
-			local_idx = global_index % len(selected_class)
-			global_index += 1
+		if self.shuffle:
+			# Shuffle the files of each class and the class order
+			self.class_indexes = shuffle_per_class(self.class_indptr, self.class_indexes)
+			class_order = np.random.permutation(class_order)
 
-			yield selected_class[local_idx]
+		indexes = round_robin_per_class(self.class_indptr, self.class_indexes, class_order, self.n_max_iterations)
+		return iter(indexes)
 
 	def __len__(self) -> int:
 		return self.n_max_iterations
@@ -417,7 +946,106 @@ class ChunkAlignSampler(Sampler):
 		return sum(map(len, self.hdf_batches))
 
 
-def batch_balancer(pool_size: int = 100, batch_size: int = 64, verbose: bool = False):
+class BatchBalancer:
+	"""Stochastic batch balancing with a pool of samples stored in numpy buffers.
+
+	The pool has a fixed capacity and a mask of its valid slots, and keeps the number of
+	samples of each class, so the search of a replacement sample is a vectorised mask.
+	It can be used as collate_fn with a list of samples, or be applied to a batch already
+	stacked into tensors (e.g. the output of a BatchTransformDataset).
+
+	Args:
+		pool_size (int): The number of samples to keep in the pool.
+		repeat (int): The maximal number of samples replaced in each batch.
+	"""
+
+	def __init__(self, pool_size: int = 100, repeat: int = 57):
+		self.pool_size = pool_size
+		self.repeat = repeat
+
+		self.pool_x = None
+		self.pool_y = None
+		self.pool_valid = None
+		self.pool_age = None
+		self.pool_class_counts = None
+		self.n_pool = 0
+		self.n_pushed = 0
+
+	def __call__(self, batch) -> Tuple[Tensor, Tensor]:
+		if isinstance(batch[0], Tensor):
+			xs, ys = batch
+		else:
+			xs, ys = default_collate(batch)
+
+		# Copy for not modifying the input batch
+		x = np.array(xs)
+		y = np.array(ys)
+
+		if self.pool_x is None:
+			self._allocate(x, y)
+
+		# If the pool is not full, can't perform balancing
+		if self.n_pool < self.pool_size:
+			self._push(x, y)
+
+		class_sum = np.count_nonzero(y, axis=0)
+
+		# Find the class that is over-represented
+		for _ in range(self.repeat):
+			class_idx = np.argmax(class_sum)
+			to_remove = np.flatnonzero(y[:, class_idx])
+
+			# chose a file from the pool that is not from the class.
+			# consume the pool's sample to unsure the file isn't present twice
+			pool_idx = self._pop_first_neg(class_idx) if len(to_remove) > 0 else None
+			if pool_idx is None:
+				# The batch and the pool will not change anymore
+				break
+
+			to_remove = np.random.choice(to_remove)
+			class_sum -= y[to_remove] != 0
+			x[to_remove] = self.pool_x[pool_idx]
+			y[to_remove] = self.pool_y[pool_idx]
+			class_sum += y[to_remove] != 0
+
+		return torch.from_numpy(x), torch.from_numpy(y)
+
+	def _allocate(self, x: np.ndarray, y: np.ndarray):
+		# The pool is filled with a complete batch while it contains less than pool_size samples
+		capacity = self.pool_size + len(x)
+		self.pool_x = np.zeros((capacity, *x.shape[1:]), dtype=x.dtype)
+		self.pool_y = np.zeros((capacity, *y.shape[1:]), dtype=y.dtype)
+		self.pool_valid = np.zeros(capacity, dtype=bool)
+		self.pool_age = np.zeros(capacity, dtype=np.int64)
+		self.pool_class_counts = np.zeros(y.shape[1], dtype=np.int64)
+
+	def _push(self, x: np.ndarray, y: np.ndarray):
+		slots = np.flatnonzero(~self.pool_valid)[:len(x)]
+		n_samples = len(slots)
+
+		self.pool_x[slots] = x[:n_samples]
+		self.pool_y[slots] = y[:n_samples]
+		self.pool_valid[slots] = True
+		self.pool_age[slots] = np.arange(self.n_pushed, self.n_pushed + n_samples)
+		self.pool_class_counts += np.count_nonzero(y[:n_samples], axis=0)
+		self.n_pool += n_samples
+		self.n_pushed += n_samples
+
+	def _pop_first_neg(self, class_idx: int) -> Optional[int]:
+		"""Remove the oldest sample of the pool which is not from the class and returns its slot."""
+		if self.n_pool - self.pool_class_counts[class_idx] <= 0:
+			return None
+
+		candidates = np.flatnonzero(self.pool_valid & (self.pool_y[:, class_idx] == 0))
+		pool_idx = candidates[np.argmin(self.pool_age[candidates])]
+
+		self.pool_valid[pool_idx] = False
+		self.pool_class_counts -= self.pool_y[pool_idx] != 0
+		self.n_pool -= 1
+		return pool_idx
+
+
+def batch_balancer(pool_size: int = 100, batch_size: int = 64, verbose: bool = False) -> BatchBalancer:
 	"""Stochastic batch balancing.
 
 	Audioset is a very unbalanced dataset. The ratio between the least represented and
@@ -425,8 +1053,8 @@ def batch_balancer(pool_size: int = 100, batch_size: int = 64, verbose: bool = F
 	Using a pool of samples, the balancer find the class that is the most represented
 	inside the current minibatch and replace a certain number of these samples by some
 	present in the pool. The process can be repeat to further balance the batch.
-	The random aspect of the batch make it imperfect but its execution is very fast,
-	impact on training speed is minimum but impact on score is great.
+	The random aspect of the batch make it imperfect but the pool is stored in numpy
+	buffers with per-class counts, so its cost stays small even with large batches.
 	Experiment shown that the ratio f a mini-batch could go from 0.07 up to 0.8.
 
 	The balancing is do that why in order to keep the efficiency of chunked HDF files
@@ -449,43 +1077,7 @@ def batch_balancer(pool_size: int = 100, batch_size: int = 64, verbose: bool = F
 	if verbose:
 		print(f'parameters "repeat" set to: {repeat}')
 
-	def balance(data: list):
-
-		def get_first_neg(idx):
-			for i in range(len(balance.pool_y)):
-				if balance.pool_y[i][idx] == 0:
-					return i
-			return None
-
-		x = np.asarray([d[0] for d in data])
-		y = np.asarray([d[1] for d in data])
-
-		# If the pool is not full, can't perform balancing
-		if len(balance.pool_y) < pool_size:
-			balance.pool_x.extend(x)
-			balance.pool_y.extend(y)
-
-		# Find the class that is over-represented
-		for _ in range(repeat):
-			class_idx = np.argmax(np.sum(y, axis=0))
-			to_remove = np.where(y[:, class_idx] == 1)[0]
-
-			if len(to_remove != 0):
-				to_remove = np.random.choice(to_remove)
-
-				# chose a file from the pool that is not from the class.
-				# consume the pool's sample to unsure the file isn't present twice
-				pool_idx = get_first_neg(class_idx)
-				if pool_idx is not None:
-					x[to_remove] = balance.pool_x.pop(pool_idx)
-					y[to_remove] = balance.pool_y.pop(pool_idx)
-
-		return torch.from_numpy(x), torch.from_numpy(y)
-
-	balance.pool_x = []
-	balance.pool_y = []
-
-	return balance
+	return BatchBalancer(pool_size, repeat)
 
 
 # =============================================================================
@@ -493,22 +1085,17 @@ def batch_balancer(pool_size: int = 100, batch_size: int = 64, verbose: bool = F
 #      SUBSET SPLIT FUNCTIONS
 #
 # =============================================================================
-@functools.lru_cache(maxsize=5)
-def get_all_targets(dataset: Audioset):
+def get_all_targets(dataset: Audioset) -> np.ndarray:
 	"""Load the targets corresponding to the version of the dataset used.
 
 	When using unbalanced set, the targets are loaded from a file for performance reason
-	When using balanced set, the targets are fetch directly from the the HDF file 1 by 1
+	For the other sets, the targets are read with one call per HDF file and cached, see Audioset.get_all_targets
+	The targets are returned as a dense array.
 	"""
-	all_targets = []
-
-	if dataset.version == 'unbalanced':
-		return dataset.targets
-
-	for i in trange(len(dataset)):
-		all_targets.append(dataset.get_target(i))
-
-	return all_targets
+	targets = dataset.get_all_targets()
+	if isinstance(targets, CSRTargets):
+		return targets.to_dense()
+	return np.asarray(targets)
 
 
 def get_class_sum(all_targets, batch_indexes: list) -> np.ndarray:
@@ -573,30 +1160,24 @@ def class_balance_split(
 	unsupervised_ratio: Optional[float] = None,
 	batch_size: int = 64,
 	verbose: bool = False,
-) -> Tuple[List[int], List[int]]:
+	seed: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
 	"""Perform supervised / unsupervised split 'equally' distributed within each class.
-	In order to achieve some balancing, the 'chunked' HDf features can't be used. Each files
-	will be fetch individually. The speed will be greatly reduce.
-	"""
-
-	def fill_subset(remaining_samples: list, expected: np.ndarray):
-		subset_occur = np.zeros(shape=(527,))
-		subset = []
 
-		with tqdm.tqdm(total=sum(expected)) as progress:
-			for class_idx in range(527):
-				idx = 0
-				while idx < len(remaining_samples) and subset_occur[class_idx] < expected[class_idx]:
-					if remaining_samples[idx][0][class_idx] == 1:
-						target, target_idx = remaining_samples.pop(idx)
-						subset_occur += target
-						subset.append(target_idx)
-						progress.update(sum(target))
-
-					idx += 1
-
-		return np.asarray(subset), remaining_samples
+	The split is a greedy multilabel selection computed on the CSR layout of the targets, so the
+	target matrix is never densified, see greedy_multilabel_split_csr.
 
+	Args:
+		dataset (Audioset): The dataset to split.
+		supervised_ratio (float): The ratio of the supervised subset.
+		unsupervised_ratio (float): The ratio of the unsupervised subset. If None, use all the remaining samples.
+		batch_size (int): The batch size used for the statistics displayed when verbose is True.
+		verbose (bool): If True, display the class statistics of the two subsets.
+		seed (int): The seed of the order in which the samples are selected. If None, use the dataset order.
+
+	Returns:
+		The supervised and unsupervised indexes arrays.
+	"""
 	if unsupervised_ratio is None:
 		unsupervised_ratio = 1 - supervised_ratio
 
@@ -605,40 +1186,35 @@ def class_balance_split(
 	assert supervised_ratio + unsupervised_ratio <= 1.0
 
 	if supervised_ratio == 1.0:
-		return list(range(len(dataset))), []
+		return np.arange(len(dataset)), np.zeros(0, dtype=np.int64)
 
-	# get all dataset targets and compute original class distribution metrics
-	if dataset.version == 'unbalanced':
-		all_targets = dataset.targets
-	else:
-		all_targets = get_all_targets(dataset)
-	all_targets_idx = list(range(len(all_targets)))
+	# get all dataset targets in CSR layout and compute original class distribution metrics
+	all_targets = dataset.get_all_targets()
+	if not isinstance(all_targets, CSRTargets):
+		all_targets = CSRTargets.from_dense(all_targets)
 
 	# expected occurance and tolerance
-	total_occur = np.sum(all_targets, axis=0)
+	total_occur = np.bincount(all_targets.indices, minlength=all_targets.n_classes)
 	s_expected_occur = np.ceil(total_occur * supervised_ratio)
 	u_expected_occur = np.ceil(total_occur * unsupervised_ratio)
 	if verbose:
 		print('s expected occur: ', sum(s_expected_occur))
 
-	# loop through the dataset and constitute the two subset.
-	remaining_sample = list(zip(all_targets, all_targets_idx))
-	s_subset, remaining_sample = fill_subset(remaining_sample, s_expected_occur)
-	#     s_batches = _split(s_subset)
-	s_batches = s_subset
+	# constitute the two subset.
+	s_mask = greedy_multilabel_split_csr(
+		all_targets.indptr, all_targets.indices, all_targets.n_classes, s_expected_occur, seed=seed
+	)
 
 	# For the unsupervised subset, if automatic set, then it is the remaining samples
 	if unsupervised_ratio + supervised_ratio == 1.0:
-		u_subset = np.asarray([s[1] for s in remaining_sample])
-
+		u_mask = ~s_mask
 	else:
-		u_subset, _ = fill_subset(remaining_sample, u_expected_occur)
-
-	#     u_batches = _split(u_subset)
-	u_batches = u_subset
+		u_mask = greedy_multilabel_split_csr(
+			all_targets.indptr, all_targets.indices, all_targets.n_classes, u_expected_occur, ~s_mask, seed=seed
+		)
 
-	s_batches = list(s_batches)
-	u_batches = list(u_batches)
+	s_batches = np.where(s_mask)[0]
+	u_batches = np.where(u_mask)[0]
 
 	if verbose:
 		batch_sampler = ChunkAlignSampler(dataset, batch_size=batch_size, shuffle=False)
@@ -670,6 +1246,53 @@ class BatchSamplerFromList(Sampler):
 		return len(self.batches)
 
 
+class BatchTransformDataset(Dataset):
+	"""Wrap an Audioset for reading a complete batch per call.
+
+	The dataset must be used with a batch sampler as sampler and batch_size=None in the DataLoader,
+	each worker call then receive the list of indexes of a batch and read it with Audioset.get_items().
+	The transforms are still applied on each sample before collate.
+
+	Args:
+		dataset (Audioset): The wrapped dataset.
+		transform (Callable): The optional transform to apply to each sample data.
+		target_transform (Callable): The optional transform to apply to each sample target.
+		with_target (bool): If False, the batches only contains the data (like mlu NoLabelDataset).
+	"""
+
+	def __init__(
+		self,
+		dataset: Audioset,
+		transform: Optional[Callable] = None,
+		target_transform: Optional[Callable] = None,
+		with_target: bool = True,
+	):
+		super().__init__()
+		self.dataset = dataset
+		self.transform = transform
+		self.target_transform = target_transform
+		self.with_target = with_target
+
+	def __getitem__(self, indices: List[int]) -> Any:
+		batch = []
+		for data, target in self.dataset.get_items(indices):
+			if self.transform is not None:
+				data = self.transform(data)
+
+			if not self.with_target:
+				batch.append(data)
+				continue
+
+			if self.target_transform is not None:
+				target = self.target_transform(target)
+			batch.append((data, target))
+
+		return default_collate(batch)
+
+	def __len__(self) -> int:
+		return len(self.dataset)
+
+
 # Supervised Dataloaders build example :
 # def get_supervised(version: str = 'unbalanced', **kwargs):
 # 	def supervised(
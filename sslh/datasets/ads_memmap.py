@@ -0,0 +1,82 @@
+"""
+	Conversion of the AudioSet (ADS) HDF files to the flat arrays read by the memmap backend of Audioset.
+"""
+
+import numpy as np
+import os
+import tqdm
+
+from typing import Optional
+
+from sslh.datasets.ads import Audioset, get_memmap_paths
+
+
+def convert_hdf_to_memmap(
+	root: str,
+	version: str,
+	data_shape: tuple = (320000,),
+	data_key: str = 'waveform',
+	dst_root: Optional[str] = None,
+	verbose: bool = True,
+):
+	"""
+		Convert the HDF files of an AudioSet version to a contiguous numpy array, a targets array and a sidecar index.
+
+		The rows are written in the same order than the global indexes of Audioset with the HDF backend, and the
+		incomplete last chunk of each file is ignored in the same way.
+
+		:param root: The directory that contain the HDF files.
+		:param version: The version of the dataset to convert, 'unbalanced', 'balanced' or 'eval'.
+		:param data_shape: The shape of the data contain in the HDF files. (default: (320000,))
+		:param data_key: The key under which the data is store in the HDF files. (default: 'waveform')
+		:param dst_root: The output directory. If None, use root. (default: None)
+		:param verbose: If True, display the progress of the conversion. (default: True)
+	"""
+	if dst_root is None:
+		dst_root = root
+	os.makedirs(dst_root, exist_ok=True)
+
+	dataset = Audioset(
+		root=root,
+		version=version,
+		data_shape=data_shape,
+		data_key=data_key,
+		chunk_cache_nbytes=0,
+		targets_mode='mmap',
+	)
+	data_path, targets_path, index_path = get_memmap_paths(dst_root, version, data_key)
+
+	n_rows = len(dataset)
+	data = None
+	targets = np.lib.format.open_memmap(targets_path, mode='w+', dtype=bool, shape=(n_rows, Audioset.N_CLASSES))
+
+	with tqdm.tqdm(total=n_rows, disable=not verbose) as progress:
+		for hdf_idx, name in enumerate(dataset.hdf_names):
+			offset = int(dataset.hdf_row_offsets[hdf_idx])
+			hdf_file = dataset.hdf_mapper[name]
+
+			if data is None:
+				dtype = hdf_file[data_key].dtype
+				data = np.lib.format.open_memmap(data_path, mode='w+', dtype=dtype, shape=(n_rows, *data_shape))
+
+			# Copy chunk by chunk to keep the memory usage bounded
+			for chunk_idx in range(dataset.hdf_n_chunk[name]):
+				start = chunk_idx * dataset.hdf_chunk_size
+				end = start + dataset.hdf_chunk_size
+				hdf_slice = slice(start, end)
+				dst_slice = slice(offset + start, offset + end)
+
+				hdf_file[data_key].read_direct(data, hdf_slice, dst_slice)
+				hdf_file['target'].read_direct(targets, hdf_slice, dst_slice)
+				progress.update(end - start)
+
+	data.flush()
+	targets.flush()
+
+	np.savez(
+		index_path,
+		hdf_names=np.asarray(dataset.hdf_names),
+		hdf_n_rows=np.asarray([dataset.hdf_n_row[name] for name in dataset.hdf_names], dtype=np.int64),
+		chunk_size=np.int64(dataset.hdf_chunk_size),
+	)
+	dataset._close_hdfs()
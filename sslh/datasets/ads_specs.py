@@ -0,0 +1,212 @@
+"""
+	Offline computation of the AudioSet (ADS) mel-spectrograms HDF files.
+
+	The HDF files produced are read by Audioset with data_key='data' and data_shape=(n_mels, n_time),
+	i.e. when the datamodules are built with pre_computed_specs=True.
+"""
+
+import h5py
+import logging
+import numpy as np
+import os
+import os.path as osp
+import shutil
+import torch
+import tqdm
+
+from concurrent.futures import ProcessPoolExecutor
+from torch.nn import Module, Sequential
+from torchaudio.transforms import MelSpectrogram, AmplitudeToDB
+from typing import Dict, Iterable, Optional, Tuple
+
+
+DONE_KEY = 'chunk_done'
+SRC_DATA_KEY = 'waveform'
+DST_DATA_KEY = 'data'
+STANDALONE_FILES = ('audio_names.npy', 'targets.npy')
+VERSIONS = ('balanced', 'eval', 'unbalanced')
+
+# Worker process state, set by _init_worker
+_transform_to_spec: Optional[Module] = None
+_n_time: Optional[int] = None
+_src_files: Dict[str, h5py.File] = {}
+
+
+def get_specs_dname(n_mels: int = 64, n_time: int = 500) -> str:
+	"""
+		:param n_mels: The number of mel bands. (default: 64)
+		:param n_time: The number of time frames. (default: 500)
+		:return: The name of the default directory of the spectrograms, e.g. 'mel_64x500'.
+	"""
+	return f'mel_{n_mels}x{n_time}'
+
+
+def get_transform_to_spec_ads(n_mels: int = 64, n_time: int = 500, n_fft: int = 2048) -> Module:
+	"""
+		Returns the waveform to spectrogram transform used by get_transform_ads when pre_computed_specs is False.
+
+		:param n_mels: The number of mel bands. (default: 64)
+		:param n_time: The number of time frames. (default: 500)
+		:param n_fft: The size of the FFT. (default: 2048)
+		:return: The transform to spectrogram as Module.
+	"""
+	waveform_length = 10  # seconds
+	sample_rate = 32000
+	hop_length = sample_rate * waveform_length // n_time
+	return Sequential(
+		MelSpectrogram(sample_rate=sample_rate, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels),
+		AmplitudeToDB(),
+	)
+
+
+def precompute_specs_ads(
+	src_root: str,
+	dst_root: Optional[str] = None,
+	versions: Iterable[str] = VERSIONS,
+	n_workers: int = 8,
+	n_mels: int = 64,
+	n_time: int = 500,
+	n_fft: int = 2048,
+	verbose: bool = True,
+):
+	"""
+		Compute the mel-spectrograms of the AudioSet waveforms HDF files.
+
+		Each HDF chunk of waveforms is converted in a process pool and written in a 'data' dataset which has the same
+		chunk size than the source file, so the HDF chunk checks of Audioset still pass.
+		The 'audio_name' and 'target' datasets and the standalone numpy files are copied.
+		A partial run is resumed : the chunks already written are skipped.
+
+		:param src_root: The directory that contain the waveforms HDF files.
+		:param dst_root: The output directory. If None, use the directory 'mel_{n_mels}x{n_time}' in src_root.
+			(default: None)
+		:param versions: The AudioSet versions to process. (default: ('balanced', 'eval', 'unbalanced'))
+		:param n_workers: The number of processes computing the spectrograms. (default: 8)
+		:param n_mels: The number of mel bands. (default: 64)
+		:param n_time: The number of time frames kept. (default: 500)
+		:param n_fft: The size of the FFT. (default: 2048)
+		:param verbose: If True, display the progress of each file. (default: True)
+	"""
+	if dst_root is None:
+		dst_root = osp.join(src_root, get_specs_dname(n_mels, n_time))
+
+	versions = list(versions)
+	for version in versions:
+		if version not in VERSIONS:
+			raise ValueError(f'Invalid version "{version}". Must be one of {VERSIONS}.')
+
+	os.makedirs(dst_root, exist_ok=True)
+
+	for fname in STANDALONE_FILES:
+		src_path = osp.join(src_root, fname)
+		dst_path = osp.join(dst_root, fname)
+		if osp.isfile(src_path) and not osp.isfile(dst_path):
+			shutil.copyfile(src_path, dst_path)
+
+	# Same selection rule than Audioset._prepare_hdfs
+	hdf_names = sorted(
+		name for name in os.listdir(src_root)
+		if '.h5' in name and any(version[:4] in name[:4] for version in versions)
+	)
+
+	executor = ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(n_mels, n_time, n_fft))
+	with executor:
+		for name in hdf_names:
+			_precompute_file(executor, osp.join(src_root, name), osp.join(dst_root, name), n_mels, n_time, verbose)
+
+
+def _precompute_file(
+	executor: ProcessPoolExecutor,
+	src_path: str,
+	dst_path: str,
+	n_mels: int,
+	n_time: int,
+	verbose: bool,
+):
+	with h5py.File(src_path, 'r', swmr=True) as src_file:
+		n_rows = len(src_file['audio_name'])
+		chunk_size = src_file['audio_name'].chunks[0]
+		n_chunks = (n_rows + chunk_size - 1) // chunk_size
+
+		with h5py.File(dst_path, 'a') as dst_file:
+			_prepare_dst_file(src_file, dst_file, n_rows, chunk_size, n_chunks, n_mels, n_time)
+			done = dst_file[DONE_KEY][()]
+
+	todo = [int(chunk_idx) for chunk_idx in np.where(~done)[0]]
+	if len(todo) == 0:
+		logging.info(f'File "{osp.basename(dst_path)}" already processed.')
+		return
+	elif len(todo) < n_chunks:
+		logging.info(f'Resume file "{osp.basename(dst_path)}" ({n_chunks - len(todo)}/{n_chunks} chunks done).')
+
+	tasks = [(src_path, chunk_idx, chunk_size) for chunk_idx in todo]
+	results = executor.map(_compute_chunk, tasks)
+
+	# Only the main process writes in the output file
+	with h5py.File(dst_path, 'a') as dst_file:
+		for chunk_idx, specs in tqdm.tqdm(results, total=len(tasks), desc=osp.basename(dst_path), disable=not verbose):
+			start = chunk_idx * chunk_size
+			dst_file[DST_DATA_KEY][start:start + len(specs)] = specs
+			dst_file[DONE_KEY][chunk_idx] = True
+			dst_file.flush()
+
+
+def _prepare_dst_file(
+	src_file: h5py.File,
+	dst_file: h5py.File,
+	n_rows: int,
+	chunk_size: int,
+	n_chunks: int,
+	n_mels: int,
+	n_time: int,
+):
+	if DST_DATA_KEY in dst_file:
+		expected_shape = (n_rows, n_mels, n_time)
+		if dst_file[DST_DATA_KEY].shape != expected_shape or DONE_KEY not in dst_file:
+			raise RuntimeError(
+				f'Cannot resume the output file "{dst_file.filename}" : found data shape '
+				f'{dst_file[DST_DATA_KEY].shape} but expected {expected_shape}.'
+			)
+		return
+
+	# Copy keep the chunk layout of the source datasets
+	for key in ('audio_name', 'target'):
+		if key not in dst_file:
+			src_file.copy(src_file[key], dst_file, name=key)
+
+	dst_file.create_dataset(
+		DST_DATA_KEY,
+		shape=(n_rows, n_mels, n_time),
+		dtype=np.float32,
+		chunks=(chunk_size, n_mels, n_time),
+	)
+	dst_file.create_dataset(DONE_KEY, data=np.zeros(n_chunks, dtype=bool))
+
+
+def _init_worker(n_mels: int, n_time: int, n_fft: int):
+	global _transform_to_spec, _n_time
+	# One thread per process, the parallelism comes from the pool
+	torch.set_num_threads(1)
+	_transform_to_spec = get_transform_to_spec_ads(n_mels, n_time, n_fft)
+	_n_time = n_time
+
+
+def _compute_chunk(task: Tuple[str, int, int]) -> Tuple[int, np.ndarray]:
+	src_path, chunk_idx, chunk_size = task
+
+	src_file = _src_files.get(src_path)
+	if src_file is None:
+		src_file = h5py.File(src_path, 'r', swmr=True)
+		_src_files[src_path] = src_file
+
+	start = chunk_idx * chunk_size
+	waveforms = src_file[SRC_DATA_KEY][start:start + chunk_size]
+
+	with torch.no_grad():
+		# Same input than get_transform_ads : the int16 values converted to float
+		specs = _transform_to_spec(torch.from_numpy(waveforms).float())
+
+	# Spectrogram shape : (chunk_size, n_mels, n_time + 1), the last frame is dropped to match data_shape
+	specs = specs[..., :_n_time]
+	return chunk_idx, specs.numpy().astype(np.float32)
+
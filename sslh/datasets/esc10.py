@@ -6,11 +6,14 @@
 		- typing & imports
 """
 
+import numpy
+
 from torch import Tensor
 from torch.nn import Module
 from typing import Optional, Tuple
 
-from sslh.datasets.esc50 import ESC50Base, FOLDS, URL, cache_feature
+from sslh.datasets.esc50 import ESC50Base, FOLDS, URL
+from sslh.datasets.utils import cache_feature
 
 
 class ESC10Base(ESC50Base):
@@ -21,9 +24,12 @@ class ESC10Base(ESC50Base):
 		root: str,
 		folds: tuple = FOLDS,
 		download: bool = False,
-		transform: Optional[Module] = None
+		transform: Optional[Module] = None,
+		cache_nbytes: int = 0,
+		verify: bool = False,
+		checksum: bool = False,
 	) -> None:
-		super().__init__(root, folds, download, transform)
+		super().__init__(root, folds, download, transform, cache_nbytes, verify, checksum)
 
 		self.url = URL['esc10-10']
 		self.n_class = 10
@@ -40,6 +46,13 @@ class ESC10Base(ESC50Base):
 		data, sampling_rate, target = super().__getitem__(index)
 		return data, sampling_rate, ESC10Base.TARGET_MAPPER[target]
 
+	def get_target(self, index: int) -> int:
+		return ESC10Base.TARGET_MAPPER[self._targets[index]]
+
+	@property
+	def targets(self) -> numpy.ndarray:
+		return numpy.asarray([ESC10Base.TARGET_MAPPER[target] for target in self._targets], dtype=numpy.int64)
+
 
 class ESC10(ESC10Base):
 	@cache_feature
@@ -14,7 +14,10 @@ from torch import Tensor
 from torch.nn import Module
 from torch.utils.data.dataset import Dataset
 from torchaudio.datasets.utils import download_url, extract_archive
-from typing import Tuple
+from typing import Dict, Tuple
+
+from sslh.datasets.manifest import load_or_build_manifest, verify_or_remove_manifest
+from sslh.datasets.utils import build_feature_cache, cache_feature
 
 # Download URL and checksums
 URL = {
@@ -40,19 +43,6 @@ AVAILABLE_VERSION = list(URL.keys())
 FOLDS = (1, 2, 3, 4, 5)
 
 
-def cache_feature(func):
-	def decorator(*args, **kwargs):
-		key = ','.join(map(str, args))
-
-		if key not in decorator.cache:
-			decorator.cache[key] = func(*args, **kwargs)
-
-		return decorator.cache[key]
-
-	decorator.cache = dict()
-	return decorator
-
-
 class ESC50Base(Dataset):
 	"""
 	ESC wrappers
@@ -63,6 +53,13 @@ class ESC50Base(Dataset):
 		download (bool, optional): If true, download the dataset from the internet
 			and puts it in root directory. If wrappers is already downloaded, it is
 			not downloaded again.
+		cache_nbytes (int, optional): The memory budget of the decoded audio cache shared
+			by the DataLoader workers, allocated in shared memory when the dataset is built.
+			0 disable the cache. default 0
+		verify (bool, optional): If true, compare the files to the manifest of a previous start
+			and rebuild the manifest if they changed. default False
+		checksum (bool, optional): If true, store the MD5 of the files in the manifest and compare
+			them when verify is true. default False
 	"""
 	NB_CLASS = 50
 
@@ -71,21 +68,29 @@ class ESC50Base(Dataset):
 		root: str,
 		folds: tuple = FOLDS,
 		download: bool = False,
-		transform: Module = None
+		transform: Module = None,
+		cache_nbytes: int = 0,
+		verify: bool = False,
+		checksum: bool = False,
 	) -> None:
 		super().__init__()
 
 		self.root = root
 		self.required_folds = folds
 		self.transform = transform
+		self.verify = verify
+		self.checksum = checksum
 
 		self.url = URL['esc10-50']
 		self.n_class = 50
 		self.target_directory = os.path.join(self.root, FOLDER_IN_ARCHIVE)
+		self.feature_cache = build_feature_cache(cache_nbytes)
 
 		# Dataset must exist to continue
 		if download:
 			self.download()
+		elif verify:
+			self.check_integrity(self.target_directory, verify, checksum)
 		# elif not self.check_integrity(self.target_directory):
 		#     raise RuntimeError('Dataset not found or corrupted. \n\
 		#         You can use download=True to download it.')
@@ -115,48 +120,72 @@ class ESC50Base(Dataset):
 	def __len__(self) -> int:
 		return len(self._filenames)
 
+	def get_target(self, index: int) -> int:
+		"""Return the target of a file from the metadata, without loading the audio."""
+		return self._targets[index]
+
+	@property
+	def targets(self) -> numpy.ndarray:
+		"""The targets of all the files, read from the metadata without loading the audio."""
+		return self._targets
+
 	def _load_metadata(self) -> None:
-		"""Read the metadata csv file and gather the information needed."""
+		"""Read the metadata from the manifest, or from the csv file if it changed, and gather the information needed."""
+		csv_path = os.path.join(self.target_directory, META_FOLDER, 'esc50.csv')
+		audio_path = os.path.join(self.target_directory, AUDIO_FOLDER)
+		manifest = load_or_build_manifest(
+			self.target_directory, 'esc50', [csv_path, audio_path], lambda: self._build_manifest(csv_path),
+			checksums=self.checksum,
+		)
+
+		self._filenames = manifest['filenames']
+		self._folds = manifest['folds']
+		self._targets = manifest['targets']
+		self._esc10s = manifest['esc10s']
+
+		# Keep only the required folds
+		folds_mask = sum([self._folds == f for f in self.required_folds]) >= 1
+
+		self._filenames = self._filenames[folds_mask]
+		self._targets = self._targets[folds_mask]
+		self._esc10s = self._esc10s[folds_mask]
+
+	def _build_manifest(self, csv_path: str) -> Dict[str, numpy.ndarray]:
 		# HEADER COLUMN NUMBER
 		c_filename = 0
 		c_fold = 1
 		c_target = 2
 		c_esc10 = 4
 
-		self._filenames = []
-		self._folds = []
-		self._targets = []
-		self._esc10s = []
+		filenames = []
+		folds = []
+		targets = []
+		esc10s = []
 
 		# Read the csv file and remove header
-		path = os.path.join(self.target_directory, META_FOLDER, 'esc50.csv')
-		with open(path, 'r') as fp:
+		with open(csv_path, 'r') as fp:
 			data = fp.read().splitlines()[1:]
 
 			for line in data:
 				items = line.split(',')
 
-				self._filenames.append(items[c_filename])
-				self._folds.append(int(items[c_fold]))
-				self._targets.append(int(items[c_target]))
-				self._esc10s.append(eval(items[c_esc10]))
-
-		self._filenames = numpy.asarray(self._filenames)
-		self._folds = numpy.asarray(self._folds)
-		self._targets = numpy.asarray(self._targets)
-		self._esc10s = numpy.asarray(self._esc10s)
+				filenames.append(items[c_filename])
+				folds.append(int(items[c_fold]))
+				targets.append(int(items[c_target]))
+				esc10s.append(items[c_esc10] == 'True')
 
-		# Keep only the required folds
-		folds_mask = sum([self._folds == f for f in self.required_folds]) >= 1
-
-		self._filenames = self._filenames[folds_mask]
-		self._targets = self._targets[folds_mask]
-		self._esc10s = self._esc10s[folds_mask]
+		return {
+			'paths': numpy.asarray([os.path.join(AUDIO_FOLDER, filename) for filename in filenames]),
+			'filenames': numpy.asarray(filenames),
+			'folds': numpy.asarray(folds),
+			'targets': numpy.asarray(targets),
+			'esc10s': numpy.asarray(esc10s),
+		}
 
 	def download(self) -> None:
 		"""Download the dataset and extract the archive"""
-		if self.check_integrity(self.target_directory):
-			print('Dataset already downloaded and verified.')
+		if self.check_integrity(self.target_directory, self.verify, self.checksum):
+			print('Dataset already downloaded.')
 
 		else:
 			if not os.path.isdir(self.root):
@@ -166,16 +195,19 @@ class ESC50Base(Dataset):
 			download_url(self.url, self.root)
 			extract_archive(archive_path, self.root)
 
-	def check_integrity(self, path, checksum=None) -> bool:
-		"""Check if the dataset already exist and if yes, if it is not corrupted.
+	def check_integrity(self, path, verify: bool = False, checksum: bool = False) -> bool:
+		"""Check if the dataset already exist.
 
 		Returns:
-			bool: False if the dataset doesn't exist or if it is corrupted.
+			bool: False if the dataset doesn't exist.
 		"""
 		if not os.path.isdir(path):
 			return False
 
-		# add checksum verification
+		# The files are compared to the manifest of a previous start only on request, with their MD5 if requested.
+		# A stale manifest is rebuilt from the files, the dataset is not downloaded again.
+		if verify:
+			verify_or_remove_manifest(path, 'esc50', checksum)
 		return True
 
 	def load_item(self, index: int) -> Tuple[Tensor, int, int]:
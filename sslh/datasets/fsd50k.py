@@ -0,0 +1,129 @@
+"""
+	FSD50K dataset with a windowed decoding of the audio files.
+
+	The dataset read the layout of the Zenodo release (the directories 'FSD50K.dev_audio', 'FSD50K.eval_audio' and
+	'FSD50K.ground_truth') and only decode the frames of the requested window instead of the whole clip.
+"""
+
+import csv
+import os.path as osp
+import random
+import soundfile
+import torch
+
+from torch import Tensor
+from torch.utils.data.dataset import Dataset
+from typing import List, Optional, Tuple
+
+
+SAMPLE_RATE = 44100
+N_CLASSES = 200
+SUBSETS = ('train', 'val', 'eval')
+ALIGNS = ('left', 'center', 'random')
+
+
+class FSD50KWindowed(Dataset):
+	def __init__(
+		self,
+		root: str,
+		subset: str,
+		window_length: Optional[int] = SAMPLE_RATE * 30,
+		align: str = 'left',
+	):
+		"""
+			FSD50K dataset which seek and read only a window of each audio file.
+
+			The offset of the window is chosen from the number of frames in the file header before any decoding, so the
+			I/O and decoding cost of an item depends on the window length instead of the file length.
+			The clips shorter than the window are returned entirely and must be padded by the transform.
+
+			:param root: The directory which contains the FSD50K directories, or its parent directory.
+			:param subset: The subset of the dataset, 'train', 'val' or 'eval'.
+			:param window_length: The number of frames read for each item.
+				If None, read the entire files. (default: 1323000, i.e. 30 seconds)
+			:param align: The position of the window in the file, 'left', 'center' or 'random'. (default: 'left')
+		"""
+		if subset not in SUBSETS:
+			raise ValueError(f'Invalid subset "{subset}". Must be one of {SUBSETS}.')
+		if align not in ALIGNS:
+			raise ValueError(f'Invalid align "{align}". Must be one of {ALIGNS}.')
+
+		super().__init__()
+		self.root = _find_dataset_dir(root)
+		self.subset = subset
+		self.window_length = window_length
+		self.align = align
+
+		self._fpaths, self._targets = self._load_ground_truth()
+
+	def __getitem__(self, idx: int) -> Tuple[Tensor, List[int]]:
+		return self.get_waveform(idx), self.get_target(idx)
+
+	def __len__(self) -> int:
+		return len(self._fpaths)
+
+	def get_waveform(self, idx: int) -> Tensor:
+		"""
+			:param idx: The index of the item.
+			:return: The waveform window of shape (1, n_frames) with n_frames <= window_length.
+		"""
+		with soundfile.SoundFile(self._fpaths[idx]) as file:
+			offset, n_frames = self._get_window(file.frames)
+			if offset > 0:
+				file.seek(offset)
+			waveform = file.read(frames=n_frames, dtype='float32', always_2d=True)
+
+		# Soundfile returns (n_frames, channels), FSD50K clips are mono
+		waveform = torch.from_numpy(waveform.T)
+		if waveform.shape[0] > 1:
+			waveform = waveform.mean(dim=0, keepdim=True)
+		return waveform
+
+	def get_target(self, idx: int) -> List[int]:
+		return self._targets[idx]
+
+	@property
+	def targets(self) -> List[List[int]]:
+		return self._targets
+
+	def _get_window(self, total_frames: int) -> Tuple[int, int]:
+		if self.window_length is None or total_frames <= self.window_length:
+			return 0, total_frames
+
+		max_offset = total_frames - self.window_length
+		if self.align == 'left':
+			offset = 0
+		elif self.align == 'center':
+			offset = max_offset // 2
+		else:
+			offset = random.randint(0, max_offset)
+		return offset, self.window_length
+
+	def _load_ground_truth(self) -> Tuple[List[str], List[List[int]]]:
+		gt_dpath = osp.join(self.root, 'FSD50K.ground_truth')
+
+		with open(osp.join(gt_dpath, 'vocabulary.csv'), 'r') as file:
+			label_to_idx = {row[1]: int(row[0]) for row in csv.reader(file) if len(row) > 0}
+
+		if self.subset == 'eval':
+			csv_fname, audio_dname = 'eval.csv', 'FSD50K.eval_audio'
+		else:
+			csv_fname, audio_dname = 'dev.csv', 'FSD50K.dev_audio'
+
+		fpaths = []
+		targets = []
+		with open(osp.join(gt_dpath, csv_fname), 'r') as file:
+			for row in csv.DictReader(file):
+				if self.subset != 'eval' and row['split'] != self.subset:
+					continue
+				fpaths.append(osp.join(self.root, audio_dname, f'{row["fname"]}.wav'))
+				targets.append([label_to_idx[label] for label in row['labels'].split(',')])
+
+		return fpaths, targets
+
+
+def _find_dataset_dir(root: str) -> str:
+	for dpath in (root, osp.join(root, 'FSD50K')):
+		if osp.isdir(osp.join(dpath, 'FSD50K.ground_truth')):
+			return dpath
+	raise RuntimeError(f'Cannot find the directory "FSD50K.ground_truth" in "{root}".')
@@ -9,18 +9,24 @@
 import numpy as np
 import os
 import random
+import soundfile
 import torch
+import torchaudio
 
-from tqdm import trange
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm, trange
 from torch import Tensor
 from torch.nn import Module
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
 
-from sslh.datasets.gsc_base import SPEECHCOMMANDS
+from sslh.datasets.gsc_base import EXCEPT_FOLDER as EXCEPT_FOLDERS, SPEECHCOMMANDS
+from sslh.datasets.manifest import MANIFEST_DNAME
+from sslh.datasets.utils import build_feature_cache, cache_feature
 
 
 URL = 'speech_commands_v0.02'
 EXCEPT_FOLDER = '_background_noise_'
+SAMPLE_RATE = 16000
 
 target_mapper = {
 	'bed': 0,
@@ -82,9 +88,9 @@ def _split_s_u(train_dataset: SPEECHCOMMANDS, s_ratio: float = 1.0):
 	cls_idx = [[] for _ in range(n_class)]
 
 	# To each file, an index is assigned, then they are split into classes
+	targets = _train_dataset.targets
 	for i in trange(dataset_size):
-		y, _, _ = _train_dataset[i]
-		cls_idx[y].append(i)
+		cls_idx[targets[i]].append(i)
 
 	# Recover only the s_ratio % first as supervised, rest is unsupervised
 	for i in trange(len(cls_idx)):
@@ -95,18 +101,90 @@ def _split_s_u(train_dataset: SPEECHCOMMANDS, s_ratio: float = 1.0):
 	return s_idx, u_idx
 
 
-def cache_feature(func):
-	def decorator(*args, **kwargs):
-		key = ','.join(map(str, args))
+def get_packed_store_paths(path: str) -> Tuple[str, str, str, str, str]:
+	"""
+		Returns the paths of the waveforms, lengths, targets, signature and relative paths arrays of the packed store.
+	"""
+	return tuple(
+		os.path.join(path, f'packed_{name}.npy') for name in ('waveforms', 'lengths', 'targets', 'signature', 'paths')
+	)
 
-		if key not in decorator.cache:
-			decorator.cache[key] = func(*args, **kwargs)
 
-		return decorator.cache[key]
+def is_packed_store_valid(path: str, manifest: Dict[str, np.ndarray]) -> bool:
+	"""
+		:param path: The Speech Commands directory which contain the packed store.
+		:param manifest: The manifest of the files of the directory, see SPEECHCOMMANDS._load_manifest.
+		:return: True if the store exists and was built from the same files, sizes and modification times.
+	"""
+	store_paths = get_packed_store_paths(path)
+	if not all(os.path.isfile(fpath) for fpath in store_paths):
+		return False
+
+	_, _, _, signature_path, paths_path = store_paths
+	return (
+		np.array_equal(np.load(paths_path), manifest['paths'])
+		and np.array_equal(np.load(signature_path), _get_packed_signature(manifest))
+	)
+
+
+def build_packed_store(path: str, manifest: Dict[str, np.ndarray], n_workers: int = 8, verbose: bool = True):
+	"""
+		Decode once all the clips of the Speech Commands directory in a packed store.
+
+		The store contains a (N, 16000) int16 array of the zero-padded clips, the length of each clip, its target, its
+		relative path 'label/filename.wav' and the size and modification time of the file in the manifest. Each array is
+		written in a temporary file then renamed, and the relative paths array is written last, so an interrupted build
+		is detected and done again.
+
+		:param path: The Speech Commands directory which contain the labels directories.
+		:param manifest: The manifest of the files of the directory, see SPEECHCOMMANDS._load_manifest.
+		:param n_workers: The number of threads reading the files. (default: 8)
+		:param verbose: If True, display the progress of the build. (default: True)
+	"""
+	waveforms_path, lengths_path, targets_path, signature_path, paths_path = get_packed_store_paths(path)
+
+	# Same files and order than SPEECHCOMMANDS._parse_files
+	relpaths = [str(relpath) for relpath in manifest['paths']]
+
+	tmp_waveforms_path = _get_tmp_path(waveforms_path)
+	waveforms = np.lib.format.open_memmap(
+		tmp_waveforms_path, mode='w+', dtype=np.int16, shape=(len(relpaths), SAMPLE_RATE),
+	)
+	lengths = np.zeros(len(relpaths), dtype=np.int64)
+
+	def read_clip(i: int):
+		clip, _ = soundfile.read(os.path.join(path, relpaths[i]), dtype='int16')
+		# The rare clips longer than 1 second are cropped
+		clip = clip[:SAMPLE_RATE]
+		waveforms[i, :len(clip)] = clip
+		lengths[i] = len(clip)
+
+	with ThreadPoolExecutor(n_workers) as executor:
+		for _ in tqdm(executor.map(read_clip, range(len(relpaths))), total=len(relpaths), disable=not verbose):
+			pass
+
+	waveforms.flush()
+	del waveforms
+	os.replace(tmp_waveforms_path, waveforms_path)
+
+	_save_atomic(lengths_path, lengths)
+	_save_atomic(targets_path, np.asarray([target_mapper[relpath.split('/')[0]] for relpath in relpaths], dtype=np.int64))
+	_save_atomic(signature_path, _get_packed_signature(manifest))
+	_save_atomic(paths_path, np.asarray(relpaths))
+
 
-	decorator.cache = dict()
-	decorator.func = func
-	return decorator
+def _get_packed_signature(manifest: Dict[str, np.ndarray]) -> np.ndarray:
+	return np.stack((manifest['sizes'], manifest['mtimes']), axis=1).astype(np.int64)
+
+
+def _get_tmp_path(fpath: str) -> str:
+	return f'{fpath}.{os.getpid()}.tmp.npy'
+
+
+def _save_atomic(fpath: str, array: np.ndarray):
+	tmp_fpath = _get_tmp_path(fpath)
+	np.save(tmp_fpath, array)
+	os.replace(tmp_fpath, fpath)
 
 
 class SpeechCommands(SPEECHCOMMANDS):
@@ -116,79 +194,115 @@ class SpeechCommands(SPEECHCOMMANDS):
 		subset: str = 'train',
 		url: str = URL,
 		download: bool = False,
-		transform: Optional[Module] = None
+		transform: Optional[Module] = None,
+		cache_nbytes: int = 0,
+		packed: bool = True,
+		verify: bool = False,
+		checksum: bool = False,
 	) -> None:
-		super().__init__(root, url, download, transform)
+		"""
+			:param root: The root directory of the dataset.
+			:param subset: The subset to use, 'train', 'validation' or 'testing'. (default: 'train')
+			:param url: The version of the dataset. (default: 'speech_commands_v0.02')
+			:param download: If True, download the dataset in the root directory. (default: False)
+			:param transform: The optional transform to apply to the waveforms. (default: None)
+			:param cache_nbytes: The memory budget of the decoded waveforms cache shared by the DataLoader workers.
+				It is allocated in shared memory when the dataset is built. 0 disable the cache. The cache is not used with
+				the packed store. (default: 0)
+			:param packed: If True, read the waveforms from the packed store instead of decoding the WAV files.
+				The store is built in the dataset directory the first time and when the files changed. (default: True)
+			:param verify: If True, compare the files to the manifest of a previous start and rebuild the manifest if they
+				changed. (default: False)
+			:param checksum: If True, store the MD5 of the files in the manifest and compare them when verify is True.
+				(default: False)
+		"""
+		super().__init__(root, url, download, transform, verify, checksum)
 
 		assert subset in ['train', 'validation', 'testing']
 		self.subset = subset
+		self.packed = packed
 		self.root_path = self._walker[0].split('/')[:-2]
 		if self.root_path[0] == "":
 			self.root_path[0] = '/'
 
 		self._keep_valid_files()
 
+		# packed store, mapped lazily in each process
+		self._packed_waveforms = None
+		self._packed_lengths = None
+		self._packed_rows = None
+
+		if self.packed:
+			self._prepare_packed_store()
+			# the pages of the store are already shared by the DataLoader workers
+			self.feature_cache = None
+		else:
+			# decoded waveforms shared by the DataLoader workers, 0 disable the cache
+			self.feature_cache = build_feature_cache(cache_nbytes)
+
 	@cache_feature
 	def __getitem__(self, index: int) -> Tuple[Tensor, int]:
+		if self.packed:
+			waveform = self._load_packed_waveform(index)
+			if self.transform is not None:
+				waveform = self.transform(waveform)
+			return waveform, self.get_target(index)
+
 		waveform, _, label, _, _ = super().__getitem__(index)
 		return waveform, target_mapper[label]
 
-	def save_cache_to_disk(self, name) -> None:
-		path = os.path.join(self._path, f'{name}_features.cache')
-		torch.save(self.__getitem__.cache, path)
+	def _prepare_packed_store(self):
+		_, lengths_path, _, _, paths_path = get_packed_store_paths(self._path)
+		# The store is built again when the files listed by the manifest changed since the last build
+		if not is_packed_store_valid(self._path, self._manifest):
+			build_packed_store(self._path, self._manifest)
 
-	def load_cache_from_disk(self, name) -> bool:
-		path = os.path.join(self._path, f'{name}_features.cache')
+		# row of each file of the store, the _walker can still change (e.g. in SpeechCommand10)
+		relpaths = np.load(paths_path)
+		self._packed_rows = {str(relpath): row for row, relpath in enumerate(relpaths)}
+		self._packed_lengths = np.load(lengths_path)
 
-		if os.path.isfile(path):
-			disk_cache = torch.load(path)
-			self.__getitem__.cache.update(disk_cache)
-			return True
+	def _load_packed_waveform(self, index: int) -> Tensor:
+		if self._packed_waveforms is None:
+			waveforms_path, _, _, _, _ = get_packed_store_paths(self._path)
+			self._packed_waveforms = np.load(waveforms_path, mmap_mode='r')
 
-		return False
+		filepath = self._walker[index]
+		row = self._packed_rows.get('/'.join(filepath.split('/')[-2:]))
+		if row is None:
+			# The file is not in the store, e.g. the store was built again by another process
+			waveform, _ = torchaudio.load(filepath)
+			return waveform
 
-	def _keep_valid_files(self):
-		# bn = os.path.basename
-		bn2 = lambda x: '/'.join(x.split('/')[-2:])
-		# bn2 = lambda x: osp.join(osp.basename(osp.dirname(x)), osp.basename(x))
-
-		def file_list(filename):
-			path = os.path.join(self._path, filename)
-			with open(path, 'r') as f:
-				to_keep = f.read().splitlines()
-				return set([path for path in to_keep])
-
-		# Recover file list for validaiton and testing.
-		validation_list = file_list('validation_list.txt')
-		testing_list = file_list('testing_list.txt')
-
-		# Create it for training
-		import time
-		start_time = time.time()
-
-		training_list = [
-			bn2(path)
-			for path in self._walker
-			if bn2(path) not in validation_list and bn2(path) not in testing_list
-		]
+		clip = self._packed_waveforms[row, :self._packed_lengths[row]]
 
-		if self.subset == 'train':
-			for p in training_list:
-				if p in validation_list:
-					print('%s is train and validation' % p)
-					raise ValueError()
+		# Same values and shape (1, length) than torchaudio.load
+		return torch.from_numpy(clip.astype(np.float32) / 32768.0).unsqueeze(0)
 
-				if p in testing_list:
-					print('%s is in both train and testing list' % p)
-					raise ValueError()
+	def __getstate__(self) -> dict:
+		# The store is mapped again by the process which unpickle the dataset instead of copying the data
+		state = dict(self.__dict__)
+		state['_packed_waveforms'] = None
+		return state
 
-		# print('run in %f' % (time.time() - start_time))
+	def get_target(self, index: int) -> int:
+		"""Return the target of a file from its path, without loading the audio."""
+		return self._path_to_target(self._walker[index])
 
-		# Map the list to the corresponding subsets
+	@property
+	def targets(self) -> np.ndarray:
+		"""The targets of all the files, read from their paths without loading the audio."""
+		return np.asarray([self._path_to_target(path) for path in self._walker], dtype=np.int64)
+
+	def _path_to_target(self, path: str) -> int:
+		return target_mapper[path.split('/')[-2]]
+
+	def _keep_valid_files(self):
+		# The subsets lists are read from the manifest of the files, see SPEECHCOMMANDS._build_manifest
 		mapper = {
-			'train': training_list,
-			'validation': validation_list,
-			'testing': testing_list,
+			'train': self._manifest['paths'][self._manifest['is_train']],
+			'validation': self._manifest['validation_list'],
+			'testing': self._manifest['testing_list'],
 		}
 
 		self._walker = [
@@ -202,7 +316,8 @@ class SpeechCommandsStats(SpeechCommands):
 	def from_dataset(cls, dataset: SPEECHCOMMANDS):
 		root = dataset.root
 
-		newone = cls(root=root)
+		# The packed store is not needed to read the labels
+		newone = cls(root=root, packed=False)
 		newone.__dict__.update(dataset.__dict__)
 		return newone
 
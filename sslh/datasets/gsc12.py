@@ -9,13 +9,14 @@
 import numpy as np
 import os
 import soundfile
-import torchaudio
+import torch
 
 from torch import Tensor
 from torch.nn import Module
 from typing import Optional, Tuple
 
-from sslh.datasets.gsc import SpeechCommands, URL, all_classes, cache_feature, EXCEPT_FOLDER
+from sslh.datasets.gsc import SpeechCommands, URL, all_classes, EXCEPT_FOLDER, SAMPLE_RATE
+from sslh.datasets.utils import cache_feature
 
 
 class SpeechCommand10(SpeechCommands):
@@ -29,13 +30,18 @@ class SpeechCommand10(SpeechCommands):
 		url: str = URL,
 		download: bool = False,
 		transform: Optional[Module] = None,
-		percent_to_drop: float = 0.5
+		percent_to_drop: float = 0.5,
+		cache_nbytes: int = 0,
+		n_silence_per_noise: int = 400,
+		silence_seed: Optional[int] = None,
 	) -> None:
-		super().__init__(root, subset, url, download, transform)
+		super().__init__(root, subset, url, download, transform, cache_nbytes)
 
 		assert 0.0 <= percent_to_drop < 1.0
 
 		self.percent_to_drop = percent_to_drop
+		self.n_silence_per_noise = n_silence_per_noise
+		self.silence_seed = silence_seed
 
 		self.target_mapper = {
 			'yes': 0,
@@ -62,15 +68,34 @@ class SpeechCommand10(SpeechCommands):
 
 	@cache_feature
 	def __getitem__(self, index: int) -> Tuple[Tensor, int]:
-		filepath = self._walker[index]
+		target = self.get_target(index)
 
-		label = filepath.split('/')[-2]
-		target = self.target_mapper[label]
-
-		waveform, _ = super().__getitem__(index)
+		if index < len(self._walker):
+			waveform, _ = super().__getitem__(index)
+		else:
+			waveform = self._load_silence_waveform(index - len(self._walker))
+			if self.transform is not None:
+				waveform = self.transform(waveform)
 
 		return waveform, target
 
+	def __len__(self) -> int:
+		return len(self._walker) + len(self._silence_items)
+
+	def get_target(self, index: int) -> int:
+		if index < len(self._walker):
+			return super().get_target(index)
+		else:
+			return self.target_mapper['silence']
+
+	@property
+	def targets(self) -> np.ndarray:
+		silence_targets = np.full(len(self._silence_items), self.target_mapper['silence'], dtype=np.int64)
+		return np.concatenate((super().targets, silence_targets))
+
+	def _path_to_target(self, path: str) -> int:
+		return self.target_mapper[path.split('/')[-2]]
+
 	def drop_some_trash(self):
 		def is_trash(path: str) -> bool:
 			return self.target_mapper[path.split('/')[-2]] == 11
@@ -88,88 +113,45 @@ class SpeechCommand10(SpeechCommands):
 		print('%d out of %s junk files were drop.' % (len(to_drop), len(trash_list)))
 
 	def add_silence(self):
-		"""For the class silence, a new directory is created called 'silence'
-		It will contain 1 seconds segment from the _background_noise_ directory
-		If the directory already exist, do some verification and pass
 		"""
-		silence_dir = os.path.join(*self.root_path, 'silence')
-
-		if os.path.isdir(silence_dir):
-			self._check_silence_class()
+			Add the virtual samples of the class 'silence' to the train subset.
 
-		else:
-			self._create_silence_class()
-			self._check_silence_class()
-
-	def _create_silence_class2(self):
-		print('Silence class doesn\'t exist')
-		silence_dir = os.path.join(*self.root_path, 'silence')
-		noise_path = os.path.join(*self.root_path, '_background_noise_')
-
-		# the silence class directory doesn't exist, create it
-		os.makedirs(silence_dir)
-
-		# Split each noise files into 1 second long segment
-		to_process = []
-		for file in os.listdir(os.path.join(*self.root_path, EXCEPT_FOLDER)):
-			file: str
-			if file[-4:] == '.wav':
-				to_process.append(os.path.join(noise_path, file))
-
-		# Basic way, split each files into 1 seconds long segment
-		print('Creating silence samples...')
-		for filepath in to_process:
-			basename = os.path.basename(filepath)
-
-			waveform, sr = torchaudio.load(filepath)
-
-			n_full_segment = int(len(waveform[0]) / sr)
-			rest = len(waveform[0]) % sr
-			segments = np.split(waveform[0][:-rest], n_full_segment)
-
-			# write each segment as a wav file with a unique name
-			for i, s in enumerate(segments):
-				unique_id = f'{basename[:-4]}_nohash_{i}.wav'
-				path = os.path.join(silence_dir, unique_id)
-				soundfile.write(path, s, sr)
-		print('done')
-
-	def _create_silence_class(self):
-		print('Silence class doesn\'t exist')
-		silence_dir = os.path.join(*self.root_path, 'silence')
-		noise_path = os.path.join(*self.root_path, '_background_noise_')
-
-		# the silence class directory doesn't exist, create it
-		os.makedirs(silence_dir)
-
-		# Split each noise files into 1 second long segment
-		to_process = []
-		for file in os.listdir(os.path.join(*self.root_path, EXCEPT_FOLDER)):
-			file: str
-			if file[-4:] == '.wav':
-				to_process.append(os.path.join(noise_path, file))
-
-		# Basic way, split each files into 1 seconds long segment
-		print('Creating silence samples...')
-		for filepath in to_process:
-			basename = os.path.basename(filepath)
-
-			waveform, sr = torchaudio.load(filepath)
-
-			# write each segment, we will create 300 segments of 1 secondes
-			start_timestamps = np.random.randint(0, len(waveform[0]) - sr, size=400)
-			for i, st in enumerate(start_timestamps):
-				unique_id = f'{basename[:-4]}_nohash_{i}.wav'
-				path = os.path.join(silence_dir, unique_id)
-
-				segment = waveform[0][st:st + sr]
-				soundfile.write(path, segment, sr)
-
-		print('done')
-
-	def _check_silence_class(self):
-		silence_dir = os.path.join(*self.root_path, 'silence')
-		all_files = os.listdir(silence_dir)
-
-		print('Silence class already processed')
-		print('%s samples present' % len(all_files))
+			Each silence sample is a 1 second segment of a file of the _background_noise_ directory, stored as a pair
+			(noise file, offset) and sliced when the item is loaded, so no segment is written on disk.
+			The noise waveforms are read once in each process at the first silence item.
+		"""
+		noise_dir = os.path.join(*self.root_path, EXCEPT_FOLDER)
+		self._noise_paths = sorted(
+			os.path.join(noise_dir, fname) for fname in os.listdir(noise_dir) if fname[-4:] == '.wav'
+		)
+		self._noise_waveforms = None
+
+		if self.subset != 'train' or self.n_silence_per_noise == 0:
+			self._silence_items = np.zeros((0, 2), dtype=np.int64)
+			return
+
+		rng = np.random if self.silence_seed is None else np.random.RandomState(self.silence_seed)
+		silence_items = []
+		for noise_idx, path in enumerate(self._noise_paths):
+			n_frames = soundfile.info(path).frames
+			offsets = rng.randint(0, n_frames - SAMPLE_RATE, size=self.n_silence_per_noise)
+			silence_items += [(noise_idx, offset) for offset in offsets]
+
+		self._silence_items = np.asarray(silence_items, dtype=np.int64)
+		print('%d silence samples added.' % len(self._silence_items))
+
+	def _load_silence_waveform(self, silence_idx: int) -> Tensor:
+		if self._noise_waveforms is None:
+			self._noise_waveforms = [soundfile.read(path, dtype='int16')[0] for path in self._noise_paths]
+
+		noise_idx, offset = self._silence_items[silence_idx]
+		segment = self._noise_waveforms[noise_idx][offset:offset + SAMPLE_RATE]
+
+		# Same values and shape (1, length) than torchaudio.load
+		return torch.from_numpy(segment.astype(np.float32) / 32768.0).unsqueeze(0)
+
+	def __getstate__(self) -> dict:
+		# The noise waveforms are read again by the process which unpickle the dataset
+		state = super().__getstate__()
+		state['_noise_waveforms'] = None
+		return state
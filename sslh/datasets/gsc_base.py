@@ -6,6 +6,7 @@
 		- typing & imports
 """
 
+import numpy as np
 import os
 import torchaudio
 
@@ -16,7 +17,9 @@ from torchaudio.datasets.utils import (
 	download_url,
 	extract_archive,
 )
-from typing import Tuple
+from typing import Dict, Tuple
+
+from sslh.datasets.manifest import MANIFEST_DNAME, load_or_build_manifest, verify_or_remove_manifest
 
 FOLDER_IN_ARCHIVE = 'SpeechCommands'
 URL = 'speech_commands_v0.02'
@@ -41,7 +44,9 @@ class SPEECHCOMMANDS(Dataset):
 		root: str,
 		url: str = URL,
 		download: bool = False,
-		transform: Module = None
+		transform: Module = None,
+		verify: bool = False,
+		checksum: bool = False,
 	) -> None:
 
 		if url in ['speech_commands_v0.01', 'speech_commands_v0.02']:
@@ -53,6 +58,8 @@ class SPEECHCOMMANDS(Dataset):
 		self.root = root
 		self.url = url
 		self.transform = transform
+		self.verify = verify
+		self.checksum = checksum
 
 		self.basename = os.path.basename(url)
 
@@ -64,6 +71,8 @@ class SPEECHCOMMANDS(Dataset):
 
 		if download:
 			self._download()
+		elif verify:
+			self._check_integrity(self._path, verify, checksum)
 
 		self._walker = self._parse_files()
 
@@ -81,20 +90,36 @@ class SPEECHCOMMANDS(Dataset):
 		return len(self._walker)
 
 	def _parse_files(self):
-		file_path = []
+		# The listing of the files and the subsets lists are read from the manifest when the directories did not change
+		self._manifest = self._load_manifest()
+		return [os.path.join(self._path, path) for path in self._manifest['paths']]
+
+	def _load_manifest(self) -> Dict[str, np.ndarray]:
+		list_commands = self._list_commands()
+		watched_paths = [self._path] + [
+			os.path.join(self._path, path)
+			for path in list_commands + ['validation_list.txt', 'testing_list.txt']
+		]
+		return load_or_build_manifest(
+			self._path, 'files', watched_paths, lambda: self._build_manifest(list_commands), checksums=self.checksum,
+		)
 
-		# Is the comprehension list readable enough?
+	def _list_commands(self) -> list:
 		list_commands = [
 			dir_ for dir_ in os.listdir(self._path)
-			if os.path.isdir(os.path.join(self._path, dir_)) and dir_ not in EXCEPT_FOLDER
+			if os.path.isdir(os.path.join(self._path, dir_)) and dir_ not in EXCEPT_FOLDER and dir_ != MANIFEST_DNAME
 		]
 		list_commands.sort()
+		return list_commands
+
+	def _build_manifest(self, list_commands: list) -> Dict[str, np.ndarray]:
+		file_path = []
 
 		for command in list_commands:
 			command_path = os.path.join(self._path, command)
 
 			list_files = [
-				os.path.join(command_path, f)
+				f'{command}/{f}'
 				for f in os.listdir(command_path)
 				if f[-4:] == '.wav'
 			]
@@ -102,14 +127,31 @@ class SPEECHCOMMANDS(Dataset):
 
 			file_path.extend(list_files)
 
-		return file_path
+		def file_list(filename):
+			path = os.path.join(self._path, filename)
+			if not os.path.isfile(path):
+				return []
+			with open(path, 'r') as f:
+				return f.read().splitlines()
+
+		# The lists keep the order of the files, the train files are the others
+		validation_list = file_list('validation_list.txt')
+		testing_list = file_list('testing_list.txt')
+		not_train = set(validation_list).union(testing_list)
+
+		return {
+			'paths': np.asarray(file_path),
+			'is_train': np.asarray([path not in not_train for path in file_path], dtype=bool),
+			'validation_list': np.asarray(validation_list),
+			'testing_list': np.asarray(testing_list),
+		}
 
 	def _download(self) -> None:
 		"""Download the dataset and extract the archive"""
 		archive_path = os.path.join(self.root, self.basename)
 
-		if self._check_integrity(self._path):
-			print('Dataset already download and verified')
+		if self._check_integrity(self._path, self.verify, self.checksum):
+			print('Dataset already download')
 
 		else:
 			if not os.path.isdir(self.root):
@@ -118,15 +160,19 @@ class SPEECHCOMMANDS(Dataset):
 			download_url(self.url, self.root, hash_value=checksum, hash_type='md5')
 			extract_archive(archive_path, self._path)
 
-	def _check_integrity(self, path, checksum=None) -> bool:
-		"""Check if the dataset already exist and if yes, if it is not corrupted.
+	def _check_integrity(self, path, verify: bool = False, checksum: bool = False) -> bool:
+		"""Check if the dataset already exist.
+		If verify is True, the files are also compared to the manifest of a previous start if it exists, with their MD5
+		if checksum is True. A manifest which does not match the files is removed and
+		rebuilt from them, the dataset is not downloaded again.
 		Returns:
-			bool: False if the dataset doesn't exist of it is corrupted.
+			bool: False if the dataset doesn't exist.
 		"""
 		if not os.path.isdir(path):
 			return False
 
-		# add checksum verification
+		if verify:
+			verify_or_remove_manifest(path, 'files', checksum)
 		return True
 
 	def _load_item(self, filepath: str, path: str) -> Tuple[Tensor, int, str,
@@ -0,0 +1,209 @@
+"""
+	Cached manifests of the files and metadata of the datasets read file by file.
+
+	A manifest is a npz file in the directory '.manifests' of a dataset root. It contains the arrays returned by the
+	dataset (paths, labels, folds, subsets...) and the size and modification time of each file. It is validated with
+	the modification times of a few watched paths (the directories listed and the metadata files), so a start does not
+	list or parse anything when the dataset did not change.
+"""
+
+import hashlib
+import logging
+import numpy as np
+import os
+import os.path as osp
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+
+# Increment to rebuild the manifests of the previous formats
+MANIFEST_VERSION = 1
+MANIFEST_DNAME = '.manifests'
+
+
+def get_manifest_path(root: str, name: str) -> str:
+	"""
+		:param root: The root directory of the dataset files.
+		:param name: The name of the manifest.
+		:return: The path of the manifest file.
+	"""
+	return osp.join(root, MANIFEST_DNAME, f'{name}.npz')
+
+
+def load_manifest(root: str, name: str) -> Optional[Dict[str, np.ndarray]]:
+	"""
+		:param root: The root directory of the dataset files.
+		:param name: The name of the manifest.
+		:return: The manifest saved without checking its signature, or None if it does not exist.
+	"""
+	fpath = get_manifest_path(root, name)
+	if not osp.isfile(fpath):
+		return None
+	with np.load(fpath) as data:
+		return {key: data[key] for key in data.files if key not in ('version', 'signature')}
+
+
+def load_or_build_manifest(
+	root: str,
+	name: str,
+	watched_paths: Iterable[str],
+	build_fn: Callable[[], Dict[str, np.ndarray]],
+	checksums: bool = False,
+	n_workers: int = 8,
+) -> Dict[str, np.ndarray]:
+	"""
+		Load the manifest of a dataset if the watched paths did not change since it was built, otherwise build it.
+
+		The manifest file is written atomically. If the root is read-only, the manifest is returned but not saved.
+
+		:param root: The root directory of the dataset files.
+		:param name: The name of the manifest.
+		:param watched_paths: The directories and files which are modified when the dataset change.
+		:param build_fn: The function without arguments which returns the arrays of the manifest.
+			The array 'paths' must contain the paths of the files relative to root.
+		:param checksums: If True, store the MD5 of the files when the manifest is built. (default: False)
+		:param n_workers: The number of threads reading the file sizes and checksums. (default: 8)
+		:return: The dictionary of arrays of the manifest, with the arrays 'sizes', 'mtimes' and optionally 'md5' added.
+	"""
+	fpath = get_manifest_path(root, name)
+
+	# The directory is created before reading the signature because it modify the root mtime
+	try:
+		os.makedirs(osp.dirname(fpath), exist_ok=True)
+	except OSError:
+		pass
+
+	signature = _get_signature(watched_paths)
+
+	if osp.isfile(fpath):
+		with np.load(fpath) as data:
+			manifest = {key: data[key] for key in data.files}
+		if (
+			int(manifest.pop('version')) == MANIFEST_VERSION
+			and np.array_equal(manifest.pop('signature'), signature)
+			and (not checksums or 'md5' in manifest)
+		):
+			return manifest
+		logging.info(f'Manifest "{fpath}" is outdated, it will be rebuilt.')
+
+	manifest = {key: np.asarray(value) for key, value in build_fn().items()}
+	paths = [osp.join(root, path) for path in manifest['paths']]
+	manifest['sizes'], manifest['mtimes'] = _stat_files(paths, n_workers)
+	if checksums:
+		manifest['md5'] = _get_checksums(paths, n_workers)
+
+	try:
+		tmp_fpath = f'{fpath}.{os.getpid()}.tmp.npz'
+		np.savez(tmp_fpath, version=np.int64(MANIFEST_VERSION), signature=signature, **manifest)
+		os.replace(tmp_fpath, fpath)
+	except OSError as err:
+		logging.warning(f'Cannot save the manifest "{fpath}" ({err}).')
+
+	return manifest
+
+
+def verify_manifest_files(
+	root: str,
+	manifest: Dict[str, np.ndarray],
+	checksum: bool = False,
+	n_workers: int = 8,
+) -> bool:
+	"""
+		Check that the files of a manifest exist and are unchanged.
+
+		:param root: The root directory of the dataset files.
+		:param manifest: The manifest returned by load_or_build_manifest.
+		:param checksum: If True, also compare the MD5 of the files. The manifest must be built with checksums=True.
+			(default: False)
+		:param n_workers: The number of threads reading the files. (default: 8)
+		:return: True if all the files are valid.
+	"""
+	paths = [osp.join(root, path) for path in manifest['paths']]
+	sizes, _mtimes = _stat_files(paths, n_workers)
+	invalid = np.logical_or(sizes < 0, sizes != manifest['sizes'])
+
+	if checksum:
+		if 'md5' not in manifest:
+			raise ValueError('Cannot verify the checksums of a manifest built without checksums.')
+		invalid |= _get_checksums(paths, n_workers) != manifest['md5']
+
+	n_invalid = int(invalid.sum())
+	if n_invalid > 0:
+		logging.warning(f'{n_invalid}/{len(paths)} files are missing or corrupted in "{root}".')
+	return n_invalid == 0
+
+
+def verify_or_remove_manifest(root: str, name: str, checksum: bool = False, n_workers: int = 8) -> bool:
+	"""
+		Check the files of a saved manifest and remove the manifest if they changed, so the next load rebuilds it from
+		the files instead of returning stale paths, sizes or metadata.
+
+		A manifest built without checksums is also removed when checksum is True, the next load must then rebuild it
+		with checksums=True so the MD5 of the files can be verified from the next start.
+
+		:param root: The root directory of the dataset files.
+		:param name: The name of the manifest.
+		:param checksum: If True, also compare the MD5 of the files. (default: False)
+		:param n_workers: The number of threads reading the files. (default: 8)
+		:return: True if the manifest does not exist or if all its files are valid, False if it has been removed.
+	"""
+	manifest = load_manifest(root, name)
+	if manifest is None:
+		return True
+
+	fpath = get_manifest_path(root, name)
+	if checksum and 'md5' not in manifest:
+		logging.warning(f'Manifest "{fpath}" does not contain the checksums of the files, it will be rebuilt with them.')
+	elif verify_manifest_files(root, manifest, checksum=checksum, n_workers=n_workers):
+		return True
+	else:
+		logging.warning(f'Manifest "{fpath}" does not match the files, it will be rebuilt.')
+
+	try:
+		os.remove(fpath)
+	except OSError as err:
+		logging.warning(f'Cannot remove the manifest "{fpath}" ({err}).')
+	return False
+
+
+def _get_signature(watched_paths: Iterable[str]) -> np.ndarray:
+	return np.asarray([_get_mtime(path) for path in watched_paths], dtype=np.int64)
+
+
+def _get_mtime(path: str) -> int:
+	try:
+		return os.stat(path).st_mtime_ns
+	except OSError:
+		return -1
+
+
+def _stat_files(paths: Iterable[str], n_workers: int) -> Tuple[np.ndarray, np.ndarray]:
+	def stat(path: str) -> Tuple[int, int]:
+		try:
+			stat_result = os.stat(path)
+			return stat_result.st_size, stat_result.st_mtime_ns
+		except OSError:
+			return -1, -1
+
+	with ThreadPoolExecutor(n_workers) as executor:
+		results = list(executor.map(stat, paths))
+
+	results = np.asarray(results, dtype=np.int64).reshape(-1, 2)
+	return results[:, 0], results[:, 1]
+
+
+def _get_checksums(paths: Iterable[str], n_workers: int) -> np.ndarray:
+	def md5(path: str) -> str:
+		hash_ = hashlib.md5()
+		try:
+			with open(path, 'rb') as file:
+				for block in iter(lambda: file.read(1024 ** 2), b''):
+					hash_.update(block)
+		except OSError:
+			return ''
+		return hash_.hexdigest()
+
+	with ThreadPoolExecutor(n_workers) as executor:
+		return np.asarray(list(executor.map(md5, paths)), dtype='<U32')
+
@@ -11,21 +11,35 @@ import itertools
 import numpy
 import random
 
-from tqdm import tqdm
 from torch.nn import Module
 from torch.utils.data.dataloader import DataLoader
 from torch.utils.data.sampler import Sampler
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from sslh.datasets.pvc_base import COMPARE2021PRSBase
-from sslh.datasets.utils import cache_feature
+from sslh.datasets.utils import (
+	build_feature_cache,
+	cache_feature,
+	get_indexes_per_class_csr,
+	greedy_multilabel_split,
+	round_robin_per_class,
+	shuffle_per_class,
+)
 
 
 class ComParE2021PRS(COMPARE2021PRSBase):
-	def __init__(self, root, subset, transform: Module = None, enable_cache: bool = False):
+	def __init__(
+		self,
+		root,
+		subset,
+		transform: Module = None,
+		enable_cache: bool = True,
+		cache_nbytes: int = 1024 ** 3,
+	):
 		super().__init__(root, subset)
 		self.transform = transform
 		self.enable_cache = enable_cache
+		self.feature_cache = build_feature_cache(cache_nbytes) if enable_cache else None
 
 	@cache_feature
 	def __getitem__(self, idx: int):
@@ -42,33 +56,8 @@ def class_balance_split(
 	supervised_ratio: float = 0.1,
 	unsupervised_ratio: float = None,
 	verbose: bool = False,
-):
-	def to_one_hot(idx):
-		one_hot = [0] * len(COMPARE2021PRSBase.CLASSES)
-		one_hot[idx] = 1
-
-		return one_hot
-
-	def fill_subset(remaining_samples, expected):
-		n_classes = len(COMPARE2021PRSBase.CLASSES)
-
-		subset_occur = numpy.zeros(shape=(n_classes,))
-		subset = []
-
-		with tqdm(total=sum(expected)) as progress:
-			for class_idx in range(n_classes):
-				idx = 0
-				while idx < len(remaining_samples) and subset_occur[class_idx] < expected[class_idx]:
-					if remaining_samples[idx][0][class_idx] == 1:
-						target, target_idx = remaining_samples.pop(idx)
-						subset_occur += target
-						subset.append(target_idx)
-						progress.update(sum(target))
-
-					idx += 1
-
-		return numpy.asarray(subset), remaining_samples
-
+	seed: Optional[int] = None,
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
 	if unsupervised_ratio is None:
 		unsupervised_ratio = 1 - supervised_ratio
 
@@ -77,10 +66,13 @@ def class_balance_split(
 	assert supervised_ratio + unsupervised_ratio <= 1.0
 
 	if supervised_ratio == 1.0:
-		return list(range(len(dataset))), []
+		return numpy.arange(len(dataset)), numpy.zeros(0, dtype=numpy.int64)
 
-	all_targets = list(map(to_one_hot, dataset.subsets_info['target']))
-	all_target_idx = list(range(len(all_targets)))
+	# One-hot targets, the unknown targets ('?', encoded -1) have no class
+	target_idx = dataset.targets
+	all_targets = numpy.zeros((len(target_idx), len(COMPARE2021PRSBase.CLASSES)), dtype=bool)
+	known = numpy.where(target_idx >= 0)[0]
+	all_targets[known, target_idx[known]] = True
 
 	# expected occurrence and tolerance
 	total_occur = numpy.sum(all_targets, axis=0)
@@ -91,9 +83,9 @@ def class_balance_split(
 		print('s_expected_occur: ', s_expected_occur)
 		print('sum s expected occur: ', sum(s_expected_occur))
 
-	all_sample = list(zip(all_targets, all_target_idx))
-	s_subset, remaining_sample = fill_subset(all_sample, s_expected_occur)
-	u_subset = numpy.asarray([s[1] for s in remaining_sample])
+	s_mask = greedy_multilabel_split(all_targets, s_expected_occur, seed=seed)
+	s_subset = numpy.where(s_mask)[0]
+	u_subset = numpy.where(~s_mask)[0]
 
 	return s_subset, u_subset
 
@@ -102,56 +94,36 @@ class IterationBalancedSampler(Sampler):
 	def __init__(self, dataset: ComParE2021PRS, index_list: List[int], n_max_samples: int, shuffle: bool = True):
 		super().__init__(None)
 		self.dataset = dataset
-		self.index_list = index_list
+		self.index_list = numpy.asarray(index_list, dtype=numpy.int64)
 		self.n_max_samples = n_max_samples
 		self.shuffle = shuffle
 
-		self.all_targets = dataset.subsets_info['target']
-		self.sorted_sample_indexes = self._sort_per_class()
+		self.all_targets = dataset.targets[self.index_list]
+		self.class_indptr, self.class_indexes = self._sort_per_class()
 
-	def _sort_per_class(self) -> List[List[int]]:
+	def _sort_per_class(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
 		n_classes = len(COMPARE2021PRSBase.CLASSES)
 
-		class_indexes = [[] for _ in range(n_classes)]
-		class_indexes: List[List[int]]
-
-		for sample_idx, target in zip(self.index_list, self.all_targets):
-			target_idx = [target]
-
-			for t_idx in target_idx:
-				class_indexes[t_idx].append(sample_idx)
-
-		return class_indexes
-
-	def _shuffle(self):
-		# Sort the file for each class
-		for i in self.sorted_sample_indexes:
-			random.shuffle(i)
-
-		# Sort the class order
-		random.shuffle(self.sorted_sample_indexes)
+		# The unknown targets ('?', encoded -1) are ignored
+		rows = numpy.where(self.all_targets >= 0)[0]
+		return get_indexes_per_class_csr(rows, self.all_targets[rows], self.index_list, n_classes)
 
 	def __len__(self) -> int:
 		return self.n_max_samples
 
 	def __iter__(self):
 		""" Round Robin algorithm to fetch file one by one from each class.
+		The n_max_samples indexes of the epoch are generated at once.
 		"""
-		if self.shuffle:
-			self._shuffle()
-
-		n_classes = len(COMPARE2021PRSBase.CLASSES)
+		class_order = numpy.where(numpy.diff(self.class_indptr) > 0)[0]
 
-		global_index = 0
-		for cls_idx in itertools.cycle(range(n_classes)):
-			# Increment the global index everytime we looped through all the classes
-			if cls_idx == 0:
-				global_index += 1
-
-			selected_class = self.sorted_sample_indexes[cls_idx]
-			local_idx = global_index % len(selected_class)
+		if self.shuffle:
+			# Shuffle the files of each class and the class order
+			self.class_indexes = shuffle_per_class(self.class_indptr, self.class_indexes)
+			class_order = numpy.random.permutation(class_order)
 
-			yield selected_class[local_idx]
+		indexes = round_robin_per_class(self.class_indptr, self.class_indexes, class_order, self.n_max_samples)
+		return iter(indexes)
 
 
 class InfiniteSampler(Sampler):
@@ -6,13 +6,16 @@
 		- typing & imports
 """
 
+import numpy as np
 import os
 import os.path as osp
 import torchaudio
 
 from torch.utils.data.dataset import Dataset
 from torch import Tensor
-from typing import Tuple
+from typing import Dict, Tuple
+
+from sslh.datasets.manifest import load_or_build_manifest
 
 
 class COMPARE2021PRSBase(Dataset):
@@ -41,6 +44,16 @@ class COMPARE2021PRSBase(Dataset):
 	def __len__(self):
 		return len(self.subsets_info['audio_names'])
 
+	def get_target(self, idx: int) -> int:
+		return self.subsets_info['target'][idx]
+
+	@property
+	def targets(self) -> np.ndarray:
+		"""
+			The targets of all the files, read from the CSV without loading the audio. The unknown targets are -1.
+		"""
+		return np.asarray(self.subsets_info['target'], dtype=np.int64)
+
 	def _to_cls_idx(self, target_str: str) -> int:
 		if target_str == '?':
 			return -1
@@ -48,26 +61,35 @@ class COMPARE2021PRSBase(Dataset):
 		return COMPARE2021PRSBase.CLASSES.index(target_str)
 
 	def _load_csv(self):
-		def read_csv(path) -> dict:
+		def read_csv(path) -> Dict[str, np.ndarray]:
 			with open(path, 'r') as f:
 				lines = f.read().splitlines()
 				lines = lines[1:]
 
+			audio_names = [line.split(',')[0] for line in lines]
 			output = {
-				'audio_names': [line.split(',')[0] for line in lines],
-				'target': [self._to_cls_idx(line.split(',')[1]) for line in lines],
+				'paths': np.asarray([os.path.join('wav', audio_name) for audio_name in audio_names]),
+				'audio_names': np.asarray(audio_names),
+				'target': np.asarray([self._to_cls_idx(line.split(',')[1]) for line in lines], dtype=np.int64),
 			}
 
 			return output
 
-		csv_root = os.path.join(self.root, 'ComParE2021_PRS', 'dist', 'lab')
+		dist_root = os.path.join(self.root, 'ComParE2021_PRS', 'dist')
+		csv_root = os.path.join(dist_root, 'lab')
 		if not osp.isdir(csv_root):
 			raise RuntimeError(f'Invalid CSV root dirpath "{csv_root}".')
 
 		if self.subset == 'train':
-			return read_csv(os.path.join(csv_root, 'train.csv'))
+			csv_path = os.path.join(csv_root, 'train.csv')
 
 		elif self.subset == 'test':
-			return read_csv(os.path.join(csv_root, 'test.csv'))
+			csv_path = os.path.join(csv_root, 'test.csv')
+
+		else:
+			csv_path = os.path.join(csv_root, 'devel.csv')
 
-		return read_csv(os.path.join(csv_root, 'devel.csv'))
+		# The CSV is parsed again only when it or the wav directory changed
+		watched_paths = [csv_path, os.path.join(dist_root, 'wav')]
+		manifest = load_or_build_manifest(dist_root, f'lab_{self.subset}', watched_paths, lambda: read_csv(csv_path))
+		return {key: manifest[key].tolist() for key in ('audio_names', 'target')}
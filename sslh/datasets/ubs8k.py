@@ -1,11 +1,21 @@
+import numpy as np
 import os
 import os.path as osp
+import torch
 import torchaudio
 
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
 from torch import Tensor
 from torch.utils.data.dataset import Dataset
 from torchaudio.transforms import Resample
-from typing import Callable, Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sslh.datasets.manifest import load_or_build_manifest
+from sslh.datasets.utils import build_feature_cache, cache_feature
+
+
+FOLDS = tuple(range(1, 11))
 
 
 class URBANSOUND8K(Dataset):
@@ -28,9 +38,14 @@ class URBANSOUND8K(Dataset):
 		self.meta = self._load_metadata()
 		self.wav_dir = os.path.join(root, self.ROOT_DNAME, 'audio')
 
+		# one resampler per source sample rate, the resampling kernel is computed once
+		self._resamplers = {}
+
 	def __getitem__(self, idx) -> Tuple[Tensor, int]:
+		return self._load_waveform(idx), self.meta['target'][idx]
+
+	def _load_waveform(self, idx: int) -> Tensor:
 		filename = self.meta['filename'][idx]
-		target = self.meta['target'][idx]
 		fold = self.meta['fold'][idx]
 
 		file_path = os.path.join(self.wav_dir, f'fold{fold}', filename)
@@ -38,16 +53,33 @@ class URBANSOUND8K(Dataset):
 		waveform, sr = torchaudio.load(file_path)
 		waveform = self._to_mono(waveform)
 		waveform = self._resample(waveform, sr)
-		waveform = waveform.squeeze()
-
-		return waveform, target
+		return waveform.squeeze()
 
 	def __len__(self) -> int:
 		return len(self.meta['filename'])
 
+	def get_target(self, idx: int) -> int:
+		return self.meta['target'][idx]
+
+	@property
+	def targets(self) -> np.ndarray:
+		"""
+			The targets of all the files, read from the metadata without loading the audio.
+		"""
+		return np.asarray(self.meta['target'], dtype=np.int64)
+
 	def _load_metadata(self) -> Dict[str, list]:
-		csv_path = os.path.join(self.root, self.ROOT_DNAME, 'metadata', 'UrbanSound8K.csv')
+		dataset_root = os.path.join(self.root, self.ROOT_DNAME)
+		csv_path = os.path.join(dataset_root, 'metadata', 'UrbanSound8K.csv')
+		watched_paths = [csv_path] + [os.path.join(dataset_root, 'audio', f'fold{fold}') for fold in FOLDS]
+		manifest = load_or_build_manifest(dataset_root, 'metadata', watched_paths, lambda: self._build_manifest(csv_path))
+		self.manifest = manifest
+
+		mask = np.isin(manifest['fold'], self.folds)
+		info = {key: manifest[key][mask].tolist() for key in ('filename', 'fold', 'target')}
+		return info
 
+	def _build_manifest(self, csv_path: str) -> Dict[str, np.ndarray]:
 		with open(csv_path) as file:
 			lines = file.read().splitlines()
 			lines = lines[1:]  # remove the header
@@ -55,15 +87,21 @@ class URBANSOUND8K(Dataset):
 		info = {'filename': [], 'fold': [], 'target': []}
 		for line in lines:
 			line = line.split(',')
-			if int(line[5]) in self.folds:  # l[6] == file folds
-				info['filename'].append(line[0])
-				info['fold'].append(int(line[5]))
-				info['target'].append(int(line[6]))
+			info['filename'].append(line[0])
+			info['fold'].append(int(line[5]))  # l[6] == file folds
+			info['target'].append(int(line[6]))
 
-		return info
+		paths = [
+			os.path.join('audio', f'fold{fold}', filename)
+			for filename, fold in zip(info['filename'], info['fold'])
+		]
+		return {'paths': np.asarray(paths), **{key: np.asarray(values) for key, values in info.items()}}
 
 	def _resample(self, waveform: Tensor, sr: int) -> Tensor:
-		resampler = Resample(sr, self.resample_sr)
+		resampler = self._resamplers.get(sr)
+		if resampler is None:
+			resampler = Resample(sr, self.resample_sr)
+			self._resamplers[sr] = resampler
 		return resampler(waveform)
 
 	def _to_mono(self, waveform: Tensor) -> Tensor:
@@ -78,23 +116,218 @@ class URBANSOUND8K(Dataset):
 			)
 
 
+def get_arena_paths(root: str, fold: int, resample_sr: int = 22050, dtype: str = 'float32') -> Tuple[str, str, str, str]:
+	"""
+		Returns the paths of the data, offsets, signature and filenames arrays of the arena of a fold.
+
+		:param root: The directory which contain the 'UrbanSound8K' directory.
+		:param fold: The fold of the arena.
+		:param resample_sr: The sample rate of the arena. (default: 22050)
+		:param dtype: The data type of the stored waveforms. (default: 'float32')
+	"""
+	arena_dir = os.path.join(root, URBANSOUND8K.ROOT_DNAME, f'arena_{resample_sr}_{dtype}')
+	return tuple(
+		os.path.join(arena_dir, f'fold{fold}_{name}.npy') for name in ('data', 'offsets', 'signature', 'filenames')
+	)
+
+
+def is_arena_valid(
+	root: str,
+	fold: int,
+	manifest: Dict[str, np.ndarray],
+	resample_sr: int = 22050,
+	dtype: str = 'float32',
+) -> bool:
+	"""
+		Check that the arena of a fold exists and contains the clips of the manifest, in the same order and with the
+		same sizes and modification times as when it was built.
+
+		:param root: The directory which contain the 'UrbanSound8K' directory.
+		:param fold: The fold of the arena.
+		:param manifest: The metadata manifest of the dataset, see URBANSOUND8K.manifest.
+		:param resample_sr: The sample rate of the arena. (default: 22050)
+		:param dtype: The data type of the stored waveforms. (default: 'float32')
+		:return: True if the arena can be used.
+	"""
+	paths = get_arena_paths(root, fold, resample_sr, dtype)
+	if not all(osp.isfile(path) for path in paths):
+		return False
+
+	_, _, signature_path, filenames_path = paths
+	mask = manifest['fold'] == fold
+	return (
+		np.array_equal(np.load(filenames_path), manifest['filename'][mask])
+		and np.array_equal(np.load(signature_path), _get_arena_signature(manifest, fold))
+	)
+
+
+def build_arena(
+	root: str,
+	folds: Iterable[int] = FOLDS,
+	resample_sr: int = 22050,
+	dtype: str = 'float32',
+	n_workers: int = 8,
+	verbose: bool = True,
+):
+	"""
+		Store the UBS8K clips already converted to mono and resampled, one arena per fold.
+
+		The arena of a fold is a single buffer with all its clips concatenated, an offsets array (the clip i is
+		data[offsets[i]:offsets[i + 1]]), the sizes and modification times of the files and the filenames of the clips,
+		in the order of the metadata CSV. Each array is written atomically and the filenames array is written last, so
+		an interrupted build is done again.
+
+		:param root: The directory which contain the 'UrbanSound8K' directory.
+		:param folds: The folds to process. (default: (1, 2, ..., 10))
+		:param resample_sr: The sample rate of the arena. (default: 22050)
+		:param dtype: The data type of the stored waveforms. A type smaller than float32 is lossy. (default: 'float32')
+		:param n_workers: The number of threads decoding the files. (default: 8)
+		:param verbose: If True, display the progress of the build. (default: True)
+	"""
+	for fold in folds:
+		dataset = URBANSOUND8K(root, [fold], resample_sr)
+		data_path, offsets_path, signature_path, filenames_path = get_arena_paths(root, fold, resample_sr, dtype)
+		os.makedirs(osp.dirname(data_path), exist_ok=True)
+
+		with ThreadPoolExecutor(n_workers) as executor:
+			waveforms = list(tqdm(
+				executor.map(lambda idx: dataset._load_waveform(idx).numpy().astype(dtype), range(len(dataset))),
+				total=len(dataset),
+				desc=f'fold{fold}',
+				disable=not verbose,
+			))
+
+		offsets = np.concatenate(([0], np.cumsum([len(waveform) for waveform in waveforms]))).astype(np.int64)
+		_save_atomic(data_path, np.concatenate(waveforms))
+		_save_atomic(offsets_path, offsets)
+		_save_atomic(signature_path, _get_arena_signature(dataset.manifest, fold))
+		_save_atomic(filenames_path, np.asarray(dataset.meta['filename']))
+
+
+def prepare_arenas(
+	root: str,
+	folds: Iterable[int] = FOLDS,
+	resample_sr: int = 22050,
+	dtype: str = 'float32',
+	n_workers: int = 8,
+	verbose: bool = True,
+):
+	"""
+		Build the arenas of the folds which are missing or which do not match the files of the dataset anymore.
+
+		:param root: The directory which contain the 'UrbanSound8K' directory.
+		:param folds: The folds to process. (default: (1, 2, ..., 10))
+		:param resample_sr: The sample rate of the arenas. (default: 22050)
+		:param dtype: The data type of the stored waveforms. (default: 'float32')
+		:param n_workers: The number of threads decoding the files. (default: 8)
+		:param verbose: If True, display the progress of the build. (default: True)
+	"""
+	manifest = URBANSOUND8K(root, list(folds), resample_sr).manifest
+	stale = [fold for fold in folds if not is_arena_valid(root, fold, manifest, resample_sr, dtype)]
+	if len(stale) > 0:
+		build_arena(root, stale, resample_sr, dtype, n_workers, verbose)
+
+
+def _get_arena_signature(manifest: Dict[str, np.ndarray], fold: int) -> np.ndarray:
+	mask = manifest['fold'] == fold
+	return np.stack((manifest['sizes'][mask], manifest['mtimes'][mask]), axis=1).astype(np.int64)
+
+
+def _save_atomic(fpath: str, array: np.ndarray):
+	tmp_fpath = f'{fpath}.{os.getpid()}.tmp.npy'
+	np.save(tmp_fpath, array)
+	os.replace(tmp_fpath, fpath)
+
+
 class UBS8KDataset(URBANSOUND8K):
-	def __init__(self, root: str, folds: List[int], transform: Optional[Callable] = None, cached: bool = False):
+	def __init__(
+		self,
+		root: str,
+		folds: List[int],
+		transform: Optional[Callable] = None,
+		cached: bool = False,
+		cache_nbytes: int = 1024 ** 3,
+		arena: bool = False,
+	):
+		"""
+			UBS8K dataset with optional transform and cache of the resampled waveforms.
+
+			:param root: The directory path to the dataset root.
+			:param folds: The folds to use.
+			:param transform: The optional transform to apply to the waveforms. (default: None)
+			:param cached: If True, the resampled waveforms are stored in a cache shared by the DataLoader workers.
+				The cache is not used with the arena. (default: False)
+			:param cache_nbytes: The memory budget of the cache in bytes. (default: 1 GB)
+			:param arena: If True, read the pre-resampled waveforms of the fold arenas with numpy memmap instead of
+				decoding and resampling the WAV files. The arenas must be built before, see prepare_arenas.
+				(default: False)
+		"""
 		super().__init__(osp.dirname(root), folds)
 		self.transform = transform
 		self.cached = cached
-		self._waveform_cache = {}
+		self.arena = arena
 
-	def __getitem__(self, idx: int) -> Tuple[Tensor, int]:
-		if idx in self._waveform_cache.keys():
-			waveform = self._waveform_cache[idx]
-			target = self.meta['target'][idx]
+		# arenas of the folds, mapped lazily in each process
+		self._arena_data = {}
+		self._arena_offsets = {}
+		self._arena_rows = None
+
+		if self.arena:
+			self._prepare_arena()
+			self.feature_cache = None
 		else:
-			waveform, target = super().__getitem__(idx)
-			if self.cached:
-				self._waveform_cache[idx] = waveform
+			self.feature_cache = build_feature_cache(cache_nbytes) if cached else None
+
+	def __getitem__(self, idx: int) -> Tuple[Tensor, int]:
+		waveform, target = self._get_resampled_item(idx)
 
 		if self.transform is not None:
 			waveform = self.transform(waveform)
 
 		return waveform, target
+
+	@cache_feature
+	def _get_resampled_item(self, idx: int) -> Tuple[Tensor, int]:
+		if self.arena:
+			return self._load_arena_waveform(idx), self.meta['target'][idx]
+		return super().__getitem__(idx)
+
+	def _prepare_arena(self):
+		for fold in self.folds:
+			if not is_arena_valid(self.root, fold, self.manifest, self.resample_sr):
+				raise RuntimeError(
+					f'The arena of the fold {fold} in "{self.root}" is missing or does not match the files of the dataset. '
+					f'Build it with prepare_arenas before using arena=True.'
+				)
+
+		# row of each file in the arena of its fold, the arenas are in the order of the manifest
+		self._arena_rows = np.empty(len(self), dtype=np.int64)
+		folds = np.asarray(self.meta['fold'])
+
+		for fold in self.folds:
+			_, offsets_path, _, _ = get_arena_paths(self.root, fold, self.resample_sr)
+			self._arena_offsets[fold] = np.load(offsets_path)
+			indexes = np.where(folds == fold)[0]
+			self._arena_rows[indexes] = np.arange(len(indexes))
+
+	def _load_arena_waveform(self, idx: int) -> Tensor:
+		fold = self.meta['fold'][idx]
+		data = self._arena_data.get(fold)
+		if data is None:
+			data_path, _, _, _ = get_arena_paths(self.root, fold, self.resample_sr)
+			# copy-on-write mode gives writable arrays for torch.from_numpy without copying the pages
+			data = np.load(data_path, mmap_mode='c')
+			self._arena_data[fold] = data
+
+		row = self._arena_rows[idx]
+		offsets = self._arena_offsets[fold]
+		waveform = data[offsets[row]:offsets[row + 1]]
+
+		# zero-copy for float32 arenas
+		return torch.from_numpy(waveform.astype(np.float32, copy=False))
+
+	def __getstate__(self) -> dict:
+		# The arenas are mapped again by the process which unpickle the dataset instead of copying the data
+		state = dict(self.__dict__)
+		state['_arena_data'] = {}
+		return state
@@ -1,12 +1,403 @@
+import functools
+import multiprocessing
+import numpy as np
+import torch
+
+from torch import Tensor
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+
+# Data types that can be stored in a SharedFeatureCache, the index is stored in the metadata of the entry
+CACHE_DTYPES = ('float32', 'float64', 'float16', 'int8', 'int16', 'int32', 'int64', 'uint8', 'bool')
+CACHE_MAX_NDIM = 4
+
+# Columns of the metadata stored with the first block of each entry
+_META_NBYTES, _META_DTYPE, _META_IS_TENSOR, _META_NDIM, _META_SHAPE = 0, 1, 2, 3, 4
+
+
+class SharedFeatureCache:
+	def __init__(self, max_nbytes: int = 1024 ** 3, block_nbytes: int = 64 * 1024):
+		"""
+			LRU cache of decoded features (e.g. waveforms) stored in shared memory, indexed by an integer key.
+
+			The memory is allocated when the cache is built, so a cache created before the DataLoader workers are
+			started is shared by all the workers of all the loaders which read the same dataset : each feature is
+			decoded and stored once. The memory is divided in blocks of block_nbytes bytes, an entry uses as many blocks
+			as needed and the least recently used entries are evicted when the budget is reached.
+			The shared memory is allocated lazily by the system, so only the blocks used consume memory.
+
+			:param max_nbytes: The memory budget in bytes. (default: 1 GB)
+			:param block_nbytes: The size of a block in bytes. (default: 64 KB)
+		"""
+		n_blocks = max(max_nbytes // block_nbytes, 0)
+
+		self.max_nbytes = n_blocks * block_nbytes
+		self.block_nbytes = block_nbytes
+		self.n_blocks = n_blocks
+
+		# The storage is created directly in shared memory, its pages are not touched before being used
+		arena_storage = torch.ByteStorage._new_shared(n_blocks * block_nbytes)
+		self._arena = torch.empty(0, dtype=torch.uint8).set_(arena_storage)
+		# Key of the entry which uses the block, -1 for a free block
+		self._block_owner = torch.full((n_blocks,), -1, dtype=torch.int64).share_memory_()
+		self._block_last_used = torch.zeros(n_blocks, dtype=torch.int64).share_memory_()
+		self._block_meta = torch.zeros(n_blocks, _META_SHAPE + CACHE_MAX_NDIM, dtype=torch.int64).share_memory_()
+		# Clock of the LRU, number of hits and number of misses
+		self._counters = torch.zeros(3, dtype=torch.int64).share_memory_()
+		self._lock = multiprocessing.Lock()
+
+	def get(self, key: int) -> Optional[Union[Tensor, np.ndarray]]:
+		"""
+			:param key: The integer key of the entry.
+			:return: A copy of the entry stored or None if the key is not in the cache.
+		"""
+		block_owner = self._block_owner.numpy()
+		counters = self._counters.numpy()
+
+		with self._lock:
+			blocks = np.flatnonzero(block_owner == key)
+			if len(blocks) == 0:
+				counters[2] += 1
+				return None
+
+			# The metadata is copied because the entry can be evicted by another process after the lock is released
+			meta = self._block_meta.numpy()[blocks[0]].copy()
+			nbytes = meta[_META_NBYTES]
+			data = self._arena.numpy().reshape(self.n_blocks, self.block_nbytes)[blocks].reshape(-1)[:nbytes]
+
+			self._block_last_used.numpy()[blocks] = counters[0]
+			counters[0] += 1
+			counters[1] += 1
+
+		shape = tuple(meta[_META_SHAPE:_META_SHAPE + meta[_META_NDIM]])
+		data = data.view(CACHE_DTYPES[meta[_META_DTYPE]]).reshape(shape)
+
+		if meta[_META_IS_TENSOR]:
+			return torch.from_numpy(data)
+		return data
+
+	def put(self, key: int, value: Union[Tensor, np.ndarray]):
+		"""
+			Store an entry. The value is ignored if it is too big for the cache or if its type is not supported.
+
+			:param key: The integer key of the entry.
+			:param value: The tensor or numpy array to store.
+		"""
+		is_tensor = isinstance(value, Tensor)
+		array = np.ascontiguousarray(value.numpy() if is_tensor else value)
+
+		if (
+			array.dtype.name not in CACHE_DTYPES
+			or array.ndim > CACHE_MAX_NDIM
+			or array.nbytes > self.max_nbytes
+		):
+			return
+
+		n_needed = max(-(-array.nbytes // self.block_nbytes), 1)
+		block_owner = self._block_owner.numpy()
+		block_last_used = self._block_last_used.numpy()
+		counters = self._counters.numpy()
+
+		with self._lock:
+			if np.any(block_owner == key):
+				return
+
+			free = np.flatnonzero(block_owner == -1)
+			if len(free) < n_needed:
+				self._evict(n_needed - len(free))
+				free = np.flatnonzero(block_owner == -1)
+
+			blocks = free[:n_needed]
+			arena = self._arena.numpy().reshape(self.n_blocks, self.block_nbytes)
+			flat = array.reshape(-1).view(np.uint8)
+			n_full = len(flat) // self.block_nbytes
+			arena[blocks[:n_full]] = flat[:n_full * self.block_nbytes].reshape(n_full, self.block_nbytes)
+			if n_full < len(blocks):
+				rest = flat[n_full * self.block_nbytes:]
+				arena[blocks[n_full], :len(rest)] = rest
+
+			meta = self._block_meta.numpy()[blocks[0]]
+			meta[:] = 0
+			meta[_META_NBYTES] = array.nbytes
+			meta[_META_DTYPE] = CACHE_DTYPES.index(array.dtype.name)
+			meta[_META_IS_TENSOR] = is_tensor
+			meta[_META_NDIM] = array.ndim
+			meta[_META_SHAPE:_META_SHAPE + array.ndim] = array.shape
+
+			block_owner[blocks] = key
+			block_last_used[blocks] = counters[0]
+			counters[0] += 1
+
+	def _evict(self, n_blocks: int):
+		# Free the least recently used entries until n_blocks are freed (the lock must be held)
+		block_owner = self._block_owner.numpy()
+		used = np.flatnonzero(block_owner != -1)
+		order = used[np.argsort(self._block_last_used.numpy()[used], kind='stable')]
+
+		# The blocks of an entry have the same last used value, so the first n_blocks blocks cover whole entries
+		# except maybe the last one, which is also evicted
+		evicted_keys = np.unique(block_owner[order[:n_blocks]])
+		block_owner[np.isin(block_owner, evicted_keys)] = -1
+
+	def clear(self):
+		with self._lock:
+			self._block_owner.fill_(-1)
+			self._counters.zero_()
+
+	def get_stats(self) -> Dict[str, Any]:
+		"""
+			:return: The number of hits and misses, the hit rate, the number of entries and the number of bytes used.
+		"""
+		block_owner = self._block_owner.numpy()
+		n_hits, n_misses = int(self._counters[1]), int(self._counters[2])
+		n_total = n_hits + n_misses
+		used = block_owner[block_owner != -1]
+		return dict(
+			n_hits=n_hits,
+			n_misses=n_misses,
+			hit_rate=n_hits / n_total if n_total > 0 else 0.0,
+			n_entries=len(np.unique(used)),
+			nbytes=len(used) * self.block_nbytes,
+			max_nbytes=self.max_nbytes,
+		)
+
+	def keys(self) -> np.ndarray:
+		"""
+			:return: The keys of the entries stored.
+		"""
+		block_owner = self._block_owner.numpy()
+		return np.unique(block_owner[block_owner != -1])
+
+	def __contains__(self, key: int) -> bool:
+		return bool(np.any(self._block_owner.numpy() == key))
+
 
 def cache_feature(func):
-	def decorator(*args, **kwargs):
-		key = ','.join(map(str, args))
+	"""
+		Decorator of the __getitem__ method of a dataset which stores the decoded data in the dataset feature_cache.
+
+		The data is the first output of __getitem__. When it is found in the cache, the target is read with
+		dataset.get_target(index) and the pair (data, target) is returned.
+		If the dataset has no feature_cache (or None), the method is always called.
+	"""
+	@functools.wraps(func)
+	def decorator(self, index: int):
+		cache = getattr(self, 'feature_cache', None)
+		if cache is None:
+			return func(self, index)
 
-		if key not in decorator.cache:
-			decorator.cache[key] = func(*args, **kwargs)
+		data = cache.get(int(index))
+		if data is not None:
+			return data, self.get_target(index)
 
-		return decorator.cache[key]
+		outputs = func(self, index)
+		cache.put(int(index), outputs[0])
+		return outputs
 
-	decorator.cache = dict()
 	return decorator
+
+
+def build_feature_cache(max_nbytes: int) -> Optional[SharedFeatureCache]:
+	"""
+		:param max_nbytes: The memory budget of the cache in bytes. 0 disable the cache.
+		:return: The SharedFeatureCache or None if the cache is disabled.
+	"""
+	if max_nbytes <= 0:
+		return None
+	return SharedFeatureCache(max_nbytes)
+
+
+def get_indexes_per_class_csr(
+	rows: np.ndarray,
+	classes: np.ndarray,
+	indexes: np.ndarray,
+	n_classes: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+	"""
+		Group dataset indexes per class in a CSR layout.
+
+		The indexes of the class c are class_indexes[indptr[c]:indptr[c + 1]].
+
+		:param rows: The positions in indexes of each (sample, class) pair, e.g. the first output of np.nonzero(targets).
+		:param classes: The class of each (sample, class) pair.
+		:param indexes: The dataset indexes of the samples.
+		:param n_classes: The number of classes.
+		:return: The tuple (indptr, class_indexes).
+	"""
+	order = np.argsort(classes, kind='stable')
+	class_indexes = np.asarray(indexes)[rows[order]]
+	counts = np.bincount(classes, minlength=n_classes)
+	indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+	return indptr, class_indexes
+
+
+def shuffle_per_class(indptr: np.ndarray, class_indexes: np.ndarray) -> np.ndarray:
+	"""
+		Shuffle the indexes inside each class of a CSR layout.
+
+		:param indptr: The class pointers of the CSR layout.
+		:param class_indexes: The indexes sorted by class.
+		:return: The shuffled copy of class_indexes.
+	"""
+	counts = np.diff(indptr)
+	entry_classes = np.repeat(np.arange(len(counts)), counts)
+	# Sort by class first, then by a random key inside each class
+	permutation = np.lexsort((np.random.random(len(class_indexes)), entry_classes))
+	return class_indexes[permutation]
+
+
+def round_robin_per_class(
+	indptr: np.ndarray,
+	class_indexes: np.ndarray,
+	class_order: np.ndarray,
+	n_samples: int,
+) -> np.ndarray:
+	"""
+		Pick the indexes one by one from each class with a Round Robin algorithm.
+
+		The k-th index comes from the class class_order[k % n_classes_order], and each class cycles over its own
+		indexes once per round, so every index of a class is used before one of them is repeated.
+
+		:param indptr: The class pointers of the CSR layout.
+		:param class_indexes: The indexes sorted by class.
+		:param class_order: The order of the classes to visit. The classes without index must be excluded.
+		:param n_samples: The number of indexes to generate.
+		:return: The array of indexes of shape (n_samples,).
+	"""
+	steps = np.arange(n_samples, dtype=np.int64)
+	classes = class_order[steps % len(class_order)]
+	rounds = steps // len(class_order)
+	counts = indptr[classes + 1] - indptr[classes]
+	return class_indexes[indptr[classes] + rounds % counts]
+
+
+def greedy_multilabel_split(
+	targets: np.ndarray,
+	expected: np.ndarray,
+	available: Optional[np.ndarray] = None,
+	seed: Optional[int] = None,
+) -> np.ndarray:
+	"""
+		Select a subset where each class reach its expected number of occurrences with a greedy algorithm.
+
+		The classes are visited in order and, for each class, the first available samples containing it are taken
+		until the occurrences of the class in the subset reach the expected value. A sample taken adds an occurrence
+		to each of its classes. The cost is O(N·C) for N samples and C classes.
+
+		:param targets: The multi-hot targets of shape (N, C).
+		:param expected: The expected number of occurrences of each class in the subset, of shape (C,).
+		:param available: The boolean mask of the samples which can be taken. If None, all samples are available.
+			(default: None)
+		:param seed: The seed of the order in which the samples are visited. If None, use the dataset order.
+			(default: None)
+		:return: The boolean mask of the samples selected.
+	"""
+	n_samples, n_classes = targets.shape
+	rows, classes = np.nonzero(targets)
+	indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=n_samples)))).astype(np.int64)
+	return greedy_multilabel_split_csr(indptr, classes, n_classes, expected, available, seed)
+
+
+def greedy_multilabel_split_csr(
+	indptr: np.ndarray,
+	indices: np.ndarray,
+	n_classes: int,
+	expected: np.ndarray,
+	available: Optional[np.ndarray] = None,
+	seed: Optional[int] = None,
+) -> np.ndarray:
+	"""
+		Same as greedy_multilabel_split with the targets in a CSR layout, so they are never densified.
+
+		The classes of the sample i are indices[indptr[i]:indptr[i + 1]]. The cost is O(P log P) for the P positive
+		targets.
+
+		:param indptr: The pointers of each sample in indices, of shape (N + 1,).
+		:param indices: The classes of all the samples.
+		:param n_classes: The number of classes.
+		:param expected: The expected number of occurrences of each class in the subset, of shape (C,).
+		:param available: The boolean mask of the samples which can be taken. If None, all samples are available.
+			(default: None)
+		:param seed: The seed of the order in which the samples are visited. If None, use the dataset order.
+			(default: None)
+		:return: The boolean mask of the samples selected.
+	"""
+	indptr = np.asarray(indptr, dtype=np.int64)
+	indices = np.asarray(indices, dtype=np.int64)
+	n_samples = len(indptr) - 1
+	if available is None:
+		available = np.ones(n_samples, dtype=bool)
+	else:
+		available = np.array(available, dtype=bool)
+
+	if seed is None:
+		rank = np.arange(n_samples)
+	else:
+		rank = np.empty(n_samples, dtype=np.int64)
+		rank[np.random.RandomState(seed).permutation(n_samples)] = np.arange(n_samples)
+
+	# Samples of each class, sorted by visit order
+	rows = np.repeat(np.arange(n_samples), np.diff(indptr))
+	order = np.lexsort((rank[rows], indices))
+	class_indexes = rows[order]
+	class_indptr = np.concatenate(([0], np.cumsum(np.bincount(indices, minlength=n_classes)))).astype(np.int64)
+
+	selected = np.zeros(n_samples, dtype=bool)
+	occurrences = np.zeros(n_classes, dtype=np.int64)
+
+	for class_idx in range(n_classes):
+		n_missing = int(expected[class_idx]) - occurrences[class_idx]
+		if n_missing <= 0:
+			continue
+
+		candidates = class_indexes[class_indptr[class_idx]:class_indptr[class_idx + 1]]
+		taken = candidates[available[candidates]][:n_missing]
+
+		available[taken] = False
+		selected[taken] = True
+
+		# Classes of the samples taken, read from indices without densifying their targets
+		counts = indptr[taken + 1] - indptr[taken]
+		positions = np.arange(counts.sum()) + np.repeat(indptr[taken] - (np.cumsum(counts) - counts), counts)
+		occurrences += np.bincount(indices[positions], minlength=n_classes)
+
+	return selected
+
+
+def balanced_split_from_targets(
+	targets: np.ndarray,
+	n_classes: int,
+	ratios: List[float],
+	shuffle: bool = True,
+) -> List[np.ndarray]:
+	"""
+		Split the indexes of a monolabel dataset in subsets which have the same class distribution.
+
+		Only the targets are read, so the audio of the dataset is never decoded.
+		The samples with a negative target are ignored.
+
+		:param targets: The class index of each sample, of shape (N,).
+		:param n_classes: The number of classes.
+		:param ratios: The ratio of each subset in [0, 1]. Their sum must be lower or equal to 1.
+		:param shuffle: If True, shuffle the indexes of each class before the split. (default: True)
+		:return: The list of indexes arrays of each subset.
+	"""
+	targets = np.asarray(targets)
+	rows = np.where(targets >= 0)[0]
+	indptr, class_indexes = get_indexes_per_class_csr(rows, targets[rows], np.arange(len(targets)), n_classes)
+	if shuffle:
+		class_indexes = shuffle_per_class(indptr, class_indexes)
+
+	counts = np.diff(indptr)
+	entry_classes = np.repeat(np.arange(n_classes), counts)
+	positions = np.arange(len(class_indexes)) - indptr[entry_classes]
+
+	# Bounds of each subset inside each class, rounded to avoid float errors when the ratios sum to 1
+	cum_ratios = np.concatenate(([0.0], np.cumsum(ratios)))
+	bounds = np.floor(np.round(cum_ratios[:, None] * counts[None, :], 6)).astype(np.int64)
+
+	splits = []
+	for i in range(len(ratios)):
+		mask = (bounds[i][entry_classes] <= positions) & (positions < bounds[i + 1][entry_classes])
+		splits.append(class_indexes[mask])
+	return splits
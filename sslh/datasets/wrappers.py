@@ -0,0 +1,179 @@
+
+import numpy as np
+import random
+import torch
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from torch import Tensor
+from torch.utils.data.dataset import Dataset, IterableDataset
+from torch.utils.data.dataloader import get_worker_info
+from torch.utils.data.sampler import Sampler
+from typing import Any, Deque, Iterator, Sequence, Tuple
+
+
+class PrefetchDataset(IterableDataset):
+	def __init__(
+		self,
+		dataset: Dataset,
+		sampler: Sampler,
+		batch_size: int,
+		depth: int = 16,
+		max_nbytes: int = 256 * 1024 ** 2,
+		n_threads: int = 4,
+	):
+		"""
+			Iterable wrapper which load the items of the next indexes of a sampler in a thread pool.
+
+			The file reads and the audio decoding release the GIL, so the threads hide the latency of each file
+			(e.g. on network filesystems) even with a few DataLoader workers.
+			The wrapper replace the sampler of the DataLoader : each worker iterates on the same sampler order and
+			keeps the batches that the DataLoader asks to it, so the order of the batches is the same than with the
+			sampler when the DataLoader use the same batch size.
+
+			:param dataset: The map-style dataset to wrap.
+			:param sampler: The sampler of the indexes to load.
+			:param batch_size: The batch size of the DataLoader.
+			:param depth: The maximal number of items loaded in advance by each worker. (default: 16)
+			:param max_nbytes: The maximal size of the items loading or loaded and not yet returned by each worker.
+				The items still loading are counted with the mean size of the previous items.
+				At least one item is always loaded. (default: 256 MiB)
+			:param n_threads: The number of loading threads of each worker. (default: 4)
+		"""
+		if depth < 1:
+			raise ValueError(f'Invalid prefetch depth "{depth}". Must be >= 1.')
+
+		super().__init__()
+		self.dataset = dataset
+		self.sampler = sampler
+		self.batch_size = batch_size
+		self.depth = depth
+		self.max_nbytes = max_nbytes
+		self.n_threads = n_threads
+
+	def __iter__(self) -> Iterator[Any]:
+		# The sampler order is drawn before the loading threads start, see _iter_worker_indexes
+		indexes = self._iter_worker_indexes(self._get_sampler_order())
+		pending: Deque[Future] = deque()
+		exhausted = False
+		# Estimated size of the items still loading, from the items already returned
+		n_items, total_nbytes = 0, 0
+
+		with ThreadPoolExecutor(self.n_threads) as executor:
+			try:
+				while True:
+					while not exhausted and len(pending) < self.depth:
+						mean_nbytes = total_nbytes // n_items if n_items > 0 else 0
+						if len(pending) > 0 and _get_pending_nbytes(pending, mean_nbytes) >= self.max_nbytes:
+							break
+						idx = next(indexes, None)
+						if idx is None:
+							exhausted = True
+						else:
+							pending.append(executor.submit(self._load_item, idx))
+
+					if len(pending) == 0:
+						break
+					item, nbytes = pending.popleft().result()
+					n_items += 1
+					total_nbytes += nbytes
+					yield item
+			finally:
+				# The iteration can be stopped early, the items not started are not loaded
+				for future in pending:
+					future.cancel()
+
+	def __len__(self) -> int:
+		return len(self.sampler)
+
+	def _load_item(self, idx: int) -> Tuple[Any, int]:
+		item = self.dataset[idx]
+		return item, _get_nbytes(item)
+
+	def _get_sampler_order(self) -> np.ndarray:
+		worker_info = get_worker_info()
+		if worker_info is None:
+			return np.fromiter(self.sampler, dtype=np.int64)
+
+		# All the workers must draw the same sampler order, so the sampler use the RNGs seeded by the base seed of the
+		# epoch shared by the workers. The whole order is drawn here, before the loading threads start, because the
+		# random augments of the items also draw from the global RNGs and would change the order of this worker only.
+		base_seed = worker_info.seed - worker_info.id
+		worker_states = _get_rng_states()
+		try:
+			random.seed(base_seed)
+			np.random.seed(base_seed % 2 ** 32)
+			torch.manual_seed(base_seed)
+			return np.fromiter(self.sampler, dtype=np.int64)
+		finally:
+			_set_rng_states(worker_states)
+
+	def _iter_worker_indexes(self, order: np.ndarray) -> Iterator[int]:
+		worker_info = get_worker_info()
+		if worker_info is None:
+			yield from order.tolist()
+			return
+
+		# The DataLoader asks the batches to the workers in round robin
+		batch_workers = (np.arange(len(order)) // self.batch_size) % worker_info.num_workers
+		yield from order[batch_workers == worker_info.id].tolist()
+
+
+class CachedBatchDataset(Dataset):
+	def __init__(self, arrays: Sequence[np.ndarray], batch_size: int):
+		"""
+			Dataset of the consecutive batches of arrays materialised in memory or in memmaps.
+
+			An item is a whole batch, so the DataLoader must use batch_size=None. The batches are slices of the arrays,
+			without any per-item indexing or collate.
+
+			:param arrays: The arrays of the same length, e.g. the features and the targets.
+			:param batch_size: The size of the batches. The last batch can be smaller.
+		"""
+		if len(set(len(array) for array in arrays)) > 1:
+			raise ValueError('Cannot build a CachedBatchDataset with arrays of different lengths.')
+
+		super().__init__()
+		self.arrays = list(arrays)
+		self.batch_size = batch_size
+
+	def __getitem__(self, idx: int) -> Tuple[Tensor, ...]:
+		if not 0 <= idx < len(self):
+			raise IndexError(f'Invalid batch index "{idx}" for {len(self)} batches.')
+		start = idx * self.batch_size
+		end = start + self.batch_size
+		return tuple(torch.from_numpy(np.ascontiguousarray(array[start:end])) for array in self.arrays)
+
+	def __len__(self) -> int:
+		n_items = len(self.arrays[0]) if len(self.arrays) > 0 else 0
+		return (n_items + self.batch_size - 1) // self.batch_size
+
+
+def _get_pending_nbytes(pending: Deque[Future], mean_nbytes: int) -> int:
+	return sum(
+		future.result()[1] if future.done() and not future.cancelled() else mean_nbytes
+		for future in pending
+	)
+
+
+def _get_rng_states() -> Tuple[Any, Any, Tensor]:
+	return random.getstate(), np.random.get_state(), torch.get_rng_state()
+
+
+def _set_rng_states(states: Tuple[Any, Any, Tensor]):
+	random.setstate(states[0])
+	np.random.set_state(states[1])
+	torch.set_rng_state(states[2])
+
+
+def _get_nbytes(item: Any) -> int:
+	if isinstance(item, Tensor):
+		return item.element_size() * item.nelement()
+	elif isinstance(item, np.ndarray):
+		return item.nbytes
+	elif isinstance(item, (list, tuple)):
+		return sum(_get_nbytes(sub_item) for sub_item in item)
+	elif isinstance(item, dict):
+		return sum(_get_nbytes(sub_item) for sub_item in item.values())
+	else:
+		return 0
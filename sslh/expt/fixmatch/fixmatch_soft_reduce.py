@@ -4,7 +4,7 @@ import torch
 from torch import Tensor
 from torch.nn import Module, Softmax
 from torch.optim.optimizer import Optimizer
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, Optional, Tuple
 
 from mlu.nn import CrossEntropyWithVectors, OneHot
 from sslh.expt.fixmatch.fixmatch import FixMatch
@@ -24,6 +24,7 @@ class FixMatchSoftReduce(FixMatch):
 		train_metrics: Optional[Dict[str, Module]] = None,
 		val_metrics: Optional[Dict[str, Module]] = None,
 		log_on_epoch: bool = True,
+		augment_strong_batch: Optional[Callable] = None,
 	):
 		"""
 			FixMatch with soft unlabeled reduce (FMS) LightningModule.
@@ -51,6 +52,9 @@ class FixMatchSoftReduce(FixMatch):
 				(default: None)
 			:param log_on_epoch: If True, log only the epoch means of each train metric score.
 				(default: True)
+			:param augment_strong_batch: The optional batched augment applied on device to the strong unlabeled batch.
+				Used with the batched pools, when the workers return the strong view without augment.
+				(default: None)
 		"""
 		super().__init__(
 			model=model,
@@ -64,6 +68,7 @@ class FixMatchSoftReduce(FixMatch):
 			train_metrics=train_metrics,
 			val_metrics=val_metrics,
 			log_on_epoch=log_on_epoch,
+			augment_strong_batch=augment_strong_batch,
 		)
 
 	def training_step(
@@ -72,6 +77,9 @@ class FixMatchSoftReduce(FixMatch):
 		batch_idx: int,
 	):
 		(xs_weak, ys), (xu_weak, xu_strong) = batch
+		if self.augment_strong_batch is not None:
+			with torch.no_grad():
+				xu_strong = self.augment_strong_batch(xu_strong)
 
 		# Compute pseudo-labels 'yu' and mask
 		yu, mask = self.guess_label_and_mask(xu_weak)
@@ -4,7 +4,7 @@ import torch
 from torch import Tensor
 from torch.nn import Module, Softmax
 from torch.optim.optimizer import Optimizer
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, Optional, Tuple
 
 from mlu.nn import CrossEntropyWithVectors, Identity
 from sslh.expt.fixmatch.fixmatch import FixMatch
@@ -24,6 +24,7 @@ class FixMatchThresholdGuess(FixMatch):
 		train_metrics: Optional[Dict[str, Module]] = None,
 		val_metrics: Optional[Dict[str, Module]] = None,
 		log_on_epoch: bool = True,
+		augment_strong_batch: Optional[Callable] = None,
 	):
 		"""
 			FixMatch with Threshold Guess pseudo label (FMTG) LightningModule.
@@ -49,6 +50,9 @@ class FixMatchThresholdGuess(FixMatch):
 				(default: None)
 			:param log_on_epoch: If True, log only the epoch means of each train metric score.
 				(default: True)
+			:param augment_strong_batch: The optional batched augment applied on device to the strong unlabeled batch.
+				Used with the batched pools, when the workers return the strong view without augment.
+				(default: None)
 		"""
 		super().__init__(
 			model=model,
@@ -62,6 +66,7 @@ class FixMatchThresholdGuess(FixMatch):
 			train_metrics=train_metrics,
 			val_metrics=val_metrics,
 			log_on_epoch=log_on_epoch,
+			augment_strong_batch=augment_strong_batch,
 		)
 		self.threshold_guess = threshold_guess
 
@@ -4,7 +4,7 @@ import torch
 from torch import Tensor
 from torch.nn import Module, Softmax
 from torch.optim.optimizer import Optimizer
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, Optional, Tuple
 
 from mlu.nn import CrossEntropyWithVectors, OneHot
 from sslh.transforms.augments.mixup import MixUpModule
@@ -26,6 +26,7 @@ class FixMix(FixMatch):
 		train_metrics: Optional[Dict[str, Module]] = None,
 		val_metrics: Optional[Dict[str, Module]] = None,
 		log_on_epoch: bool = True,
+		augment_strong_batch: Optional[Callable] = None,
 	):
 		"""
 			FixMatch with MixMatch and soft reduction with mask (FMX) LightningModule.
@@ -53,6 +54,9 @@ class FixMix(FixMatch):
 				(default: None)
 			:param log_on_epoch: If True, log only the epoch means of each train metric score.
 				(default: True)
+			:param augment_strong_batch: The optional batched augment applied on device to the strong unlabeled batch.
+				Used with the batched pools, when the workers return the strong view without augment.
+				(default: None)
 		"""
 		super().__init__(
 			model=model,
@@ -66,6 +70,7 @@ class FixMix(FixMatch):
 			train_metrics=train_metrics,
 			val_metrics=val_metrics,
 			log_on_epoch=log_on_epoch,
+			augment_strong_batch=augment_strong_batch,
 		)
 
 		self.alpha = alpha
@@ -78,6 +83,9 @@ class FixMix(FixMatch):
 		batch_idx: int,
 	) -> Tensor:
 		(xs_weak, ys), (xu_weak, xu_strong) = batch
+		if self.augment_strong_batch is not None:
+			with torch.no_grad():
+				xu_strong = self.augment_strong_batch(xu_strong)
 
 		# Compute pseudo-labels 'yu' and mask
 		with torch.no_grad():
@@ -2,6 +2,8 @@
 from torch.nn import Module
 from typing import Any, Callable, Tuple
 
+from sslh.transforms.utils import apply_views
+
 
 class FixMatchUnlabeledPreProcess(Module):
 	"""
@@ -15,4 +17,4 @@ class FixMatchUnlabeledPreProcess(Module):
 		self.transform_strong = transform_strong
 
 	def forward(self, data: Any) -> Tuple[Any, Any]:
-		return self.transform_weak(data), self.transform_strong(data)
+		return tuple(apply_views(data, [self.transform_weak, self.transform_strong]))
@@ -2,6 +2,8 @@
 from torch.nn import Module
 from typing import Any, Callable, Tuple
 
+from sslh.transforms.utils import apply_views
+
 
 class MixMatchUnlabeledPreProcess(Module):
 	"""
@@ -15,4 +17,4 @@ class MixMatchUnlabeledPreProcess(Module):
 		self.n_augms = n_augms
 
 	def forward(self, data: Any) -> Tuple[Any, ...]:
-		return tuple(self.transform_weak(data) for _ in range(self.n_augms))
+		return tuple(apply_views(data, [self.transform_weak] * self.n_augms))
@@ -2,6 +2,8 @@
 from torch.nn import Module
 from typing import Any, Callable, Tuple
 
+from sslh.transforms.utils import apply_views
+
 
 class ReMixMatchUnlabeledPreProcess(Module):
 	"""
@@ -16,4 +18,5 @@ class ReMixMatchUnlabeledPreProcess(Module):
 		self.n_augms = n_augms
 
 	def forward(self, data: Any) -> Tuple[Any, Tuple[Any, ...]]:
-		return self.transform_weak(data), tuple(self.transform_strong(data) for _ in range(self.n_augms))
+		views = apply_views(data, [self.transform_weak] + [self.transform_strong] * self.n_augms)
+		return views[0], tuple(views[1:])
@@ -37,6 +37,7 @@ class ReMixMatch(MixMatch):
 		train_metrics_r: Optional[Dict[str, Module]] = None,
 		log_on_epoch: bool = True,
 		check_model: bool = True,
+		augment_strong_batch: Optional[Callable] = None,
 	):
 		"""
 			ReMixMatch (RMM) LightningModule.
@@ -82,6 +83,9 @@ class ReMixMatch(MixMatch):
 				(default: True)
 			:param check_model: If True, check if the model has a 'forward_rot' method.
 				(default: True)
+			:param augment_strong_batch: The optional batched augment applied on device to the strong unlabeled batches.
+				Used with the batched pools, when the workers return the strong views without augment.
+				(default: None)
 		"""
 		if check_model and not(hasattr(model, 'forward_rot') and callable(model.forward_rot)):
 			raise RuntimeError(
@@ -109,6 +113,7 @@ class ReMixMatch(MixMatch):
 		self.lambda_u1 = lambda_u1
 		self.lambda_r = lambda_r
 		self.history = history
+		self.augment_strong_batch = augment_strong_batch
 
 		self.self_transform = self_transform
 		self.metric_dict_train_r = ForwardDictAffix(train_metrics_r, prefix='train/', suffix='_r')
@@ -127,6 +132,9 @@ class ReMixMatch(MixMatch):
 
 	def training_step(self, batch: Tuple[Tuple[Tensor, Tensor], Tuple[Tensor, List[Tensor]]], batch_idx: int) -> Tensor:
 		(xs_strong, ys), (xu_weak, xu_strong_lst) = batch
+		if self.augment_strong_batch is not None:
+			with torch.no_grad():
+				xu_strong_lst = [self.augment_strong_batch(xu_strong) for xu_strong in xu_strong_lst]
 
 		with torch.no_grad():
 			pred_xu_weak = self.activation(self.model(xu_weak))
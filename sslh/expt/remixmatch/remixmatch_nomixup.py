@@ -35,6 +35,7 @@ class ReMixMatchNoMixUp(ReMixMatch):
 		train_metrics_r: Optional[Dict[str, Module]] = None,
 		log_on_epoch: bool = True,
 		check_model: bool = True,
+		augment_strong_batch: Optional[Callable] = None,
 	):
 		"""
 			ReMixMatch without MixUp (RMMN) LightningModule.
@@ -78,6 +79,9 @@ class ReMixMatchNoMixUp(ReMixMatch):
 				(default: True)
 			:param check_model: If True, check if the model has a 'forward_rot' method.
 				(default: True)
+			:param augment_strong_batch: The optional batched augment applied on device to the strong unlabeled batches.
+				Used with the batched pools, when the workers return the strong views without augment.
+				(default: None)
 		"""
 		super().__init__(
 			model=model,
@@ -101,10 +105,14 @@ class ReMixMatchNoMixUp(ReMixMatch):
 			train_metrics_r=train_metrics_r,
 			log_on_epoch=log_on_epoch,
 			check_model=check_model,
+			augment_strong_batch=augment_strong_batch,
 		)
 
 	def training_step(self, batch: Tuple[Tuple[Tensor, Tensor], Tuple[Tensor, List[Tensor]]], batch_idx: int) -> Tensor:
 		(xs_strong, ys), (xu_weak, xu_strong_lst) = batch
+		if self.augment_strong_batch is not None:
+			with torch.no_grad():
+				xu_strong_lst = [self.augment_strong_batch(xu_strong) for xu_strong in xu_strong_lst]
 
 		with torch.no_grad():
 			pred_xu_weak = self.activation(self.model(xu_weak))
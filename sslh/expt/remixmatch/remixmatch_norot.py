@@ -4,7 +4,7 @@ import torch
 from torch import Tensor
 from torch.nn import Module, Softmax
 from torch.optim import Optimizer
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 from mlu.nn import Identity, CrossEntropyWithVectors
 from sslh.expt.remixmatch.remixmatch import ReMixMatch
@@ -28,6 +28,7 @@ class ReMixMatchNoRot(ReMixMatch):
 		train_metrics: Optional[Dict[str, Module]] = None,
 		val_metrics: Optional[Dict[str, Module]] = None,
 		log_on_epoch: bool = True,
+		augment_strong_batch: Optional[Callable] = None,
 	):
 		"""
 			ReMixMatchNoRot (RMMNR) LightningModule.
@@ -62,6 +63,9 @@ class ReMixMatchNoRot(ReMixMatch):
 				(default: None)
 			:param log_on_epoch: If True, log only the epoch means of each train metric score.
 				(default: True)
+			:param augment_strong_batch: The optional batched augment applied on device to the strong unlabeled batches.
+				Used with the batched pools, when the workers return the strong views without augment.
+				(default: None)
 		"""
 		super().__init__(
 			model=model,
@@ -85,10 +89,14 @@ class ReMixMatchNoRot(ReMixMatch):
 			train_metrics_r=None,
 			log_on_epoch=log_on_epoch,
 			check_model=False,
+			augment_strong_batch=augment_strong_batch,
 		)
 
 	def training_step(self, batch: Tuple[Tuple[Tensor, Tensor], Tuple[Tensor, List[Tensor]]], batch_idx: int) -> Tensor:
 		(xs_strong, ys), (xu_weak, xu_strong_lst) = batch
+		if self.augment_strong_batch is not None:
+			with torch.no_grad():
+				xu_strong_lst = [self.augment_strong_batch(xu_strong) for xu_strong in xu_strong_lst]
 
 		with torch.no_grad():
 			pred_xu_weak = self.activation(self.model(xu_weak))
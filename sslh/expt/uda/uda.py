@@ -4,7 +4,7 @@ from pytorch_lightning import LightningModule
 from torch import Tensor
 from torch.nn import Module, Softmax
 from torch.optim.optimizer import Optimizer
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, Optional, Tuple
 
 from mlu.nn import ForwardDictAffix
 from mlu.nn import CrossEntropyWithVectors
@@ -24,6 +24,7 @@ class UDA(LightningModule):
 		train_metrics: Optional[Dict[str, Module]] = None,
 		val_metrics: Optional[Dict[str, Module]] = None,
 		log_on_epoch: bool = True,
+		augment_strong_batch: Optional[Callable] = None,
 	):
 		"""
 			Unsupervised Data Augmentation (UDA) LightningModule.
@@ -49,6 +50,9 @@ class UDA(LightningModule):
 				(default: None)
 			:param log_on_epoch: If True, log only the epoch means of each train metric score.
 				(default: True)
+			:param augment_strong_batch: The optional batched augment applied on device to the strong unlabeled batch.
+				Used with the batched pools, when the workers return the strong view without augment.
+				(default: None)
 		"""
 		super().__init__()
 		self.model = model
@@ -66,6 +70,7 @@ class UDA(LightningModule):
 		self.metric_dict_test = ForwardDictAffix(val_metrics, prefix='test/')
 
 		self.log_params = dict(on_epoch=log_on_epoch, on_step=not log_on_epoch)
+		self.augment_strong_batch = augment_strong_batch
 
 		self.save_hyperparameters({
 			'experiment': self.__class__.__name__,
@@ -85,6 +90,9 @@ class UDA(LightningModule):
 		batch_idx: int,
 	):
 		(xs, ys), (xu, xu_strong) = batch
+		if self.augment_strong_batch is not None:
+			with torch.no_grad():
+				xu_strong = self.augment_strong_batch(xu_strong)
 
 		# Compute pseudo-labels 'yu' and mask
 		yu, mask = self.guess_label_and_mask(xu)
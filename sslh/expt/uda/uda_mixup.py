@@ -4,7 +4,7 @@ import torch
 from torch import Tensor
 from torch.nn import Module, Softmax
 from torch.optim.optimizer import Optimizer
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, Optional, Tuple
 
 from mlu.nn import CrossEntropyWithVectors
 from sslh.expt.uda.uda import UDA
@@ -26,6 +26,7 @@ class UDAMixUp(UDA):
 		train_metrics: Optional[Dict[str, Module]] = None,
 		val_metrics: Optional[Dict[str, Module]] = None,
 		log_on_epoch: bool = True,
+		augment_strong_batch: Optional[Callable] = None,
 	):
 		"""
 			Unsupervised Data Augmentation with MixUp (UDAM) LightningModule.
@@ -53,6 +54,9 @@ class UDAMixUp(UDA):
 				(default: None)
 			:param log_on_epoch: If True, log only the epoch means of each train metric score.
 				(default: True)
+			:param augment_strong_batch: The optional batched augment applied on device to the strong unlabeled batch.
+				Used with the batched pools, when the workers return the strong view without augment.
+				(default: None)
 		"""
 		super().__init__(
 			model=model,
@@ -66,6 +70,7 @@ class UDAMixUp(UDA):
 			train_metrics=train_metrics,
 			val_metrics=val_metrics,
 			log_on_epoch=log_on_epoch,
+			augment_strong_batch=augment_strong_batch,
 		)
 		self.alpha = alpha
 		self.mixup = MixUpModule(alpha=alpha, apply_max=True)
@@ -78,6 +83,9 @@ class UDAMixUp(UDA):
 		batch_idx: int,
 	):
 		(xs, ys), (xu, xu_strong) = batch
+		if self.augment_strong_batch is not None:
+			with torch.no_grad():
+				xu_strong = self.augment_strong_batch(xu_strong)
 
 		with torch.no_grad():
 			# Compute pseudo-labels 'yu' and mask
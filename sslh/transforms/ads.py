@@ -1,12 +1,13 @@
 
 import torch
 
-from torch.nn import Sequential
+from torch.nn import Module, Sequential
 from torchaudio.transforms import MelSpectrogram, AmplitudeToDB
-from typing import Callable
+from typing import Callable, Optional
 
 from mlu.nn import UnSqueeze
 from mlu.transforms import ToTensor
+from sslh.transforms.frontend import BatchSpectrogram
 from sslh.transforms.self_transforms.audio import get_self_transform_flips
 from sslh.transforms.pools.audio import get_pool
 from sslh.transforms.utils import compose_augment
@@ -18,6 +19,7 @@ def get_transform_ads(
 	n_time: int = 500,
 	n_fft: int = 2048,
 	pre_computed_specs: bool = False,
+	spec_on_device: bool = False,
 ) -> Callable:
 	# Get the augment pool
 	pool = get_pool(augment_name)
@@ -27,6 +29,11 @@ def get_transform_ads(
 		if not all(input_type == 'spectrogram' for input_type, _ in pool):
 			raise RuntimeError('Use pre-computed spectrogram is True but augment pool contains waveform augments.')
 		transform_to_spec = None
+	elif spec_on_device:
+		# The waveforms have all the same length, the spectrograms are computed by get_batch_transform_ads
+		if not all(input_type == 'waveform' for input_type, _ in pool):
+			raise RuntimeError('Spectrograms on device is True but augment pool contains spectrogram augments.')
+		transform_to_spec = None
 	else:
 		waveform_length = 10  # seconds
 		sample_rate = 32000
@@ -39,10 +46,31 @@ def get_transform_ads(
 	pre_transform = ToTensor(dtype=torch.float)
 	post_transform = UnSqueeze(dim=0)
 
-	augment = compose_augment(pool, transform_to_spec, pre_transform, post_transform)
+	# The views built with the same parameters share the clean spectrogram (see apply_views)
+	spec_key = ('ADS', n_mels, n_time, n_fft, pre_computed_specs, spec_on_device)
+
+	augment = compose_augment(pool, transform_to_spec, pre_transform, post_transform, spec_key)
 	return augment
 
 
+def get_batch_transform_ads(
+	n_mels: int = 64,
+	n_time: int = 500,
+	n_fft: int = 2048,
+	pre_computed_specs: bool = False,
+	spec_on_device: bool = False,
+) -> Optional[Module]:
+	if not spec_on_device:
+		return None
+	if pre_computed_specs:
+		raise RuntimeError('Cannot compute the spectrograms on device with pre-computed spectrograms.')
+
+	waveform_length = 10  # seconds
+	sample_rate = 32000
+	hop_length = sample_rate * waveform_length // n_time
+	return BatchSpectrogram(sample_rate * waveform_length, sample_rate, n_fft, hop_length, n_mels)
+
+
 def get_target_transform_ads(**kwargs) -> Callable:
 	return ToTensor(dtype=torch.float)
 
@@ -0,0 +1,202 @@
+"""
+	Batched versions of the audio augments of the pools.
+
+	Each module takes a batch of shape (bsize, ...) and samples its parameters independently for each item of the batch,
+	so the augments can be applied on the training device after the collation instead of item by item in the workers.
+"""
+
+import torch
+
+from torch import Tensor
+from torch.nn import Module
+from typing import Tuple, Union
+
+
+class BatchOcclusion(Module):
+	def __init__(
+		self,
+		scales: Tuple[float, float] = (0.1, 0.5),
+		fill_value: float = 0.0,
+		dim: int = -1,
+		p: float = 1.0,
+	):
+		"""
+			Batched Occlusion : replace a random section of each item along a dimension by a fill value.
+
+			:param scales: The range of the occluded section length, as a ratio of the dimension size. (default: (0.1, 0.5))
+			:param fill_value: The value of the occluded section. (default: 0.0)
+			:param dim: The dimension of the occlusion. Must not be the batch dimension. (default: -1)
+			:param p: The probability to apply the augment to each item. (default: 1.0)
+		"""
+		super().__init__()
+		self.scales = scales
+		self.fill_value = fill_value
+		self.dim = dim
+		self.p = p
+
+	def forward(self, batch: Tensor) -> Tensor:
+		bsize, size = batch.shape[0], batch.shape[self.dim]
+		lengths = (_uniform(self.scales, bsize, batch.device) * size).long()
+		starts = (torch.rand(bsize, device=batch.device) * (size - lengths + 1)).long()
+
+		mask = _section_mask(starts, lengths, size, batch.ndim, self.dim)
+		mask = mask & _apply_mask(self.p, batch)
+		return batch.masked_fill(mask, self.fill_value)
+
+
+class BatchTimeStretchPadCrop(Module):
+	def __init__(
+		self,
+		rates: Tuple[float, float] = (0.9, 1.1),
+		align: str = 'random',
+		fill_value: float = 0.0,
+		p: float = 1.0,
+	):
+		"""
+			Batched TimeStretchPadCrop : stretch each item along the last dimension with a nearest interpolation, then pad
+			or crop it to its original length.
+
+			The stretch, pad and crop are done with a single gather of the source indexes of each item.
+
+			:param rates: The range of the stretch rates. A rate > 1 shortens the item. (default: (0.9, 1.1))
+			:param align: The alignment of the pad or crop, 'left', 'center' or 'random'. (default: 'random')
+			:param fill_value: The value of the padded frames. (default: 0.0)
+			:param p: The probability to apply the augment to each item. (default: 1.0)
+		"""
+		if align not in ('left', 'center', 'random'):
+			raise ValueError(f'Invalid align "{align}". Must be one of {("left", "center", "random")}.')
+
+		super().__init__()
+		self.rates = rates
+		self.align = align
+		self.fill_value = fill_value
+		self.p = p
+
+	def forward(self, batch: Tensor) -> Tensor:
+		bsize, length = batch.shape[0], batch.shape[-1]
+		rates = _uniform(self.rates, bsize, batch.device)
+		# Items not augmented are stretched with a rate of 1, which gives the identity
+		rates = torch.where(_apply_mask(self.p, batch).view(bsize), rates, torch.ones_like(rates))
+		stretched_lengths = torch.ceil(length / rates).long()
+
+		# Shift > 0 crops the stretched item, shift < 0 pads it
+		max_shifts = stretched_lengths - length
+		if self.align == 'left':
+			shifts = torch.zeros_like(max_shifts)
+		elif self.align == 'center':
+			shifts = torch.floor(max_shifts.float() / 2.0).long()
+		else:
+			shifts = torch.floor(torch.rand(bsize, device=batch.device) * (max_shifts.abs() + 1)).long()
+			shifts = shifts * max_shifts.sign()
+
+		positions = torch.arange(length, device=batch.device).unsqueeze(dim=0) + shifts.unsqueeze(dim=1)
+		valid = (positions >= 0) & (positions < stretched_lengths.unsqueeze(dim=1))
+		indexes = (positions.clamp(min=0) * rates.unsqueeze(dim=1)).long().clamp(max=length - 1)
+
+		view_shape = (bsize,) + (1,) * (batch.ndim - 2) + (length,)
+		indexes = indexes.view(view_shape).expand(batch.shape)
+		valid = valid.view(view_shape)
+		return torch.gather(batch, -1, indexes).masked_fill(~valid, self.fill_value)
+
+
+class BatchCutOutSpec(Module):
+	def __init__(
+		self,
+		freq_scales: Tuple[float, float] = (0.1, 0.5),
+		time_scales: Tuple[float, float] = (0.1, 0.5),
+		fill_value: Union[float, Tuple[float, float]] = -80.0,
+		fill_mode: str = 'constant',
+		p: float = 1.0,
+	):
+		"""
+			Batched CutOutSpec : replace a random rectangle of each spectrogram of shape (bsize, ..., freq, time).
+
+			:param freq_scales: The range of the rectangle height, as a ratio of the frequency size. (default: (0.1, 0.5))
+			:param time_scales: The range of the rectangle width, as a ratio of the time size. (default: (0.1, 0.5))
+			:param fill_value: The fill value or the range of the fill values. (default: -80.0)
+			:param fill_mode: 'constant' fills each rectangle with one value sampled in the fill range,
+				'random' samples a value for each element of the rectangle. (default: 'constant')
+			:param p: The probability to apply the augment to each item. (default: 1.0)
+		"""
+		if fill_mode not in ('constant', 'random'):
+			raise ValueError(f'Invalid fill mode "{fill_mode}". Must be one of {("constant", "random")}.')
+
+		super().__init__()
+		self.freq_scales = freq_scales
+		self.time_scales = time_scales
+		self.fill_value = fill_value
+		self.fill_mode = fill_mode
+		self.p = p
+
+	def forward(self, batch: Tensor) -> Tensor:
+		bsize, n_freqs, n_times = batch.shape[0], batch.shape[-2], batch.shape[-1]
+		freq_lengths = (_uniform(self.freq_scales, bsize, batch.device) * n_freqs).long()
+		time_lengths = (_uniform(self.time_scales, bsize, batch.device) * n_times).long()
+		freq_starts = (torch.rand(bsize, device=batch.device) * (n_freqs - freq_lengths + 1)).long()
+		time_starts = (torch.rand(bsize, device=batch.device) * (n_times - time_lengths + 1)).long()
+
+		mask = (
+			_section_mask(freq_starts, freq_lengths, n_freqs, batch.ndim, -2)
+			& _section_mask(time_starts, time_lengths, n_times, batch.ndim, -1)
+			& _apply_mask(self.p, batch)
+		)
+
+		fill_range = self.fill_value if isinstance(self.fill_value, tuple) else (self.fill_value, self.fill_value)
+		if self.fill_mode == 'constant':
+			fill_values = _uniform(fill_range, bsize, batch.device).to(batch.dtype)
+			fill_values = fill_values.view((bsize,) + (1,) * (batch.ndim - 1))
+		else:
+			fill_values = torch.empty_like(batch).uniform_(*fill_range)
+		return torch.where(mask, fill_values, batch)
+
+
+class BatchRandomChoice(Module):
+	def __init__(self, *augments: Module):
+		"""
+			Batched RandomChoice : apply one augment chosen randomly for each item of the batch.
+
+			The items are grouped by augment chosen, so each augment is called once on the sub-batch of its items.
+			All the augments must return items of the same shape (e.g. spectrograms when the branches contain the
+			transform to spectrogram).
+
+			:param augments: The augments to choose from.
+		"""
+		super().__init__()
+		self.augments = list(augments)
+
+	def forward(self, batch: Tensor) -> Tensor:
+		choices = torch.randint(len(self.augments), (batch.shape[0],), device=batch.device)
+		result = None
+		for i, augment in enumerate(self.augments):
+			mask = choices == i
+			if not mask.any():
+				continue
+			sub_result = augment(batch[mask])
+			if result is None:
+				result = sub_result.new_empty((batch.shape[0],) + sub_result.shape[1:])
+			result[mask] = sub_result
+		return result
+
+
+def _uniform(range_: Tuple[float, float], size: int, device: torch.device) -> Tensor:
+	low, high = range_
+	return torch.rand(size, device=device) * (high - low) + low
+
+
+def _apply_mask(p: float, batch: Tensor) -> Tensor:
+	shape = (batch.shape[0],) + (1,) * (batch.ndim - 1)
+	return torch.rand(shape, device=batch.device) < p
+
+
+def _section_mask(starts: Tensor, lengths: Tensor, size: int, ndim: int, dim: int) -> Tensor:
+	"""
+		:return: The boolean mask of shape broadcastable to (bsize, ...) which is True in [start, start + length) along dim.
+	"""
+	dim = dim % ndim
+	shape = [1] * ndim
+	shape[0] = starts.shape[0]
+	shape[dim] = size
+
+	indexes = torch.arange(size, device=starts.device).unsqueeze(dim=0)
+	mask = (indexes >= starts.unsqueeze(dim=1)) & (indexes < (starts + lengths).unsqueeze(dim=1))
+	return mask.view(shape)
@@ -0,0 +1,58 @@
+
+import torch
+
+from torch import Tensor
+from torch.nn import Module, Sequential
+from torchaudio.transforms import MelSpectrogram, AmplitudeToDB
+from typing import Union
+
+
+class BatchSpectrogram(Module):
+	def __init__(self, waveform_length: int, sample_rate: int, n_fft: int, hop_length: int, n_mels: int):
+		"""
+			Batch transform which computes the log-mel spectrograms of the waveforms of a batch on the batch device.
+
+			The transform is applied to the data of a batch only, see sslh.datamodules.utils.apply_batch_transform. The
+			data is a waveforms tensor or a tuple or list of views (e.g. the weak and strong views of the unlabeled data).
+			The waveforms of shape (bsize, time) or (bsize, 1, time) are converted to (bsize, 1, freq, time), the same
+			shape than the spectrograms computed by the workers.
+
+			The STFT window and the mel filterbank are buffers of the module : they are built once and moved on the
+			training device by the first call.
+
+			:param waveform_length: The length of the padded waveforms.
+			:param sample_rate: The sample rate of the waveforms.
+			:param n_fft: The size of the FFT.
+			:param hop_length: The hop length of the STFT.
+			:param n_mels: The number of mel bands.
+		"""
+		super().__init__()
+		self.waveform_length = waveform_length
+		self.transform_to_spec = Sequential(
+			MelSpectrogram(sample_rate=sample_rate, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels),
+			AmplitudeToDB(),
+		)
+		self._device = None
+
+	def forward(self, data: Union[Tensor, list, tuple]) -> Union[Tensor, list, tuple]:
+		if isinstance(data, Tensor):
+			return self._to_spec(data)
+		elif isinstance(data, (list, tuple)):
+			return type(data)(self(view) for view in data)
+		else:
+			raise TypeError(f'Invalid data type "{type(data)}" for {self.__class__.__name__}.')
+
+	def _to_spec(self, waveforms: Tensor) -> Tensor:
+		if waveforms.shape[-1] != self.waveform_length:
+			raise ValueError(
+				f'Invalid waveforms shape {tuple(waveforms.shape)}, the last dimension must be {self.waveform_length}.'
+			)
+		if waveforms.ndim == 2:
+			waveforms = waveforms.unsqueeze(dim=1)
+
+		if self._device != waveforms.device:
+			self.to(waveforms.device)
+			self._device = waveforms.device
+
+		with torch.no_grad():
+			return self.transform_to_spec(waveforms)
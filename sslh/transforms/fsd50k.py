@@ -1,12 +1,13 @@
 
 import torch
 
-from torch.nn import Sequential
+from torch.nn import Module, Sequential
 from torchaudio.transforms import MelSpectrogram, AmplitudeToDB
-from typing import Callable
+from typing import Callable, Optional
 
 from mlu.nn import MultiHot
 from mlu.transforms import ToTensor, Pad, Crop
+from sslh.transforms.frontend import BatchSpectrogram
 from sslh.transforms.self_transforms.audio import get_self_transform_flips
 from sslh.transforms.pools.audio import get_pool
 from sslh.transforms.utils import compose_augment
@@ -20,21 +21,29 @@ def get_transform_fsd50k(
 	n_mels: int = 64,
 	n_time: int = 500,
 	n_fft: int = 2048,
+	waveform_length: float = 30.0,
+	spec_on_device: bool = False,
 ) -> Callable:
 	# Get the augment pool
 	pool = get_pool(augment_name)
 
 	# Spectrogram shape : (channels, freq, time) = (1, 64, 501)
-	waveform_length = 30  # seconds
+	# waveform_length (seconds) can be shorter than the clips for a shorter analysis window
 	sample_rate = 44100
-	target_length = sample_rate * waveform_length
-	hop_length = sample_rate * waveform_length // n_time
+	target_length = int(sample_rate * waveform_length)
+	hop_length = target_length // n_time
 
-	transform_to_spec = Sequential(
-		Pad(target_length),
-		MelSpectrogram(sample_rate=sample_rate, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels),
-		AmplitudeToDB(),
-	)
+	if spec_on_device:
+		# The workers only pad the waveforms, the spectrograms are computed by get_batch_transform_fsd50k
+		if not all(input_type == 'waveform' for input_type, _ in pool):
+			raise RuntimeError('Spectrograms on device is True but augment pool contains spectrogram augments.')
+		transform_to_spec = Pad(target_length)
+	else:
+		transform_to_spec = Sequential(
+			Pad(target_length),
+			MelSpectrogram(sample_rate=sample_rate, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels),
+			AmplitudeToDB(),
+		)
 
 	pre_transform = Sequential(
 		ToTensor(dtype=torch.float),
@@ -42,10 +51,29 @@ def get_transform_fsd50k(
 	)
 	post_transform = None
 
-	augment = compose_augment(pool, transform_to_spec, pre_transform, post_transform)
+	# The views built with the same parameters share the clean spectrogram (see apply_views)
+	spec_key = ('FSD50K', n_mels, n_time, n_fft, waveform_length, spec_on_device)
+
+	augment = compose_augment(pool, transform_to_spec, pre_transform, post_transform, spec_key)
 	return augment
 
 
+def get_batch_transform_fsd50k(
+	n_mels: int = 64,
+	n_time: int = 500,
+	n_fft: int = 2048,
+	waveform_length: float = 30.0,
+	spec_on_device: bool = False,
+) -> Optional[Module]:
+	if not spec_on_device:
+		return None
+
+	sample_rate = 44100
+	target_length = int(sample_rate * waveform_length)
+	hop_length = target_length // n_time
+	return BatchSpectrogram(target_length, sample_rate, n_fft, hop_length, n_mels)
+
+
 def get_target_transform_fsd50k(**kwargs) -> Callable:
 	return MultiHot(N_CLASSES, torch.float)
 
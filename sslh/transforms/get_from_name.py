@@ -1,13 +1,15 @@
 
-from typing import Callable
+from typing import Callable, Optional
 
-from .ads import get_transform_ads, get_target_transform_ads, get_self_transform_ads
+from .ads import get_transform_ads, get_batch_transform_ads, get_target_transform_ads, get_self_transform_ads
 from .cifar10 import get_transform_cifar10, get_target_transform_cifar10, get_self_transform_cifar10
-from .esc10 import get_transform_esc10, get_target_transform_esc10, get_self_transform_esc10
-from .fsd50k import get_transform_fsd50k, get_target_transform_fsd50k, get_self_transform_fsd50k
-from .gsc import get_transform_gsc, get_target_transform_gsc, get_self_transform_gsc
-from .pvc import get_transform_pvc, get_target_transform_pvc, get_self_transform_pvc
-from .ubs8k import get_transform_ubs8k, get_target_transform_ubs8k, get_self_transform_ubs8k
+from .esc10 import get_transform_esc10, get_batch_transform_esc10, get_target_transform_esc10, get_self_transform_esc10
+from .fsd50k import get_transform_fsd50k, get_batch_transform_fsd50k, get_target_transform_fsd50k, get_self_transform_fsd50k
+from .gsc import get_transform_gsc, get_batch_transform_gsc, get_target_transform_gsc, get_self_transform_gsc
+from .pvc import get_transform_pvc, get_batch_transform_pvc, get_target_transform_pvc, get_self_transform_pvc
+from .ubs8k import get_transform_ubs8k, get_batch_transform_ubs8k, get_target_transform_ubs8k, get_self_transform_ubs8k
+from .pools.audio import get_batch_pool
+from .utils import compose_batch_augment
 
 
 def get_transform(dataset_name: str, augment_name: str, **kwargs) -> Callable:
@@ -46,6 +48,54 @@ def get_transform(dataset_name: str, augment_name: str, **kwargs) -> Callable:
 		)
 
 
+def get_batch_transform(dataset_name: str, **kwargs) -> Optional[Callable]:
+	"""
+		Returns the transform applied by the datamodule to the batches on the training device.
+
+		For the audio datasets with spec_on_device=True, this transform computes the spectrograms of the batch and the
+		transforms returned by get_transform only pad the waveforms. Otherwise it is None.
+
+		:param dataset_name: The dataset of the transform.
+		:return: The batch transform as Callable object or None.
+	"""
+	dataset_name = dataset_name.upper()
+
+	if dataset_name == 'ADS':
+		return get_batch_transform_ads(**kwargs)
+	elif dataset_name == 'CIFAR10':
+		return None
+	elif dataset_name == 'ESC10':
+		return get_batch_transform_esc10(**kwargs)
+	elif dataset_name == 'FSD50K':
+		return get_batch_transform_fsd50k(**kwargs)
+	elif dataset_name == 'GSC':
+		return get_batch_transform_gsc(**kwargs)
+	elif dataset_name == 'PVC':
+		return get_batch_transform_pvc(**kwargs)
+	elif dataset_name == 'UBS8K':
+		return get_batch_transform_ubs8k(**kwargs)
+	else:
+		raise RuntimeError(
+			f'Unknown dataset name "{dataset_name}". '
+			f'Must be one of {("ADS", "CIFAR10", "ESC10", "FSD50K", "GSC", "PVC", "UBS8K")}'
+		)
+
+
+def get_batch_augment(augment_name: str) -> Optional[Callable]:
+	"""
+		Returns the augment applied by the LightningModule to the spectrogram batches on the training device.
+
+		Only the batched pools named 'batch_...' (e.g. 'batch_strong2') are applied on device, the transform of the
+		view in the workers must then be 'identity'. For the other augment names, returns None.
+
+		:param augment_name: The name of the augment.
+		:return: The batched augment as Callable object or None.
+	"""
+	if not augment_name.startswith('batch_'):
+		return None
+	return compose_batch_augment(get_batch_pool(augment_name), None)
+
+
 def get_target_transform(dataset_name: str, **kwargs) -> Callable:
 	dataset_name = dataset_name.upper()
 
@@ -1,6 +1,7 @@
 
 from typing import Callable, List, Tuple
 from mlu.transforms import Occlusion, CutOutSpec, TimeStretchPadCrop, Fade, AdditiveNoise, SubtractiveNoise
+from sslh.transforms.augments.batch import BatchCutOutSpec, BatchOcclusion, BatchTimeStretchPadCrop
 
 
 def get_pool(augment_name: str) -> List[Tuple[str, Callable]]:
@@ -20,6 +21,11 @@ def get_pool(augment_name: str) -> List[Tuple[str, Callable]]:
 		pool = []
 	elif augment_name.startswith("test_"):
 		pool = get_pool_test(augment_name)
+	elif augment_name.startswith('batch_'):
+		raise RuntimeError(
+			f'Cannot apply the batched pool "{augment_name}" item by item in the workers. '
+			f'Use get_batch_pool or get_batch_augment to apply it on the training device.'
+		)
 	else:
 		raise RuntimeError(
 			f'Unknown augment name "{augment_name}". '
@@ -28,6 +34,53 @@ def get_pool(augment_name: str) -> List[Tuple[str, Callable]]:
 	return pool
 
 
+def get_batch_pool(augment_name: str) -> List[Tuple[str, Callable]]:
+	"""
+		Returns the batched version of a pool, with the same parameters and the same input types.
+
+		The augments of these pools take batches of shape (bsize, ...) and sample their parameters for each item, so
+		they can be applied after the collation on the training device. Ex: 'batch_strong2' is the batched 'strong2'.
+		Only the spectrogram pools have a batched version. The pools 'weak' and 'strong' contain waveform augments,
+		which would need the views to reach the training device as waveforms and the batch transform to spectrogram
+		to run after the augment instead of in the datamodule : their batched versions are out of scope.
+	"""
+	if augment_name in ['batch_weak', 'batch_strong']:
+		raise ValueError(
+			f'The batched pool "{augment_name}" is not available because the pool "{augment_name[len("batch_"):]}" '
+			f'contains waveform augments. Use one of {("batch_weak2", "batch_strong2", "batch_weak3", "batch_strong3")}.'
+		)
+	elif augment_name in ['batch_weak2']:
+		common_params = dict(p=0.5, fill_value=-100.0)
+		return [
+			('spectrogram', BatchOcclusion(scales=(0.0, 0.25), **common_params)),
+			('spectrogram', BatchTimeStretchPadCrop(rates=(0.5, 1.5), align='random', **common_params)),
+			('spectrogram', BatchCutOutSpec(freq_scales=(0.5, 1.0), time_scales=(0.0, 0.5), **common_params)),
+		]
+	elif augment_name in ['batch_strong2']:
+		common_params = dict(p=1.0, fill_value=-100.0)
+		return [
+			('spectrogram', BatchOcclusion(scales=(0.0, 0.75), **common_params)),
+			('spectrogram', BatchTimeStretchPadCrop(rates=(0.25, 1.75), align='random', **common_params)),
+			('spectrogram', BatchCutOutSpec(freq_scales=(0.75, 1.0), time_scales=(0.5, 0.75), **common_params)),
+		]
+	elif augment_name in ['batch_weak3']:
+		common_params = dict(p=0.5, fill_value=-100.0)
+		return [
+			('spectrogram', BatchOcclusion(scales=(0.0, 0.25), **common_params)),
+			('spectrogram', BatchTimeStretchPadCrop(rates=(0.5, 1.5), align='random', **common_params)),
+			('spectrogram', BatchCutOutSpec(freq_scales=(0.1, 0.5), time_scales=(0.1, 0.5), **common_params)),
+		]
+	elif augment_name in ['batch_strong3']:
+		common_params = dict(p=1.0, fill_value=-100.0)
+		return [
+			('spectrogram', BatchOcclusion(scales=(0.0, 0.75), **common_params)),
+			('spectrogram', BatchTimeStretchPadCrop(rates=(0.25, 1.75), align='random', **common_params)),
+			('spectrogram', BatchCutOutSpec(freq_scales=(0.5, 1.0), time_scales=(0.5, 1.0), **common_params)),
+		]
+	else:
+		raise ValueError(f'Unknown batch augment "{augment_name}".')
+
+
 def get_weak_augm_pool() -> List[Tuple[str, Callable]]:
 	common_params = dict(p=0.5)
 	return [
@@ -1,10 +1,11 @@
 
-from torch.nn import Sequential
+from torch.nn import Module, Sequential
 from torchaudio.transforms import MelSpectrogram, AmplitudeToDB
 from typing import Callable, Optional
 
 from mlu.nn import OneHot
 from mlu.transforms import Pad
+from sslh.transforms.frontend import BatchSpectrogram
 from sslh.transforms.pools.audio import get_pool
 from sslh.transforms.self_transforms.audio import get_self_transform_flips
 from sslh.transforms.utils import compose_augment
@@ -12,7 +13,13 @@ from sslh.transforms.utils import compose_augment
 N_CLASSES = 5
 
 
-def get_transform_pvc(augment_name: str, n_mels: int = 64, hop_length: int = 512, n_fft: int = 2048) -> Callable:
+def get_transform_pvc(
+	augment_name: str,
+	n_mels: int = 64,
+	hop_length: int = 512,
+	n_fft: int = 2048,
+	spec_on_device: bool = False,
+) -> Callable:
 	pool = get_pool(augment_name)
 
 	# Spectrogram shape : (channels, freq, time) = (1, 64, 94)
@@ -20,18 +27,42 @@ def get_transform_pvc(augment_name: str, n_mels: int = 64, hop_length: int = 512
 	sample_rate = 16000
 	target_length = sample_rate * waveform_length
 
-	transform_to_spec = Sequential(
-		Pad(target_length),
-		MelSpectrogram(sample_rate=sample_rate, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels),
-		AmplitudeToDB(),
-	)
+	if spec_on_device:
+		# The workers only pad the waveforms, the spectrograms are computed by get_batch_transform_pvc
+		if not all(input_type == 'waveform' for input_type, _ in pool):
+			raise RuntimeError('Spectrograms on device is True but augment pool contains spectrogram augments.')
+		transform_to_spec = Pad(target_length)
+	else:
+		transform_to_spec = Sequential(
+			Pad(target_length),
+			MelSpectrogram(sample_rate=sample_rate, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels),
+			AmplitudeToDB(),
+		)
 	pre_transform = None
 	post_transform = None
 
-	augment = compose_augment(pool, transform_to_spec, pre_transform, post_transform)
+	# The views built with the same parameters share the clean spectrogram (see apply_views)
+	spec_key = ('PVC', n_mels, hop_length, n_fft, spec_on_device)
+
+	augment = compose_augment(pool, transform_to_spec, pre_transform, post_transform, spec_key)
 	return augment
 
 
+def get_batch_transform_pvc(
+	n_mels: int = 64,
+	hop_length: int = 512,
+	n_fft: int = 2048,
+	spec_on_device: bool = False,
+) -> Optional[Module]:
+	if not spec_on_device:
+		return None
+
+	waveform_length = 3  # seconds
+	sample_rate = 16000
+	target_length = sample_rate * waveform_length
+	return BatchSpectrogram(target_length, sample_rate, n_fft, hop_length, n_mels)
+
+
 def get_target_transform_pvc(smooth: Optional[float] = None) -> Optional[Callable]:
 	return OneHot(N_CLASSES, smooth)
 
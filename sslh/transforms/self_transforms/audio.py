@@ -5,28 +5,23 @@ from torch import Tensor
 from torch.nn.functional import one_hot
 from typing import Callable, Tuple
 
-from mlu.transforms import Compose, Identity
-from mlu.transforms.spectrogram import HorizontalFlip, VerticalFlip
-
 
 def get_self_transform_flips() -> Callable:
-	transforms = [
-		Identity(),
-		HorizontalFlip(),
-		VerticalFlip(),
-		Compose(HorizontalFlip(), VerticalFlip()),
-	]
+	# Flipped dimensions of each class : identity, horizontal flip (time), vertical flip (frequency) and both
+	flip_dims = [(), (-1,), (-2,), (-2, -1)]
 
 	def generate_flips(x: Tensor) -> Tuple[Tensor, Tensor]:
 		bsize = len(x)
-		class_idx = torch.randint(low=0, high=len(transforms), size=(bsize,))
+		class_idx = torch.randint(low=0, high=len(flip_dims), size=(bsize,), device=x.device)
 
-		xr = torch.empty_like(x)
-		for i, image in enumerate(x):
-			transform = transforms[class_idx[i]]
-			xr[i] = transform(image)
+		# Each flip is applied to the whole batch and selected with a mask, without synchronizing with the device
+		xr = x
+		for i, dims in enumerate(flip_dims):
+			if len(dims) > 0:
+				mask = (class_idx == i).view(-1, *([1] * (x.ndim - 1)))
+				xr = torch.where(mask, torch.flip(x, dims), xr)
 
-		yr = one_hot(class_idx, len(transforms)).to(device=x.device, dtype=x.dtype)
+		yr = one_hot(class_idx, len(flip_dims)).to(dtype=x.dtype)
 		return xr, yr
 
 	return generate_flips
@@ -5,23 +5,26 @@ from torch import Tensor
 from torch.nn.functional import one_hot
 from typing import Callable, Tuple
 
-from mlu.transforms.image.tensor import Rotation
-
 
 def get_self_transform_rotations() -> Callable:
-	angles = [0.0, 90, 180, 270]
-	transforms = [Rotation(degrees=angle) for angle in angles]
+	# Number of counter-clockwise quarter turns of each class : 0, 90, 180 and 270 degrees
+	n_quarters = [0, 1, 2, 3]
 
 	def generate_rotations(x: Tensor) -> Tuple[Tensor, Tensor]:
+		if x.shape[-2] != x.shape[-1]:
+			raise ValueError(f'Cannot rotate non-square images of shape {tuple(x.shape)}.')
+
 		bsize = len(x)
-		class_idx = torch.randint(low=0, high=len(transforms), size=(bsize,))
+		class_idx = torch.randint(low=0, high=len(n_quarters), size=(bsize,), device=x.device)
 
-		xr = torch.empty_like(x)
-		for i, image in enumerate(x):
-			transform = transforms[class_idx[i]]
-			xr[i] = transform(image)
+		# Each rotation is applied to the whole batch and selected with a mask, without synchronizing with the device
+		xr = x
+		for i, k in enumerate(n_quarters):
+			if k > 0:
+				mask = (class_idx == i).view(-1, *([1] * (x.ndim - 1)))
+				xr = torch.where(mask, torch.rot90(x, k, dims=(-2, -1)), xr)
 
-		yr = one_hot(class_idx, len(transforms)).to(device=x.device, dtype=x.dtype)
+		yr = one_hot(class_idx, len(n_quarters)).to(dtype=x.dtype)
 		return xr, yr
 
 	return generate_rotations
@@ -1,6 +1,11 @@
 
+import random
+
 from mlu.transforms import Compose, Identity, RandomChoice
-from typing import Callable, List, Optional, Tuple
+from torch.nn import Module
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from sslh.transforms.augments.batch import BatchRandomChoice
 
 
 def compose_augment(
@@ -8,6 +13,7 @@ def compose_augment(
 	transform_to_spec: Optional[Callable],
 	pre_transform: Optional[Callable],
 	post_transform: Optional[Callable],
+	spec_key: Optional[Hashable] = None,
 ) -> Callable:
 	"""
 		Compose augment pool with optional transform to spectrogram, pre-transform and post-transform.
@@ -59,14 +65,173 @@ def compose_augment(
 		:param transform_to_spec: The optional transformation to spectrogram.
 		:param pre_transform: The pre-transform to apply before augment & spectrogram.
 		:param post_transform: The post-transform to apply after augment & spectrogram.
+		:param spec_key: The optional key of the pre-transform and of the transform to spectrogram.
+			If not None and transform_to_spec is not None, returns a SharedSpecAugment which can share the clean
+			spectrogram with the other views of the same data built with the same key. (default: None)
 		:return: The augment pool composed as a Callable object.
 	"""
+	if spec_key is not None and transform_to_spec is not None:
+		return SharedSpecAugment(pool, transform_to_spec, pre_transform, post_transform, spec_key)
+
+	if all(augm is None for _, augm in pool):
+		# Without augment, the transform can be cached (see is_deterministic_transform)
+		transforms = [transform for transform in (pre_transform, transform_to_spec, post_transform) if transform is not None]
+		return DeterministicCompose(*transforms) if len(transforms) > 0 else Identity()
+
 	pool_with_spec = add_transform_to_spec_to_pool(pool, transform_to_spec)
 	augment = random_choice_pool(pool_with_spec)
 	augment = add_pre_post_transforms(pre_transform, augment, post_transform)
 	return augment
 
 
+class SharedSpecAugment(Module):
+	def __init__(
+		self,
+		pool: List[Tuple[str, Callable]],
+		transform_to_spec: Callable,
+		pre_transform: Optional[Callable],
+		post_transform: Optional[Callable],
+		spec_key: Hashable,
+	):
+		"""
+			Augment pool with a transform to spectrogram which can reuse the clean spectrogram of the data.
+
+			The output is the same than compose_augment without spec_key : one augment of the pool is chosen randomly,
+			the waveform augments are applied before the transform to spectrogram and the spectrogram augments after.
+			With apply_views, the pre-transform and the clean spectrogram are computed once for all the views of the
+			same data, and only the waveform augments recompute a spectrogram.
+
+			:param pool: The list of (input_type, augment) to choose from.
+			:param transform_to_spec: The transformation to spectrogram.
+			:param pre_transform: The deterministic pre-transform to apply before augment & spectrogram.
+			:param post_transform: The post-transform to apply after augment & spectrogram.
+			:param spec_key: The key of the pre-transform and of the transform to spectrogram. The views with the same key
+				share the clean spectrogram.
+		"""
+		for input_type, _ in pool:
+			if input_type not in ('waveform', 'spectrogram'):
+				raise ValueError(f'Invalid input type "{input_type}". Must be one of {("waveform", "spectrogram")}.')
+
+		super().__init__()
+		# The entries without augment are kept, they are the branches which return the clean spectrogram
+		self.pool = list(pool)
+		self.transform_to_spec = transform_to_spec
+		self.pre_transform = pre_transform
+		self.post_transform = post_transform
+		self.spec_key = spec_key
+
+	def forward(self, data: Any) -> Any:
+		return self.forward_shared(data, {})
+
+	def is_deterministic(self) -> bool:
+		return all(augm is None for _, augm in self.pool)
+
+	def forward_shared(self, data: Any, cache: Dict[str, Any]) -> Any:
+		"""
+			:param data: The data to transform.
+			:param cache: The dictionary shared by the views of the data, which stores the pre-transformed data and the
+				clean spectrogram when they are computed.
+			:return: The transformed data.
+		"""
+		if 'data' not in cache:
+			cache['data'] = self.pre_transform(data) if self.pre_transform is not None else data
+		data = cache['data']
+
+		if len(self.pool) > 0:
+			input_type, augm = self.pool[random.randrange(len(self.pool))]
+		else:
+			input_type, augm = 'spectrogram', None
+
+		if input_type == 'waveform' and augm is not None:
+			# The augment must not modify the pre-transformed data shared by the other views
+			spec = self.transform_to_spec(augm(data.clone()))
+		else:
+			if 'spec' not in cache:
+				cache['spec'] = self.transform_to_spec(data)
+			spec = cache['spec']
+			if augm is not None:
+				# The augment must not modify the spectrogram shared by the other views
+				spec = augm(spec.clone())
+
+		if self.post_transform is not None:
+			spec = self.post_transform(spec)
+		return spec
+
+
+class DeterministicCompose(Compose):
+	"""
+		Compose of the pre-transform, transform to spectrogram and post-transform of a pool without augment.
+		These transforms always return the same output for the same input.
+	"""
+
+	def is_deterministic(self) -> bool:
+		return True
+
+
+def apply_views(data: Any, transforms: Sequence[Callable]) -> List[Any]:
+	"""
+		Apply several transforms to the same data, e.g. the weak and strong views of the unlabeled data.
+
+		The SharedSpecAugment transforms with the same spec_key compute the pre-transform and the clean spectrogram
+		once. The other transforms are called normally.
+
+		:param data: The data to transform.
+		:param transforms: The transforms of the views.
+		:return: The list of the views, in the order of the transforms.
+	"""
+	caches = {}
+	views = []
+	for transform in transforms:
+		if isinstance(transform, SharedSpecAugment):
+			cache = caches.setdefault(transform.spec_key, {})
+			views.append(transform.forward_shared(data, cache))
+		else:
+			views.append(transform(data))
+	return views
+
+
+def is_deterministic_transform(transform: Optional[Callable]) -> bool:
+	"""
+		Returns True if the transform is known to always return the same output for the same input, e.g. the 'identity'
+		transforms of the audio datasets. The unknown transforms are considered as random.
+
+		:param transform: The transform to check.
+		:return: True if the transform is deterministic.
+	"""
+	if transform is None or isinstance(transform, Identity):
+		return True
+	is_deterministic = getattr(transform, 'is_deterministic', None)
+	return callable(is_deterministic) and is_deterministic()
+
+
+def compose_batch_augment(
+	pool: List[Tuple[str, Callable]],
+	transform_to_spec: Optional[Callable],
+) -> Optional[Callable]:
+	"""
+		Compose a batched augment pool (see get_batch_pool) with an optional batched transform to spectrogram.
+		The augment pool will be merged with a BatchRandomChoice(), which choose an augment for each item of the batch.
+
+		If transform_to_spec is None, the batches are spectrograms and the pool must only contain spectrogram augments.
+
+		:param pool: The list of possible batched augments to apply.
+		:param transform_to_spec: The optional batched transformation to spectrogram.
+		:return: The augment pool composed as a Callable object, or None if the pool is empty and transform_to_spec is None.
+	"""
+	if transform_to_spec is None and any(input_type == 'waveform' for input_type, _ in pool):
+		raise ValueError('Cannot apply the waveform augments of a batched pool to spectrograms.')
+
+	pool_with_spec = add_transform_to_spec_to_pool(pool, transform_to_spec)
+	pool_with_spec = [transform for transform in pool_with_spec if transform is not None]
+
+	if len(pool_with_spec) == 0:
+		return None
+	elif len(pool_with_spec) == 1:
+		return pool_with_spec[0]
+	else:
+		return BatchRandomChoice(*pool_with_spec)
+
+
 def add_transform_to_spec_to_pool(
 	pool: List[Tuple[str, Callable]],
 	transform_to_spec: Optional[Callable],
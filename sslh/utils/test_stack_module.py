@@ -4,7 +4,7 @@ import torch
 from pytorch_lightning import LightningModule
 from torch import Tensor
 from torch.nn import Module
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from mlu.nn import ForwardDictAffix
 
@@ -34,3 +34,9 @@ class TestStackModule(LightningModule):
 
 	def forward(self, *args, **kwargs):
 		return self.module(*args, **kwargs)
+
+	def on_after_batch_transfer(self, batch: Any) -> Any:
+		# The wrapped module has the batch transfer hook of the datamodule used for training (e.g. spectrograms on device)
+		if isinstance(self.module, LightningModule):
+			return self.module.on_after_batch_transfer(batch)
+		return batch
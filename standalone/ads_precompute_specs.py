@@ -0,0 +1,29 @@
+"""
+	Pre-compute the AudioSet (ADS) mel-spectrograms HDF files used with data.pre_computed_specs=true.
+"""
+import hydra
+import logging
+import os.path as osp
+
+from hydra.utils import DictConfig, OmegaConf
+
+from sslh.datasets.ads_specs import precompute_specs_ads
+
+
+@hydra.main(config_path=osp.join('..', 'config'), config_name='ads_precompute_specs')
+def main(cfg: DictConfig) -> None:
+	if cfg.verbose:
+		logging.info(f'Configuration:\n{OmegaConf.to_yaml(cfg):s}')
+
+	precompute_specs_ads(
+		src_root=cfg.src_root,
+		dst_root=cfg.dst_root,
+		versions=cfg.versions,
+		n_workers=cfg.n_workers,
+		verbose=cfg.verbose,
+		**cfg.transform,
+	)
+
+
+if __name__ == '__main__':
+	main()
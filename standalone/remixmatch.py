@@ -23,7 +23,7 @@ from sslh.expt.remixmatch import (
 )
 from sslh.metrics.get_from_name import get_metrics
 from sslh.models.get_from_name import get_model_from_name
-from sslh.transforms.get_from_name import get_transform, get_target_transform, get_self_transform
+from sslh.transforms.get_from_name import get_batch_augment, get_transform, get_target_transform, get_self_transform
 from sslh.utils.custom_logger import CustomTensorboardLogger
 from sslh.utils.get_obj_from_name import (
 	get_activation_from_name,
@@ -46,7 +46,12 @@ def main(cfg: DictConfig) -> None:
 
 	# Build transforms
 	transform_weak = get_transform(cfg.data.acronym, cfg.expt.augm_weak, **cfg.data.transform)
-	transform_strong = get_transform(cfg.data.acronym, cfg.expt.augm_strong, **cfg.data.transform)
+	# The batched strong augments are applied by the LightningModule after the collation
+	augment_strong_batch = get_batch_augment(cfg.expt.augm_strong)
+	if augment_strong_batch is None:
+		transform_strong = get_transform(cfg.data.acronym, cfg.expt.augm_strong, **cfg.data.transform)
+	else:
+		transform_strong = get_transform(cfg.data.acronym, 'identity', **cfg.data.transform)
 
 	transform_train_s = transform_weak
 	transform_train_u = ReMixMatchUnlabeledPreProcess(transform_weak, transform_strong, cfg.expt.n_augms)
@@ -84,6 +89,7 @@ def main(cfg: DictConfig) -> None:
 		train_metrics=train_metrics,
 		val_metrics=val_metrics,
 		log_on_epoch=cfg.data.log_on_epoch,
+		augment_strong_batch=augment_strong_batch,
 	)
 
 	# Transform, activation, criterion and metrics for rotation loss (self-supervised component)
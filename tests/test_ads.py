@@ -0,0 +1,228 @@
+
+import numpy as np
+import pytest
+
+from types import SimpleNamespace
+
+from sslh.datasets.ads import Audioset, ChunkLRUCache, CSRTargets, SingleBalancedSampler, batch_balancer
+
+
+def _make_chunk(n_rows: int) -> tuple:
+	return np.zeros((n_rows, 4), dtype=np.float32), np.zeros((n_rows, 527), dtype=bool)
+
+
+def test_chunk_cache_hits_and_misses():
+	cache = ChunkLRUCache(max_nbytes=1024 ** 2)
+	chunk = _make_chunk(2)
+
+	assert cache.get(('a.h5', 0)) is None
+	cache.put(('a.h5', 0), chunk)
+	assert cache.get(('a.h5', 0)) is chunk
+
+	stats = cache.get_stats()
+	assert stats['n_hits'] == 1
+	assert stats['n_misses'] == 1
+	assert stats['n_chunks'] == 1
+	assert stats['nbytes'] == sum(array.nbytes for array in chunk)
+
+
+def test_chunk_cache_evicts_least_recently_used():
+	chunk_nbytes = sum(array.nbytes for array in _make_chunk(2))
+	cache = ChunkLRUCache(max_nbytes=2 * chunk_nbytes)
+
+	cache.put(('a.h5', 0), _make_chunk(2))
+	cache.put(('a.h5', 1), _make_chunk(2))
+	# The chunk 0 becomes the most recently used, so the chunk 1 is evicted
+	cache.get(('a.h5', 0))
+	cache.put(('a.h5', 2), _make_chunk(2))
+
+	assert ('a.h5', 0) in cache
+	assert ('a.h5', 1) not in cache
+	assert ('a.h5', 2) in cache
+	assert cache.nbytes == 2 * chunk_nbytes
+
+
+def test_chunk_cache_replace_and_oversized():
+	chunk_nbytes = sum(array.nbytes for array in _make_chunk(2))
+	cache = ChunkLRUCache(max_nbytes=chunk_nbytes)
+
+	cache.put(('a.h5', 0), _make_chunk(2))
+	cache.put(('a.h5', 0), _make_chunk(2))
+	assert len(cache) == 1
+	assert cache.nbytes == chunk_nbytes
+
+	# A chunk bigger than the budget is not stored and does not evict the others
+	cache.put(('a.h5', 1), _make_chunk(4))
+	assert ('a.h5', 1) not in cache
+	assert ('a.h5', 0) in cache
+
+
+def test_chunk_cache_disabled_and_invalid():
+	cache = ChunkLRUCache(max_nbytes=0)
+	cache.put(('a.h5', 0), _make_chunk(1))
+	assert len(cache) == 0
+
+	with pytest.raises(ValueError):
+		ChunkLRUCache(max_nbytes=-1)
+
+
+def _locate_reference(n_rows: list, sample_idx: int) -> tuple:
+	# Previous implementation : linear scan of the files
+	for hdf_idx, n_row in enumerate(n_rows):
+		if sample_idx < n_row:
+			return hdf_idx, sample_idx
+		sample_idx -= n_row
+	raise IndexError(sample_idx)
+
+
+def test_locate_matches_linear_scan():
+	n_rows = [96, 0, 32, 160]
+	dataset = SimpleNamespace(hdf_row_offsets=np.concatenate(([0], np.cumsum(n_rows))).astype(np.int64))
+	indices = np.arange(sum(n_rows))
+
+	hdf_indexes, local_rows = Audioset.locate(dataset, indices)
+	expected = np.asarray([_locate_reference(n_rows, idx) for idx in indices])
+
+	np.testing.assert_array_equal(hdf_indexes, expected[:, 0])
+	np.testing.assert_array_equal(local_rows, expected[:, 1])
+
+
+def test_locate_out_of_range():
+	dataset = SimpleNamespace(hdf_row_offsets=np.asarray([0, 10, 20], dtype=np.int64))
+
+	with pytest.raises(IndexError):
+		Audioset.locate(dataset, [20])
+	with pytest.raises(IndexError):
+		Audioset.locate(dataset, [-1])
+
+
+def _round_robin_reference(targets: np.ndarray, index_list: np.ndarray, n_samples: int) -> list:
+	# Previous per-item implementation without shuffle, with one round counter per class
+	class_indexes = [[] for _ in range(targets.shape[1])]
+	for sample_idx, target in zip(index_list, targets[index_list]):
+		for class_idx in np.where(target)[0]:
+			class_indexes[class_idx].append(sample_idx)
+
+	class_indexes = [indexes for indexes in class_indexes if len(indexes) > 0]
+	n_classes = len(class_indexes)
+	return [class_indexes[k % n_classes][(k // n_classes) % len(class_indexes[k % n_classes])] for k in range(n_samples)]
+
+
+def _make_multilabel_targets(n_samples: int, seed: int) -> np.ndarray:
+	generator = np.random.RandomState(seed)
+	targets = generator.random_sample((n_samples, Audioset.N_CLASSES)) < 0.01
+	# A few empty classes and a dominant class, like AudioSet
+	targets[:, :10] = False
+	targets[:, 10] = generator.random_sample(n_samples) < 0.5
+	return targets
+
+
+@pytest.mark.parametrize('csr', [False, True])
+def test_single_balanced_sampler_matches_round_robin(csr: bool):
+	targets = _make_multilabel_targets(300, seed=0)
+	index_list = np.random.RandomState(1).permutation(300)[:200]
+	all_targets = CSRTargets.from_dense(targets) if csr else targets
+	dataset = SimpleNamespace(get_all_targets=lambda: all_targets)
+
+	sampler = SingleBalancedSampler(dataset, index_list, n_max_iterations=1000, shuffle=False)
+	indexes = list(sampler)
+
+	assert len(indexes) == len(sampler) == 1000
+	assert indexes == _round_robin_reference(targets, index_list, 1000)
+
+
+def test_single_balanced_sampler_shuffle_visits_each_class_once_per_round():
+	targets = _make_multilabel_targets(300, seed=0)
+	index_list = np.arange(300)
+	dataset = SimpleNamespace(get_all_targets=lambda: targets)
+	non_empty = np.where(targets.any(axis=0))[0]
+
+	np.random.seed(1234)
+	sampler = SingleBalancedSampler(dataset, index_list, n_max_iterations=3 * len(non_empty), shuffle=True)
+	indexes = np.asarray(list(sampler)).reshape(3, len(non_empty))
+
+	for round_indexes in indexes:
+		assert np.all(np.isin(round_indexes, index_list))
+		# Each step of a round picks a sample of a different class, so all the classes are covered
+		assert np.all(targets[round_indexes][:, non_empty].any(axis=0))
+
+
+def _batch_balancer_reference(pool_size: int, repeat: int):
+	# Previous implementation, with the pool stored in Python lists
+	def balance(data: list):
+		def get_first_neg(idx):
+			for i in range(len(balance.pool_y)):
+				if balance.pool_y[i][idx] == 0:
+					return i
+			return None
+
+		x = np.asarray([d[0] for d in data])
+		y = np.asarray([d[1] for d in data])
+
+		# The rows are copied, the previous pool kept views of the batch which changed with its replacements
+		if len(balance.pool_y) < pool_size:
+			balance.pool_x.extend(x.copy())
+			balance.pool_y.extend(y.copy())
+
+		for _ in range(repeat):
+			class_idx = np.argmax(np.sum(y, axis=0))
+			to_remove = np.where(y[:, class_idx] == 1)[0]
+
+			if len(to_remove != 0):
+				to_remove = np.random.choice(to_remove)
+				pool_idx = get_first_neg(class_idx)
+				if pool_idx is not None:
+					x[to_remove] = balance.pool_x.pop(pool_idx)
+					y[to_remove] = balance.pool_y.pop(pool_idx)
+
+		return x, y
+
+	balance.pool_x = []
+	balance.pool_y = []
+	return balance
+
+
+def test_batch_balancer_matches_reference():
+	generator = np.random.RandomState(0)
+	balancer = batch_balancer(pool_size=100, batch_size=32)
+	reference = _batch_balancer_reference(pool_size=100, repeat=28)
+
+	for batch_idx in range(10):
+		xs = generator.random_sample((32, 8)).astype(np.float32)
+		ys = (generator.random_sample((32, 20)) < 0.1).astype(np.float32)
+		ys[:, 0] = generator.random_sample(32) < 0.7
+		data = list(zip(xs, ys))
+
+		# The reference draws numbers after the last possible replacement, so each batch is seeded
+		np.random.seed(batch_idx)
+		x, y = balancer(data)
+		np.random.seed(batch_idx)
+		expected_x, expected_y = reference(data)
+
+		np.testing.assert_array_equal(x.numpy(), expected_x)
+		np.testing.assert_array_equal(y.numpy(), expected_y)
+
+
+def test_csr_targets_indexing_matches_dense(tmp_path):
+	targets = _make_multilabel_targets(100, seed=2)
+	csr = CSRTargets.from_dense(targets, n_rows_per_step=7)
+
+	assert csr.shape == targets.shape
+	np.testing.assert_array_equal(csr.to_dense(), targets)
+	np.testing.assert_array_equal(csr[5], targets[5])
+	np.testing.assert_array_equal(csr[-1], targets[-1])
+	np.testing.assert_array_equal(csr[10:30:3], targets[10:30:3])
+	np.testing.assert_array_equal(csr[[4, 4, -2, 0]], targets[[4, 4, -2, 0]])
+
+	rows = np.asarray([3, 50, 3])
+	batch_rows, classes = csr.nonzero(rows)
+	expected_rows, expected_classes = np.nonzero(targets[rows])
+	np.testing.assert_array_equal(batch_rows, expected_rows)
+	np.testing.assert_array_equal(classes, expected_classes)
+
+	path = str(tmp_path / 'targets_csr.npz')
+	csr.save(path)
+	np.testing.assert_array_equal(CSRTargets.load(path).to_dense(), targets)
+
+	with pytest.raises(IndexError):
+		_ = csr[100]
@@ -0,0 +1,53 @@
+
+import numpy as np
+import os
+
+from sslh.datamodules.utils import load_or_compute_split
+
+
+def _random_split():
+	indexes = np.random.permutation(100)
+	return indexes[:10], indexes[10:]
+
+
+def test_load_or_compute_split_caches_the_split(tmp_path):
+	kwargs = dict(cache_dir=str(tmp_path), fingerprint='dataset', subset='train', ratio_s=0.1, ratio_u=0.9, seed=1234)
+	indexes_s, indexes_u = load_or_compute_split(_random_split, **kwargs)
+	assert len(os.listdir(tmp_path)) == 1
+
+	def fail():
+		raise AssertionError('The split should be loaded from the cache.')
+
+	cached_s, cached_u = load_or_compute_split(fail, **kwargs)
+	np.testing.assert_array_equal(cached_s, indexes_s)
+	np.testing.assert_array_equal(cached_u, indexes_u)
+
+	# Another seed is another split file
+	load_or_compute_split(_random_split, **{**kwargs, 'seed': 1})
+	assert len(os.listdir(tmp_path)) == 2
+
+
+def test_load_or_compute_split_is_seeded_and_restores_the_rng(tmp_path):
+	kwargs = dict(fingerprint='dataset', subset='train', ratio_s=0.1, ratio_u=0.9, seed=1234)
+
+	np.random.seed(0)
+	indexes_s, _ = load_or_compute_split(_random_split, cache_dir=None, **kwargs)
+	after_compute = np.random.random_sample()
+
+	np.random.seed(0)
+	cached_s, _ = load_or_compute_split(_random_split, cache_dir=str(tmp_path), **kwargs)
+	np.random.seed(0)
+	loaded_s, _ = load_or_compute_split(_random_split, cache_dir=str(tmp_path), **kwargs)
+	after_load = np.random.random_sample()
+
+	np.testing.assert_array_equal(cached_s, indexes_s)
+	np.testing.assert_array_equal(loaded_s, indexes_s)
+	# The rest of the training draws the same numbers whether the split was cached or not
+	assert after_compute == after_load
+
+
+def test_load_or_compute_split_without_seed_is_not_cached(tmp_path):
+	load_or_compute_split(
+		_random_split, cache_dir=str(tmp_path), fingerprint='dataset', subset='train', ratio_s=0.1, ratio_u=0.9, seed=None
+	)
+	assert len(os.listdir(tmp_path)) == 0
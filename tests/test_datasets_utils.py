@@ -0,0 +1,112 @@
+
+import numpy as np
+import pytest
+import torch
+
+from sslh.datasets.utils import SharedFeatureCache, greedy_multilabel_split, greedy_multilabel_split_csr
+
+
+def _fill_subset_reference(targets: np.ndarray, expected: np.ndarray) -> np.ndarray:
+	# Previous per-item implementation of class_balance_split, which pops the samples from a list.
+	# The index is not incremented after a pop, the previous loop skipped the sample following each one taken.
+	remaining_samples = list(zip(targets, range(len(targets))))
+	subset_occur = np.zeros(targets.shape[1])
+	subset = []
+
+	for class_idx in range(targets.shape[1]):
+		idx = 0
+		while idx < len(remaining_samples) and subset_occur[class_idx] < expected[class_idx]:
+			if remaining_samples[idx][0][class_idx] == 1:
+				target, target_idx = remaining_samples.pop(idx)
+				subset_occur += target
+				subset.append(target_idx)
+			else:
+				idx += 1
+
+	selected = np.zeros(len(targets), dtype=bool)
+	selected[subset] = True
+	return selected
+
+
+def _make_multilabel_targets(n_samples: int, n_classes: int, seed: int) -> np.ndarray:
+	generator = np.random.RandomState(seed)
+	return generator.random_sample((n_samples, n_classes)) < generator.random_sample(n_classes) * 0.3
+
+
+def _to_csr(targets: np.ndarray) -> tuple:
+	rows, classes = np.nonzero(targets)
+	indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(targets))))).astype(np.int64)
+	return indptr, classes
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_greedy_multilabel_split_matches_reference(seed: int):
+	targets = _make_multilabel_targets(400, 20, seed)
+	expected = np.ceil(targets.sum(axis=0) * 0.1)
+
+	selected = greedy_multilabel_split(targets, expected)
+
+	np.testing.assert_array_equal(selected, _fill_subset_reference(targets.astype(np.int64), expected))
+	assert np.all(targets[selected].sum(axis=0) >= expected)
+
+
+@pytest.mark.parametrize('seed', [None, 1234])
+def test_greedy_multilabel_split_csr_matches_dense(seed):
+	targets = _make_multilabel_targets(400, 20, seed=3)
+	expected = np.ceil(targets.sum(axis=0) * 0.2)
+	available = np.random.RandomState(4).random_sample(400) < 0.8
+	indptr, indices = _to_csr(targets)
+
+	dense = greedy_multilabel_split(targets, expected, available, seed=seed)
+	csr = greedy_multilabel_split_csr(indptr, indices.astype(np.int16), targets.shape[1], expected, available, seed=seed)
+
+	np.testing.assert_array_equal(csr, dense)
+	assert not np.any(csr & ~available)
+
+
+def test_shared_feature_cache_round_trip():
+	cache = SharedFeatureCache(max_nbytes=16 * 1024, block_nbytes=1024)
+	tensor = torch.arange(600, dtype=torch.float32).reshape(2, 300)
+	array = np.arange(10, dtype=np.int16)
+
+	cache.put(0, tensor)
+	cache.put(1, array)
+
+	cached = cache.get(0)
+	assert isinstance(cached, torch.Tensor)
+	assert torch.equal(cached, tensor)
+	np.testing.assert_array_equal(cache.get(1), array)
+	assert cache.get(2) is None
+
+	stats = cache.get_stats()
+	assert (stats['n_hits'], stats['n_misses'], stats['n_entries']) == (2, 1, 2)
+	# The tensor uses 3 blocks and the array 1 block
+	assert stats['nbytes'] == 4 * 1024
+
+
+def test_shared_feature_cache_evicts_least_recently_used():
+	cache = SharedFeatureCache(max_nbytes=4 * 1024, block_nbytes=1024)
+	entry = np.zeros(256, dtype=np.float32)
+
+	for key in range(4):
+		cache.put(key, entry + key)
+	# The entry 0 becomes the most recently used, the entry 1 is the least recently used
+	cache.get(0)
+	cache.put(4, entry + 4)
+
+	np.testing.assert_array_equal(np.sort(cache.keys()), [0, 2, 3, 4])
+	np.testing.assert_array_equal(cache.get(4), entry + 4)
+
+	# An entry of 2 blocks evicts the two least recently used entries
+	cache.put(5, np.zeros(512, dtype=np.float32))
+	np.testing.assert_array_equal(np.sort(cache.keys()), [0, 4, 5])
+
+
+def test_shared_feature_cache_ignores_unsupported_values():
+	cache = SharedFeatureCache(max_nbytes=4 * 1024, block_nbytes=1024)
+
+	cache.put(0, np.zeros(2048, dtype=np.float32))
+	cache.put(1, np.zeros(4, dtype=np.complex64))
+	cache.put(2, np.zeros((1, 1, 1, 1, 1), dtype=np.float32))
+
+	assert len(cache.keys()) == 0
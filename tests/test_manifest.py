@@ -0,0 +1,93 @@
+
+import numpy as np
+import os
+import pytest
+
+from sslh.datasets.manifest import (
+	get_manifest_path,
+	load_or_build_manifest,
+	verify_manifest_files,
+	verify_or_remove_manifest,
+)
+
+
+class _CountingBuild:
+	def __init__(self, root: str):
+		self.root = root
+		self.n_calls = 0
+
+	def __call__(self) -> dict:
+		self.n_calls += 1
+		paths = sorted(os.listdir(os.path.join(self.root, 'audio')))
+		return {'paths': np.asarray([os.path.join('audio', path) for path in paths])}
+
+
+@pytest.fixture
+def root(tmp_path) -> str:
+	os.makedirs(tmp_path / 'audio')
+	for name in ('a.wav', 'b.wav'):
+		(tmp_path / 'audio' / name).write_bytes(name.encode() * 10)
+	return str(tmp_path)
+
+
+def _load(root: str, build_fn: _CountingBuild, checksums: bool = False) -> dict:
+	return load_or_build_manifest(root, 'files', [os.path.join(root, 'audio')], build_fn, checksums=checksums, n_workers=2)
+
+
+def test_manifest_is_loaded_while_the_watched_paths_do_not_change(root):
+	build_fn = _CountingBuild(root)
+	manifest = _load(root, build_fn)
+	assert build_fn.n_calls == 1
+	assert os.path.isfile(get_manifest_path(root, 'files'))
+	np.testing.assert_array_equal(manifest['sizes'], [50, 50])
+
+	reloaded = _load(root, build_fn)
+	assert build_fn.n_calls == 1
+	np.testing.assert_array_equal(reloaded['paths'], manifest['paths'])
+
+	# A new file modifies the watched directory
+	with open(os.path.join(root, 'audio', 'c.wav'), 'wb') as file:
+		file.write(b'c')
+	os.utime(os.path.join(root, 'audio'), ns=(0, 1))
+	rebuilt = _load(root, build_fn)
+	assert build_fn.n_calls == 2
+	assert len(rebuilt['paths']) == 3
+
+
+def test_manifest_is_rebuilt_when_checksums_are_missing(root):
+	build_fn = _CountingBuild(root)
+	manifest = _load(root, build_fn)
+	assert 'md5' not in manifest
+
+	with pytest.raises(ValueError):
+		verify_manifest_files(root, manifest, checksum=True)
+
+	manifest = _load(root, build_fn, checksums=True)
+	assert build_fn.n_calls == 2
+	assert len(manifest['md5']) == 2
+	assert verify_manifest_files(root, manifest, checksum=True)
+
+
+def test_verify_or_remove_manifest_removes_stale_manifest(root):
+	build_fn = _CountingBuild(root)
+	_load(root, build_fn, checksums=True)
+	assert verify_or_remove_manifest(root, 'files', checksum=True)
+
+	# Same size and same directory, only the content changed
+	with open(os.path.join(root, 'audio', 'a.wav'), 'wb') as file:
+		file.write(b'x' * 50)
+	assert not verify_or_remove_manifest(root, 'files', checksum=True)
+	assert not os.path.isfile(get_manifest_path(root, 'files'))
+
+	_load(root, build_fn, checksums=True)
+	assert build_fn.n_calls == 2
+	assert verify_or_remove_manifest(root, 'files', checksum=True)
+
+
+def test_verify_or_remove_manifest_without_checksums(root):
+	build_fn = _CountingBuild(root)
+	_load(root, build_fn)
+
+	# A manifest without checksums cannot be verified with checksum=True, it is removed to be rebuilt with them
+	assert not verify_or_remove_manifest(root, 'files', checksum=True)
+	assert not os.path.isfile(get_manifest_path(root, 'files'))
@@ -0,0 +1,34 @@
+
+import numpy as np
+
+from types import SimpleNamespace
+
+from sslh.datasets.pvc import IterationBalancedSampler
+from sslh.datasets.pvc_base import COMPARE2021PRSBase
+
+
+def _round_robin_reference(targets: np.ndarray, index_list: np.ndarray, n_samples: int) -> list:
+	# Previous per-item implementation without shuffle, with one round counter per class
+	class_indexes = [[] for _ in range(len(COMPARE2021PRSBase.CLASSES))]
+	for sample_idx, target in zip(index_list, targets[index_list]):
+		if target >= 0:
+			class_indexes[target].append(sample_idx)
+
+	class_indexes = [indexes for indexes in class_indexes if len(indexes) > 0]
+	n_classes = len(class_indexes)
+	return [class_indexes[k % n_classes][(k // n_classes) % len(class_indexes[k % n_classes])] for k in range(n_samples)]
+
+
+def test_iteration_balanced_sampler_matches_round_robin():
+	generator = np.random.RandomState(0)
+	# The unknown targets are encoded -1
+	targets = generator.randint(-1, len(COMPARE2021PRSBase.CLASSES), size=500)
+	index_list = generator.permutation(500)[:300]
+	dataset = SimpleNamespace(targets=targets)
+
+	sampler = IterationBalancedSampler(dataset, index_list, n_max_samples=1000, shuffle=False)
+	indexes = list(sampler)
+
+	assert len(indexes) == len(sampler) == 1000
+	assert indexes == _round_robin_reference(targets, index_list, 1000)
+	assert np.all(targets[indexes] >= 0)
@@ -0,0 +1,69 @@
+
+import torch
+
+from torch import Tensor
+from torch.nn.functional import one_hot
+from typing import Callable, List, Tuple
+
+from mlu.transforms import Compose, Identity
+from mlu.transforms.image.tensor import Rotation
+from mlu.transforms.spectrogram import HorizontalFlip, VerticalFlip
+from sslh.transforms.self_transforms.audio import get_self_transform_flips
+from sslh.transforms.self_transforms.image import get_self_transform_rotations
+
+
+def _per_item_reference(transforms: List[Callable]) -> Callable:
+	# Previous implementation, which applies the transform of each item in a Python loop
+	def generate(x: Tensor) -> Tuple[Tensor, Tensor]:
+		bsize = len(x)
+		class_idx = torch.randint(low=0, high=len(transforms), size=(bsize,))
+
+		xr = torch.empty_like(x)
+		for i, item in enumerate(x):
+			transform = transforms[class_idx[i]]
+			xr[i] = transform(item)
+
+		yr = one_hot(class_idx, len(transforms)).to(device=x.device, dtype=x.dtype)
+		return xr, yr
+
+	return generate
+
+
+def _check_same_outputs(transform: Callable, reference: Callable, x: Tensor, atol: float = 0.0):
+	torch.manual_seed(1234)
+	xr, yr = transform(x)
+	torch.manual_seed(1234)
+	expected_xr, expected_yr = reference(x)
+
+	assert xr.shape == x.shape
+	assert torch.allclose(xr, expected_xr, rtol=0.0, atol=atol)
+	assert torch.equal(yr, expected_yr)
+
+
+def test_flips_match_per_item_reference():
+	reference = _per_item_reference([
+		Identity(),
+		HorizontalFlip(),
+		VerticalFlip(),
+		Compose(HorizontalFlip(), VerticalFlip()),
+	])
+	x = torch.rand(32, 1, 64, 101)
+
+	_check_same_outputs(get_self_transform_flips(), reference, x)
+
+
+def test_rotations_match_per_item_reference():
+	reference = _per_item_reference([Rotation(degrees=angle) for angle in [0.0, 90, 180, 270]])
+	x = torch.rand(32, 3, 16, 16)
+
+	# The previous rotations were interpolated, the quarter turns are exact
+	_check_same_outputs(get_self_transform_rotations(), reference, x, atol=1e-5)
+
+
+def test_flips_keep_the_input():
+	x = torch.rand(8, 1, 4, 5)
+	x_copy = x.clone()
+	xr, yr = get_self_transform_flips()(x)
+
+	assert torch.equal(x, x_copy)
+	assert torch.equal(yr.sum(dim=1), torch.ones(8))
@@ -0,0 +1,79 @@
+
+import numpy as np
+import pytest
+import torch
+
+from torch.utils.data.dataloader import DataLoader
+from torch.utils.data.dataset import Dataset
+from torch.utils.data.sampler import RandomSampler, SequentialSampler
+
+from sslh.datasets.wrappers import CachedBatchDataset, PrefetchDataset
+
+
+class _IndexDataset(Dataset):
+	def __init__(self, length: int):
+		super().__init__()
+		self.length = length
+
+	def __getitem__(self, idx: int):
+		# Random augment drawn by the loading threads, it must not change the sampler order
+		noise = np.random.random_sample() + torch.rand(1).item()
+		return idx, noise
+
+	def __len__(self) -> int:
+		return self.length
+
+
+def _get_indexes(loader: DataLoader) -> list:
+	return [int(idx) for indexes, _ in loader for idx in indexes]
+
+
+@pytest.mark.parametrize('num_workers', [0, 1, 3])
+def test_prefetch_dataset_keeps_the_sampler_order(num_workers: int):
+	dataset = _IndexDataset(50)
+	sampler = SequentialSampler(dataset)
+	prefetch = PrefetchDataset(dataset, sampler, batch_size=4, depth=5, n_threads=2)
+	loader = DataLoader(prefetch, batch_size=4, num_workers=num_workers)
+
+	assert _get_indexes(loader) == list(sampler)
+
+
+@pytest.mark.parametrize('num_workers', [2, 3])
+def test_prefetch_dataset_workers_draw_the_same_random_order(num_workers: int):
+	dataset = _IndexDataset(50)
+	prefetch = PrefetchDataset(dataset, RandomSampler(dataset), batch_size=4, depth=5, n_threads=2)
+	loader = DataLoader(prefetch, batch_size=4, num_workers=num_workers)
+
+	for _ in range(2):
+		indexes = _get_indexes(loader)
+		# Each worker keeps its batches of the same order, so every index is returned exactly once
+		assert sorted(indexes) == list(range(len(dataset)))
+
+
+def test_prefetch_dataset_invalid_depth():
+	dataset = _IndexDataset(10)
+	with pytest.raises(ValueError):
+		PrefetchDataset(dataset, SequentialSampler(dataset), batch_size=4, depth=0)
+
+
+def test_cached_batch_dataset_returns_consecutive_batches(tmp_path):
+	features = np.lib.format.open_memmap(str(tmp_path / 'features.npy'), mode='w+', dtype=np.float32, shape=(10, 3))
+	features[:] = np.arange(30, dtype=np.float32).reshape(10, 3)
+	targets = np.arange(10)
+	dataset = CachedBatchDataset([features, targets], batch_size=4)
+
+	assert len(dataset) == 3
+	loader = DataLoader(dataset, batch_size=None, num_workers=0)
+	batches = list(loader)
+
+	assert [len(xs) for xs, _ in batches] == [4, 4, 2]
+	np.testing.assert_array_equal(torch.cat([xs for xs, _ in batches]).numpy(), features)
+	np.testing.assert_array_equal(torch.cat([ys for _, ys in batches]).numpy(), targets)
+
+	with pytest.raises(IndexError):
+		_ = dataset[3]
+
+
+def test_cached_batch_dataset_lengths_mismatch():
+	with pytest.raises(ValueError):
+		CachedBatchDataset([np.zeros(4), np.zeros(5)], batch_size=2)